@@ -0,0 +1,51 @@
+import io
+import json
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import waybar_audit  # noqa: E402
+import waybar_to_noctalia as converter  # noqa: E402
+
+
+class AuditTests(unittest.TestCase):
+    def test_columns_and_report(self):
+        host = {
+            "custom/bat": {"exec": "bat.sh", "interval": 5, "return-type": "json"},
+            "custom/kbd": {"exec": "kbd.sh", "interval": "once"},
+        }
+        interner = converter.ModuleInterner()
+        records = [
+            record
+            for config in (json.loads(json.dumps(host)) for _ in range(3))
+            for record in converter.extract_module_records(config, 60, 2, interner)
+        ]
+        columns = waybar_audit.module_columns(records)
+        self.assertEqual(columns["exec_cmd"], ["bat.sh", "kbd.sh"] * 3)
+        self.assertEqual(columns["wrappers"][:2], ["json-format+timeout", "none"])
+        report = waybar_audit.audit_report(columns)
+        self.assertEqual(report["commands"], [("bat.sh", 3), ("kbd.sh", 3)])
+        self.assertEqual(report["intervals"], [("stream", 3), ("<=5s", 3)])
+
+    def test_main_walks_directories(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for host in ("a", "b"):
+                (Path(tmp) / host).mkdir()
+                (Path(tmp) / host / "config.jsonc").write_text(
+                    '// host\n{"custom/up": {"exec": "uptime", "interval": 30}}', encoding="utf-8"
+                )
+            out = io.StringIO()
+            with redirect_stdout(out):
+                waybar_audit.main([tmp, "--json"])
+        report = json.loads(out.getvalue())
+        self.assertEqual((report["modules"], report["sources"], report["unreadable"]), (2, 2, 0))
+        self.assertEqual(report["commands"], [["uptime", 2]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,14 @@
+import io
 import json
+import os
+import shlex
+import shutil
+import signal
+import subprocess
 import sys
+import tempfile
+import threading
+from contextlib import redirect_stderr, redirect_stdout
 from pathlib import Path
 import unittest
 
@@ -9,6 +18,17 @@ sys.path.insert(0, str(ROOT))
 import waybar_to_noctalia as converter  # noqa: E402
 
 
+def first_lines(case, command, count):
+    """Read the first lines of a never-ending shell command, then kill it."""
+    proc = subprocess.Popen(["sh", "-c", command], stdout=subprocess.PIPE, text=True, start_new_session=True)
+    case.addCleanup(proc.wait)
+    case.addCleanup(os.killpg, proc.pid, signal.SIGKILL)
+    timer = threading.Timer(5, os.killpg, (proc.pid, signal.SIGKILL))
+    timer.start()
+    case.addCleanup(timer.cancel)
+    return [proc.stdout.readline().rstrip("\n") for _ in range(count)]
+
+
 class JsoncParsingTests(unittest.TestCase):
     def test_strip_jsonc_preserves_strings(self):
         content = r'''
@@ -37,6 +57,30 @@ class JsoncParsingTests(unittest.TestCase):
         self.assertTrue(modules[0].interval_defaulted)
         self.assertEqual(modules[1].interval_mode, "once")
 
+    def test_interned_module_records(self):
+        host = {
+            "custom/bat": {"exec": "bat.sh", "interval": 5, "return-type": "json", "format-icons": ["a", "b"]},
+            "custom/kbd": {"exec": "kbd.sh", "interval": "once", "format-icons": {"us": ["u"]}},
+        }
+        interner = converter.ModuleInterner()
+        records = [
+            record
+            for config in (json.loads(json.dumps(host)) for _ in range(3))
+            for record in converter.extract_module_records(config, 60, 2, interner)
+        ]
+        self.assertIs(records[0].exec_cmd, records[2].exec_cmd)
+        self.assertIs(records[0].format_icons, records[2].format_icons)
+        self.assertEqual(records[1].format_icons["us"], ("u",))
+        with self.assertRaises(AttributeError):
+            records[0].interval = 1
+        self.assertEqual(records[1].to_module().format_icons, {"us": ["u"]})
+        shared = converter.extract_module_records(
+            {"custom/a": {"exec": "x.sh", "interval": 5}, "custom/b": {"exec": "x.sh", "interval": 5}}, 60, 2, interner
+        )
+        leader = shared[0].to_module()
+        self.assertEqual((leader.shared_role, leader.shared_consumers), ("leader", ["b"]))
+        self.assertEqual(shared[1].to_module().shared_role, "consumer")
+
     def test_signal_interval_override(self):
         config = {
             "custom/rec": {
@@ -49,6 +93,89 @@ class JsoncParsingTests(unittest.TestCase):
         self.assertEqual(modules[0].interval, 2)
         self.assertTrue(modules[0].interval_signal_override)
 
+    def test_identical_commands_share_a_runner(self):
+        config = [
+            {"custom/vol": {"exec": "vol.sh", "interval": 1}},
+            {"custom/vol": {"exec": "vol.sh", "interval": 1}},
+            {"custom/vol-icon": {"exec": "vol.sh", "interval": 1, "format": "{icon}"}},
+            {"custom/vol-slow": {"exec": "vol.sh", "interval": 5}},
+        ]
+        modules = converter.extract_custom_modules(config, 60, 2)
+        self.assertEqual([m.name for m in modules], ["vol", "vol-2", "vol-icon", "vol-slow"])
+        self.assertEqual([m.shared_role for m in modules], ["leader", "consumer", "consumer", ""])
+        self.assertEqual(modules[0].shared_consumers, ["vol-2", "vol-icon"])
+        hints = converter.build_widget_hints(modules[1])
+        self.assertEqual((hints["sharedSource"], hints["sharedRole"]), ("vol", "consumer"))
+        self.assertNotIn("sharedWith", hints)
+
+    def test_poll_to_event_rewrite(self):
+        modules = [
+            converter.WaybarModule(name="vol", source="config", exec_cmd="pamixer --get-volume", interval=2),
+            converter.WaybarModule(name="bat", source="config", exec_cmd="upower -i BAT0", interval=30),
+            converter.WaybarModule(name="temp", source="config", exec_cmd="cat /sys/class/thermal/x/temp", interval=5),
+        ]
+        rules = [
+            converter.EventRule(name="audio", match=r"^pamixer\b", events="pactl subscribe", filter="on sink"),
+            converter.EventRule(name="upower", match=r"^upower\b", events="upower --monitor", requires=["no-such-program-x"]),
+            converter.EventRule(name="any", match=".", events="inotifywait -m /tmp"),
+        ]
+        converter.rewrite_polls_to_events(modules, rules)
+        vol, bat, temp = modules
+        self.assertEqual((vol.event_rule, vol.interval_mode, vol.timeout_ms), ("audio", "once", 0))
+        self.assertEqual(vol.polled_exec, "pamixer --get-volume")
+        self.assertEqual(
+            vol.exec_cmd,
+            "{ pamixer --get-volume; } </dev/null | paste -sd ' ' -; pactl subscribe | grep --line-buffered -E 'on sink' "
+            "| while read -r _; do { pamixer --get-volume; } </dev/null | paste -sd ' ' -; done",
+        )
+        self.assertEqual(vol.restart_interval, converter.EVENT_RESTART_INTERVAL)
+        self.assertEqual(converter.forks_avoided_per_hour(vol), 1800)
+        # Required programs are checked where the plugin runs; without them it polls.
+        self.assertEqual((bat.event_rule, bat.event_requires), ("upower", ["no-such-program-x"]))
+        self.assertTrue(bat.exec_cmd.startswith("if command -v no-such-program-x >/dev/null; then "))
+        self.assertTrue(bat.exec_cmd.endswith(
+            "else while :; do { upower -i BAT0; } </dev/null | paste -sd ' ' -; sleep 30; done; fi"
+        ))
+        self.assertEqual(first_lines(self, bat.exec_cmd.replace("upower -i BAT0", "echo polled"), 1), ["polled"])
+        # File reads already run in-process and are left alone.
+        self.assertEqual((temp.event_rule, temp.interval_mode), ("", "poll"))
+
+    def test_rewritten_streams_emit_one_line_per_run(self):
+        rule = converter.EventRule(name="ticks", match=".", events="(printf 'e\\ne\\n'; sleep 30)")
+        plain = converter.WaybarModule(name="vol", source="config", exec_cmd="printf 'a\\nb\\n'", interval=5, format="{} %")
+        pretty = converter.WaybarModule(
+            name="win", source="config", exec_cmd="printf '{\\n \"text\": \"x\"\\n}\\n'", interval=5, return_type="json",
+            format="<{}>",
+        )
+        converter.rewrite_polls_to_events([plain, pretty], [rule])
+        # The widget command formats each line as it arrives instead of at EOF.
+        command = converter.transform_command(plain).command
+        self.assertEqual(first_lines(self, command, 3), ["a b %"] * 3)
+        command = converter.transform_command(pretty).command
+        self.assertEqual([json.loads(line)["text"] for line in first_lines(self, command, 3)], ["<x>"] * 3)
+
+    def test_event_rules_only_match_reads(self):
+        def rule_for(command):
+            return next((r.name for r in converter.DEFAULT_EVENT_RULES if r.pattern.search(command)), None)
+
+        for command in ("pamixer --get-volume", "pactl get-sink-volume @DEFAULT_SINK@", "playerctl metadata title",
+                        "nmcli -t -f NAME connection show --active", "hyprctl -j activewindow"):
+            self.assertIsNotNone(rule_for(command), command)
+        for command in ("pamixer -i 5", "playerctl play-pause", "nmcli radio wifi off", "playerctl -F metadata"):
+            self.assertIsNone(rule_for(command), command)
+
+    def test_timeout_derived_from_interval(self):
+        config = {
+            "custom/fast": {"exec": "echo 1", "interval": 5},
+            "custom/slow": {"exec": "echo 2", "interval": 86400},
+            "custom/stream": {"exec": "tail -f log", "interval": "once"},
+        }
+        modules = converter.extract_custom_modules(config, 60, 2)
+        self.assertEqual([m.timeout_ms for m in modules], [5000, 300000, 0])
+
+        overridden = converter.extract_custom_modules(config, 60, 2, command_timeout=0.5)
+        self.assertEqual([m.timeout_ms for m in overridden], [500, 500, 0])
+
 
 class TransformTests(unittest.TestCase):
     def test_json_wrapper_for_format_icons(self):
@@ -75,6 +202,573 @@ class TransformTests(unittest.TestCase):
         self.assertFalse(result.parse_json)
         self.assertIn("python3 -c", result.command)
 
+    def test_generated_formatters_run(self):
+        for return_type, fmt in (("json", "{icon} {}"), ("", "<{}>")):
+            module = converter.WaybarModule(
+                name="fmt", source="config", exec_cmd="echo '{\"text\":\"x\",\"percentage\":99}'",
+                return_type=return_type, format=fmt, format_icons=["a", "b"],
+            )
+            proc = subprocess.run(
+                ["sh", "-c", converter.transform_command(module).command], capture_output=True, text=True
+            )
+            self.assertEqual(proc.returncode, 0, proc.stderr)
+            expected = '{"text": "b x", "tooltip": "", "icon": "b"}' if return_type else '<{"text":"x","percentage":99}>'
+            self.assertEqual(proc.stdout, expected)
+
+    def test_probe_measures_and_recommends(self):
+        module = converter.WaybarModule(name="p", source="config", exec_cmd="sleep 0.1; printf abc", interval=0.15)
+        result = converter.probe_module(module, runs=2, timeout_s=5)
+        self.assertEqual((result.runs, result.output_bytes, result.distinct_outputs), (2, 3, 1))
+        self.assertEqual(result.exit_codes, [0, 0])
+        self.assertGreaterEqual(min(result.wall_ms), 100)
+        self.assertEqual(result.recommended_interval, 1)
+        self.assertTrue(any("close to" in note for note in result.notes))
+
+        hung = converter.WaybarModule(name="h", source="config", exec_cmd="sleep 5", interval=5)
+        self.assertEqual(converter.probe_module(hung, runs=1, timeout_s=0.2).timed_out, 1)
+        gated = converter.WaybarModule(name="g", source="config", exec_cmd="true", exec_if="false", interval=5)
+        self.assertEqual(converter.probe_module(gated).skipped, "exec-if failed (exit 1)")
+
+    def test_probe_runs_without_environment_or_home(self):
+        os.environ["WAYBAR_PROBE_SECRET"] = "leak"
+        self.addCleanup(os.environ.pop, "WAYBAR_PROBE_SECRET")
+        command = 'echo "${WAYBAR_PROBE_SECRET:-unset}"; stat -c %a "$HOME"; test "$HOME" = "$PWD" && echo cwd'
+        _, _, output, code = converter.run_probe_command(command, 5, sandbox="env")
+        self.assertEqual((output.decode().split(), code), (["unset", "500", "cwd"], 0))
+        _, _, output, _ = converter.run_probe_command(command, 5, sandbox="none")
+        self.assertEqual(output.decode().split()[0], "leak")
+        self.assertEqual(converter.probe_sandbox_argv("none", "/h"), [])
+        self.assertEqual(converter.probe_sandbox_argv("bwrap", "/h")[:4], ["bwrap", "--ro-bind", "/", "/"])
+        self.assertIn("--unshare-net", converter.probe_sandbox_argv("bwrap", "/h"))
+
+    def test_split_simple_command(self):
+        self.assertEqual(
+            converter.split_simple_command("notify-send 'Hi there' \"a b\""),
+            ["notify-send", "Hi there", "a b"],
+        )
+        for command in (
+            "checkupdates | wc -l",
+            "cat /sys/class/backlight/*/brightness",
+            "echo $HOME",
+            'echo "$(date)"',
+            "FOO=1 script.sh",
+            "cd /tmp",
+            "a && b",
+            "cmd > /dev/null",
+            "",
+        ):
+            with self.subTest(command=command):
+                self.assertIsNone(converter.split_simple_command(command))
+        self.assertEqual(converter.split_simple_command("echo '$HOME'"), ["echo", "$HOME"])
+
+    def test_recognize_pseudo_file_reads(self):
+        spec, _ = converter.recognize_file_read("awk -F: '{print $2, $1}' /proc/cpuinfo")
+        self.assertEqual(spec.to_dict(), {
+            "path": "/proc/cpuinfo", "op": "awk", "fields": [2, 1], "separator": ":",
+        })
+        spec, _ = converter.recognize_file_read("head -n 1 /proc/loadavg")
+        self.assertEqual((spec.op, spec.lines), ("head", 1))
+        spec, warnings = converter.recognize_file_read("cat /proc/loadav?")
+        self.assertEqual(spec.path, "/proc/loadavg")
+        self.assertTrue(warnings)
+        for command in ("cat /etc/hostname", "cat /proc/loadavg | cut -f1", "cat /proc/a /proc/b"):
+            with self.subTest(command=command):
+                self.assertIsNone(converter.recognize_file_read(command)[0])
+
+        module = converter.WaybarModule(
+            name="bat", source="config", exec_cmd="cat /sys/class/power_supply/BAT0/capacity",
+            format="{}%",
+        )
+        result = converter.transform_command(module)
+        self.assertEqual(result.file_read.path, "/sys/class/power_supply/BAT0/capacity")
+
+    def test_stream_restart_policy(self):
+        module = converter.WaybarModule(
+            name="mpris", source="config", exec_cmd="mpris-follow", interval_mode="once", restart_interval=2,
+        )
+        policy = converter.RestartPolicy(max_delay_ms=30000, healthy_ms=10000, max_failures=5)
+        widget, warnings = converter.convert_module_to_widget(module, 60, policy)
+        self.assertTrue(widget.textStream)
+        self.assertIn("{ mpris-follow; }", widget.textCommand)
+        self.assertIn("if [ $rc -eq 0 ] || [ $(( $(date +%s) - t )) -ge 10 ]; then n=0", widget.textCommand)
+        self.assertIn("if [ $n -ge 5 ]", widget.textCommand)
+        self.assertIn("if (d > 30) d = 30", widget.textCommand)
+        self.assertTrue(any("restart-interval" in w for w in warnings))
+
+        defaults = converter.build_plugin_defaults(module, 60, restart=policy)
+        self.assertEqual(
+            (defaults["restartIntervalMs"], defaults["restartBackoffMaxMs"], defaults["restartMaxFailures"]),
+            (2000, 30000, 5),
+        )
+        main_qml = converter.render_main_qml(defaults, '"waybar-mpris"', converter.plugin_features(defaults))
+        self.assertIn("root.scheduleRestart(exitCode, exitStatus)", main_qml)
+        self.assertIn("circuitOpen = true", main_qml)
+
+    def test_restart_loop_counts_only_failed_exits(self):
+        policy = converter.RestartPolicy(max_delay_ms=500, healthy_ms=30000, max_failures=2)
+        clean = converter.build_restart_wrapper("echo run; true", 0, policy, "clean", False)
+        self.assertEqual(first_lines(self, clean, 4), ["run"] * 4)
+        failing = converter.build_restart_wrapper("echo run; false", 0, policy, "failing", False)
+        result = subprocess.run(["sh", "-c", failing], capture_output=True, text=True, timeout=10)
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(result.stdout.splitlines(), ["run", "run", "\u26a0 failing: stopped after 2 failed restarts"])
+
+    def test_widget_command_wrapped_in_timeout(self):
+        module = converter.WaybarModule(
+            name="foo", source="config", exec_cmd="echo 123", timeout_ms=2500
+        )
+        widget, _ = converter.convert_module_to_widget(module, 60)
+        self.assertEqual(widget.textCommand, "timeout -k 1 2.5 echo 123")
+        module.exec_cmd = "echo 123 | tr 1 2"
+        widget, _ = converter.convert_module_to_widget(module, 60)
+        self.assertEqual(widget.textCommand, "timeout -k 1 2.5 sh -c 'echo 123 | tr 1 2'")
+
+
+class WidgetOutputTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.out = Path(tmp.name)
+
+    def test_stream_writer_matches_json_dump(self):
+        values = [{"a": [1, {"b": "\u00e9"}]}, [], "x"]
+        for indent in (2, None):
+            path = self.out / "array.json"
+            with converter.JsonStreamWriter(path, indent, always=True) as writer:
+                for value in values:
+                    writer.add(value)
+            separators = converter.json_separators(indent)
+            self.assertEqual(path.read_text(), json.dumps(values, indent=indent, separators=separators))
+        with converter.JsonStreamWriter(self.out / "empty.json", mapping=True) as writer:
+            self.assertFalse(writer.close())
+        self.assertFalse((self.out / "empty.json").exists())
+
+    def test_widgets_streamed_from_generator(self):
+        modules = (
+            converter.WaybarModule(name=f"m{i}", source="config", exec_cmd=f"echo {i}", interval=5)
+            for i in range(50)
+        )
+        with redirect_stdout(io.StringIO()):
+            converter.generate_widget_configs(modules, self.out, 60, compact=True)
+        text = (self.out / "custom_widgets.json").read_text()
+        self.assertNotIn("\n", text)
+        widgets = json.loads(text)["widgets"]
+        self.assertEqual(len(widgets), 50)
+        self.assertEqual(json.loads((self.out / "widgets" / "m49.json").read_text()), widgets[49])
+
+    def test_profile_records_phases_and_writes(self):
+        args = converter.build_arg_parser().parse_args(["--mode", "both", "--battery-scale", "2"])
+        config = {"custom/vpn": {"exec": "vpn-status", "interval": 5}}
+        calls = []
+        original = converter._transform_command
+
+        def counting(module, limits):
+            calls.append(limits is not None)
+            return original(module, limits)
+
+        converter._transform_command = counting
+        self.addCleanup(setattr, converter, "_transform_command", original)
+        profiler = converter.ConversionProfiler()
+        profiler.start()
+        try:
+            with redirect_stdout(io.StringIO()):
+                converter.convert_config(config, self.out, args, profiler)
+        finally:
+            profiler.stop()
+        report = profiler.to_dict()
+        phases = {phase["name"]: phase for phase in report["phases"]}
+        self.assertEqual(list(phases), ["extract", "transform", "widgets", "plugins"])
+        # One real transform per variant (widgets with limits, plugins without), reused by the generators.
+        self.assertEqual(sorted(calls), [False, True])
+        self.assertEqual(phases["extract"]["filesWritten"], 0)
+
+        def sizes(paths):
+            files = [path for path in paths if path.is_file()]
+            return len(files), sum(path.stat().st_size for path in files)
+
+        plugin_files = list((self.out / "plugins").rglob("*"))
+        widget_files = [path for path in self.out.rglob("*") if "plugins" not in path.relative_to(self.out).parts]
+        self.assertEqual((phases["widgets"]["filesWritten"], phases["widgets"]["bytesWritten"]), sizes(widget_files))
+        self.assertEqual((phases["plugins"]["filesWritten"], phases["plugins"]["bytesWritten"]), sizes(plugin_files))
+        self.assertIn("plugins", profiler.summary())
+
+
+class BuiltinModuleTests(unittest.TestCase):
+    CONFIG = {
+        "modules-left": ["custom/foo", "clock"],
+        "modules-right": ["cpu", "battery#bat2", "pulseaudio"],
+        "clock": {"format": "{:L%A %H:%M}", "format-alt": "{:%d %B W%V %Y}"},
+        "battery#bat2": {"bat": "BAT2", "states": {"warning": 30, "critical": 15},
+                         "format-charging": "{capacity}% C", "interval": 5},
+        "custom/foo": {"exec": "echo 1"},
+    }
+
+    def test_extract_builtin_modules(self):
+        modules = converter.extract_builtin_modules(self.CONFIG)
+        self.assertEqual([m.name for m in modules], ["clock", "cpu", "battery-bat2", "pulseaudio"])
+        cpu, battery = modules[1], modules[2]
+        self.assertEqual((cpu.interval, cpu.format), (10, "{usage}%"))
+        self.assertEqual(battery.interval, 5)
+        self.assertEqual(battery.formats, {"charging": "{capacity}% C"})
+        self.assertEqual(battery.options, {"bat": "BAT2"})
+
+    def test_non_object_states_are_ignored_with_warning(self):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            modules = converter.extract_builtin_modules({"modules-right": ["battery"], "battery": {"states": []}})
+        self.assertEqual(modules[0].states, {})
+        self.assertIn('battery: "states" must be an object', stderr.getvalue())
+
+    def test_strftime_to_qt(self):
+        self.assertEqual(converter.strftime_to_qt("L%A %H:%M"), ("dddd' 'HH':'mm", []))
+        self.assertEqual(converter.strftime_to_qt("%d W%V %Y"), ("dd' W 'yyyy", ["%V"]))
+
+    def test_clock_plugin_settings(self):
+        clock = converter.extract_builtin_modules(self.CONFIG)[0]
+        settings, warnings = converter.build_builtin_settings(clock)
+        self.assertEqual(settings["format"], "{clock0}")
+        self.assertEqual(settings["formatAlt"], "{clock1}")
+        self.assertEqual(settings["clockFormats"]["clock0"], "dddd' 'HH':'mm")
+        self.assertEqual(clock.format, "{:L%A %H:%M}")
+        self.assertTrue(any("%V" in w for w in warnings))
+
+    def test_native_widgets(self):
+        widgets = [converter.convert_builtin_to_widget(m)[0]
+                   for m in converter.extract_builtin_modules(self.CONFIG)]
+        self.assertEqual([w["type"] for w in widgets], ["Clock", "SystemMonitor", "Battery", "Volume"])
+        self.assertEqual(widgets[2]["warningThreshold"], 30)
+
+    def test_builtin_plugins_spawn_no_processes(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for module in converter.extract_builtin_modules(self.CONFIG):
+            with redirect_stdout(io.StringIO()):
+                converter.generate_builtin_plugin(module, Path(tmp.name))
+            main_qml = (Path(tmp.name) / "plugins" / f"waybar-{module.name}" / "Main.qml").read_text()
+            self.assertNotIn("Process", main_qml)
+
+
+class PluginScaffoldTests(unittest.TestCase):
+    def generate(self, module, **kwargs):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with redirect_stdout(io.StringIO()):
+            converter.generate_plugin_scaffold(module, Path(tmp.name), 60, **kwargs)
+        return Path(tmp.name) / "plugins" / f"waybar-{module.name}"
+
+    def test_coprocess_mode(self):
+        module = converter.WaybarModule(
+            name="load", source="config", exec_cmd="cut -d' ' -f1 /proc/loadavg | tr -d '\\n'",
+            interval=5, timeout_ms=5000,
+        )
+        plugin_dir = self.generate(module, shell_mode="coprocess")
+        manifest = json.loads((plugin_dir / "manifest.json").read_text())
+        settings = manifest["metadata"]["defaultSettings"]
+        self.assertEqual(settings["shellMode"], "coprocess")
+        self.assertEqual(settings["textArgv"], [])
+        main_qml = (plugin_dir / "Main.qml").read_text()
+        self.assertIn("id: shellProc", main_qml)
+        self.assertIn("( eval ${shellQuote(buildCommand())} ) </dev/null", main_qml)
+        # The coprocess output goes through the same capped chunk buffers.
+        self.assertEqual(main_qml.count("SplitParser {"), main_qml.count('splitMarker: ""'))
+        self.assertIn("root.splitLines(root.coprocStdoutBuffer, data, root.maxOutputBytes)", main_qml)
+        self.assertIn("root.splitLines(root.coprocStderrBuffer, data, root.maxStderrBytes)", main_qml)
+
+    def test_specialized_qml_drops_unused_sections(self):
+        poll = converter.WaybarModule(name="clock", source="config", exec_cmd="date +%H:%M", interval=30)
+        main_qml = (self.generate(poll) / "Main.qml").read_text()
+        for absent in ("stdoutSplit", "restartTimer", "shellProc", "pickIcon", "sharedOutput", "//@"):
+            self.assertNotIn(absent, main_qml)
+        self.assertIn("id: pollTimer", main_qml)
+        # The timer's start trigger is the first run; onCompleted must not race it.
+        self.assertIn("if (textCommand.length > 0 && !pollTimer.running) {", main_qml)
+        self.assertNotIn("WheelHandler", (self.generate(poll) / "BarWidget.qml").read_text())
+        # Inactive scheduling policies leave no objects or timers behind.
+        plugin_dir = self.generate(poll, idle_pause=0, power=converter.PowerPolicy(battery_scale=1, low_battery_scale=1))
+        main_qml = (plugin_dir / "Main.qml").read_text()
+        for absent in ("IdleMonitor", "Quickshell.Wayland", "FileView", "powerTimer", "readPowerState"):
+            self.assertNotIn(absent, main_qml)
+        self.assertIn("readonly property int pollIntervalMs: Math.max(250, intervalSeconds * 1000)", main_qml)
+        self.assertLess(main_qml.count("\n"), 350)
+        self.assertNotIn("settings.battery-scale", (plugin_dir / "Settings.qml").read_text())
+
+        stream = converter.WaybarModule(
+            name="media", source="config", exec_cmd="playerctl -F metadata", interval_mode="once",
+            return_type="json", on_scroll_up="playerctl next",
+        )
+        plugin_dir = self.generate(stream)
+        main_qml = (plugin_dir / "Main.qml").read_text()
+        self.assertIn("id: stdoutSplit", main_qml)
+        self.assertIn("function pickIcon", main_qml)
+        self.assertNotIn("pollTimer", main_qml)
+        self.assertNotIn("if (parseJson)", main_qml)
+        bar_qml = (plugin_dir / "BarWidget.qml").read_text()
+        self.assertIn("WheelHandler", bar_qml)
+        self.assertNotIn("onClicked", bar_qml)
+
+    def test_poll_pauses_while_hidden(self):
+        alert = converter.WaybarModule(
+            name="battery", source="config", exec_cmd="battery-alert", interval=60, always_poll=True,
+        )
+        plugin_dir = self.generate(alert, idle_pause=300)
+        defaults = json.loads((plugin_dir / "manifest.json").read_text())["metadata"]["defaultSettings"]
+        self.assertTrue(defaults["alwaysPoll"])
+        self.assertEqual(defaults["idlePauseSeconds"], 300)
+        main_qml = (plugin_dir / "Main.qml").read_text()
+        self.assertIn("&& pollActive", main_qml)
+        for absent in ("IdleMonitor", "function setWidgetVisible", "visibilityGraceTimer"):
+            self.assertNotIn(absent, main_qml)
+        self.assertNotIn("visibilityKey", (plugin_dir / "BarWidget.qml").read_text())
+
+        poll = converter.WaybarModule(name="cpu", source="config", exec_cmd="cpu-load", interval=5)
+        plugin_dir = self.generate(poll, idle_pause=300)
+        main_qml = (plugin_dir / "Main.qml").read_text()
+        self.assertIn("import Quickshell.Wayland", main_qml)
+        self.assertIn("IdleMonitor {", main_qml)
+        self.assertIn("function setWidgetVisible", main_qml)
+        self.assertIn("setWidgetVisible(visibilityKey", (plugin_dir / "BarWidget.qml").read_text())
+        self.assertIn("settings.idle-pause", (plugin_dir / "Settings.qml").read_text())
+
+        # A shared leader keeps polling only while its group has a visible member.
+        leader, consumer = converter.assign_shared_sources([
+            converter.WaybarModule(name="vol", source="config", exec_cmd="vol.sh", interval=1),
+            converter.WaybarModule(name="vol-2", source="config", exec_cmd="vol.sh", interval=1),
+        ])
+        leader_qml = (self.generate(leader) / "Main.qml").read_text()
+        self.assertIn('settingOr(defaultSettings.sharedConsumers, ["vol-2"])', leader_qml)
+        self.assertIn("(publishesShared && Object.keys(activeConsumers).length > 0)", leader_qml)
+        self.assertNotIn("alwaysPoll || publishesShared", leader_qml)
+        consumer_qml = (self.generate(consumer) / "Main.qml").read_text()
+        self.assertIn('settingOr(defaultSettings.sharedName, "vol-2")', consumer_qml)
+        self.assertIn('sharedActive.setText(pollActive ? "1" : "0")', consumer_qml)
+
+        stream = converter.WaybarModule(
+            name="media", source="config", exec_cmd="playerctl -F metadata", interval_mode="once",
+        )
+        plugin_dir = self.generate(stream)
+        self.assertNotIn("IdleMonitor", (plugin_dir / "Main.qml").read_text())
+        self.assertNotIn("visibilityKey", (plugin_dir / "BarWidget.qml").read_text())
+
+    def test_power_policy_scales_poll_interval(self):
+        module = converter.WaybarModule(name="net", source="config", exec_cmd="net-status", interval=2)
+        power = converter.PowerPolicy(battery_scale=3, low_battery_scale=5, low_battery_percent=15)
+        self.assertEqual(
+            converter.build_widget_hints(module, power)["power"],
+            {"acInterval": 2, "batteryInterval": 6, "lowBatteryInterval": 10, "lowBatteryPercent": 15},
+        )
+        self.assertNotIn("power", converter.build_widget_hints(module))  # opt-in
+        plugin_dir = self.generate(module, power=power)
+        defaults = json.loads((plugin_dir / "manifest.json").read_text())["metadata"]["defaultSettings"]
+        self.assertEqual(defaults["batteryIntervalScale"], 3)
+        self.assertEqual(defaults["lowBatteryPercent"], 15)
+        self.assertNotIn("powerSupply", defaults)
+        main_qml = (plugin_dir / "Main.qml").read_text()
+        self.assertIn("interval: root.pollIntervalMs", main_qml)
+        self.assertIn('import "../waybar-runtime"', main_qml)
+        self.assertIn("PowerState.acquire()", main_qml)
+        self.assertNotIn("FileView", main_qml)
+
+        # One shared reader finds the supply at runtime, without a process.
+        runtime_dir = plugin_dir.parent / converter.RUNTIME_PLUGIN_DIR
+        converter.generate_shared_runtime(plugin_dir.parent.parent)
+        self.assertIn("singleton PowerState 1.0 PowerState.qml", (runtime_dir / "qmldir").read_text())
+        power_qml = (runtime_dir / "PowerState.qml").read_text()
+        self.assertIn("/sys/class/power_supply", power_qml)
+        self.assertNotIn("Process", power_qml)
+
+    def test_stream_updates_are_rate_limited(self):
+        stream = converter.WaybarModule(
+            name="vol", source="config", exec_cmd="pactl subscribe", interval_mode="once",
+        )
+        plugin_dir = self.generate(stream, max_update_rate=10)
+        defaults = json.loads((plugin_dir / "manifest.json").read_text())["metadata"]["defaultSettings"]
+        self.assertEqual(defaults["maxUpdateRate"], 10)
+        main_qml = (plugin_dir / "Main.qml").read_text()
+        self.assertIn(".forEach(line => root.acceptLine(line))", main_qml)
+        self.assertIn("droppedLines += 1", main_qml)
+
+        poll = converter.WaybarModule(name="clock", source="config", exec_cmd="date", interval=30)
+        self.assertNotIn("coalesceTimer", (self.generate(poll) / "Main.qml").read_text())
+
+    def test_scroll_bursts_run_once(self):
+        module = converter.WaybarModule(
+            name="light", source="config", exec_cmd="brightnessctl -m", interval=5,
+            on_scroll_up="brightnessctl set {steps}%+", on_scroll_down="brightnessctl set 1%-",
+        )
+        bar_qml = (self.generate(module) / "BarWidget.qml").read_text()
+        self.assertIn('runScroll("brightnessctl set {steps}%+", [], true, steps)', bar_qml)
+        self.assertIn('runScroll("brightnessctl set 1%-", ["brightnessctl", "set", "1%-"], true, steps)', bar_qml)
+        self.assertIn("root.scrollAccum += event.angleDelta.y", bar_qml)
+        # The refresh waits for the scroll command to exit.
+        run_scroll = bar_qml.split("function runScroll")[1].split("function flushScroll")[0]
+        self.assertNotIn("refresh()", run_scroll)
+        self.assertNotIn("execDetached", bar_qml)
+
+    def test_patch_stream_protocol(self):
+        lines = [
+            {"text": "1", "tooltip": "long", "percentage": 10},
+            {"$patch": True, "text": "2", "percentage": 90},
+            {"$patch": True, "tooltip": None},
+        ]
+        script = "; ".join(f"echo {shlex.quote(json.dumps(line))}" for line in lines)
+        module = converter.WaybarModule(
+            name="mon", source="config", exec_cmd=script, interval_mode="once",
+            return_type="json", format="{icon} {}", format_icons=["lo", "hi"], patch_stream=True,
+        )
+        proc = subprocess.run(
+            ["sh", "-c", converter.transform_command(module).command], capture_output=True, text=True
+        )
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertEqual([json.loads(line) for line in proc.stdout.splitlines()], [
+            {"text": "lo 1", "tooltip": "long", "icon": "lo"},
+            {"text": "hi 2", "tooltip": "long", "icon": "hi"},
+            {"text": "hi 2", "tooltip": "", "icon": "hi"},
+        ])
+
+        plugin_dir = self.generate(module)
+        main_qml = (plugin_dir / "Main.qml").read_text()
+        self.assertIn("if (acceptsPatches() && mergeStreamLine(line)) line = null;", main_qml)
+        module.patch_stream = False
+        self.assertNotIn("mergeStreamLine", (self.generate(module) / "Main.qml").read_text())
+
+        node = shutil.which("node")
+        if not node:
+            self.skipTest("node not installed")
+        functions = "\n".join(
+            converter.extract_js_function(main_qml, name)
+            for name in ("pickIcon", "applyFormat", "clipTooltip", "mergeStreamLine", "renderStreamState")
+        )
+        driver = (
+            'var formatString = "{icon} {}", formatIcons = ["lo", "hi"], streamState = {}, '
+            "maxTooltipChars = 4096, truncatedTooltips = 0, "
+            'formatDirty = false, tooltipDirty = false, displayText = "", displayIcon = "", displayTooltip = "";'
+            "function refreshed() {}\n" + functions + "\nvar out = [];"
+            + "".join(f"mergeStreamLine({json.dumps(json.dumps(line))}); renderStreamState(); "
+                      "out.push([displayText, displayTooltip]);" for line in lines)
+            + "process.stdout.write(JSON.stringify(out));"
+        )
+        rendered = subprocess.run([node, "-e", driver], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(json.loads(rendered), [["lo 1", "long"], ["hi 2", "long"], ["hi 2", ""]])
+
+    def test_spawn_budget_and_priorities(self):
+        fast = converter.WaybarModule(name="vol", source="config", exec_cmd="vol", interval=2, on_click="mute")
+        slow = converter.WaybarModule(name="updates", source="config", exec_cmd="checkupdates", interval=3600)
+        self.assertEqual(converter.spawn_priority(fast), 1)
+        self.assertEqual(converter.spawn_priority(slow), 3)
+
+        plugin_dir = self.generate(slow, spawn_budget=4, nice_background=True)
+        defaults = json.loads((plugin_dir / "manifest.json").read_text())["metadata"]["defaultSettings"]
+        self.assertEqual((defaults["spawnBudget"], defaults["niceCommand"]), (4, True))
+        main_qml = (plugin_dir / "Main.qml").read_text()
+        self.assertIn('import "../waybar-runtime"', main_qml)
+        self.assertIn("SpawnBudget.request(root, urgent ? 0 : spawnPriority", main_qml)
+        self.assertIn('["nice", "-n", "10", "ionice", "-c", "3"].concat(argv)', main_qml)
+
+        main_qml = (self.generate(fast) / "Main.qml").read_text()
+        self.assertNotIn("SpawnBudget", main_qml)
+        self.assertNotIn("ionice", main_qml)
+
+    def test_hyprland_provider_routing(self):
+        recognize = converter.recognize_hyprctl_query
+        query = recognize("hyprctl activewindow -j")
+        self.assertEqual((query.query, query.direct), ("j/activewindow", True))
+        self.assertEqual(query.events[-1], "configreloaded")
+        self.assertEqual(recognize("hyprctl -j activeworkspace | jq -r .name").direct, False)
+        self.assertEqual(recognize("hyprctl submap").query, "submap")
+        for command in ("hyprctl --batch 'dispatch exec x'", "hyprctl version", "hyprctl submap || echo none"):
+            self.assertIsNone(recognize(command), command)
+
+        module = converter.WaybarModule(name="title", source="config", exec_cmd="hyprctl -j activewindow", interval=1)
+        converter.route_hyprctl_modules([module])
+        plugin_dir = self.generate(module)
+        defaults = json.loads((plugin_dir / "manifest.json").read_text())["metadata"]["defaultSettings"]
+        self.assertEqual(defaults["hyprland"]["query"], "j/activewindow")
+        main_qml = (plugin_dir / "Main.qml").read_text()
+        self.assertIn('import "../waybar-runtime"', main_qml)
+        self.assertIn("&& !useHyprland", main_qml)
+        self.assertIn("HyprlandProvider.refresh(hyprland.query);", main_qml)
+
+        converter.generate_shared_runtime(plugin_dir.parent.parent)
+        runtime_dir = plugin_dir.parent / converter.RUNTIME_PLUGIN_DIR
+        self.assertIn("singleton HyprlandProvider 1.0 HyprlandProvider.qml", (runtime_dir / "qmldir").read_text())
+        self.assertIn("function onRawEvent(event)", (runtime_dir / "HyprlandProvider.qml").read_text())
+
+        polled = converter.WaybarModule(name="date", source="config", exec_cmd="date", interval=1)
+        converter.route_hyprctl_modules([polled])
+        self.assertIsNone(polled.hyprland)
+        self.assertNotIn("HyprlandProvider", (self.generate(polled) / "Main.qml").read_text())
+
+    def test_output_caps(self):
+        limits = converter.OutputLimits(stdout_bytes=64, stderr_bytes=32, tooltip_chars=8)
+        module = converter.WaybarModule(
+            name="big", source="config", interval=5, return_type="json",
+            exec_cmd="""printf '{"text":"ok","tooltip":"0123456789"}%100000s' ''""",
+        )
+        proc = subprocess.run(
+            ["sh", "-c", converter.transform_command(module, limits).command], capture_output=True, text=True
+        )
+        self.assertEqual(json.loads(proc.stdout), {"text": "ok", "tooltip": "01234567\u2026", "icon": ""})
+        self.assertIn("output truncated", proc.stderr)
+
+        plugin_dir = self.generate(module, limits=limits)
+        defaults = json.loads((plugin_dir / "manifest.json").read_text())["metadata"]["defaultSettings"]
+        self.assertEqual((defaults["maxOutputBytes"], defaults["maxTooltipChars"]), (64, 8))
+        main_qml = (plugin_dir / "Main.qml").read_text()
+        self.assertNotIn("StdioCollector", main_qml)
+
+        node = shutil.which("node")
+        if not node:
+            self.skipTest("node not installed")
+        functions = "\n".join(
+            converter.extract_js_function(main_qml, name)
+            for name in (
+                "utf8Length", "clipUtf8", "appendCapped", "splitLines", "collectOutput", "takeBuffer",
+                "noteTruncatedOutput", "clipTooltip", "logStderr",
+            )
+        )
+        driver = (
+            "var logged = [], Logger = { w: (tag, text) => logged.push(text) }, root = { logTag: 'big' };"
+            "var maxOutputBytes = 64, maxStderrBytes = 32, maxTooltipChars = 8, truncatedOutputs = 0, "
+            "truncatedTooltips = 0, suppressedStderr = 0, stderrWindow = { start: 0, bytes: 0, lines: 0, suppressed: 0 };"
+            "var stdoutBuffer = { text: '', bytes: 0, clipped: false }, stderrBuffer = { text: '', bytes: 0, clipped: false };\n"
+            + functions
+            + "\ncollectOutput('\u00e9'.repeat(20)); collectOutput('b'.repeat(50));"
+            "var lines = splitLines(stderrBuffer, 'error 1\\nerror 2\\nerror 3\\nerror 4\\nerror 5\\nerr', 32);"
+            "lines.forEach(line => logStderr(line));"
+            "process.stdout.write(JSON.stringify([stdoutBuffer.text.length, truncatedOutputs, lines.length, "
+            "stderrBuffer.text, logged.length, suppressedStderr, clipTooltip('0123456789'), "
+            "clipUtf8('a\\ud83d\\ude00b', 4), utf8Length('\u00e9\u20ac\\ud83d\\ude00')]));"
+        )
+        result = subprocess.run([node, "-e", driver], capture_output=True, text=True, check=True).stdout
+        # Caps count UTF-8 bytes: 20 two-byte characters leave room for 24 of the b's.
+        # 1 truncation warning + 4 stderr lines within the 32-byte window budget.
+        self.assertEqual(json.loads(result), [44, 1, 5, "err", 5, 1, "01234567\u2026", "a", 9])
+
+    def test_select_sections(self):
+        template = "a\n//@if x&!y\nb\n//@if z\nc\n//@endif\n//@endif\n\n//@if y\nd\n\n//@endif\n\ne\n"
+        self.assertEqual(converter.select_sections(template, {"x", "z"}), "a\nb\nc\n\ne\n")
+        self.assertEqual(converter.select_sections(template, {"y"}), "a\n\nd\n\ne\n")
+
+    def test_shared_runtime_plugins_are_thin(self):
+        module = converter.WaybarModule(
+            name="vpn", source="config", exec_cmd="vpn-status", interval=5, on_click="vpn toggle",
+        )
+        plugin_dir = self.generate(module, shared_runtime=True)
+        self.assertEqual(
+            (plugin_dir / "Main.qml").read_text(),
+            'import QtQuick\nimport "../waybar-runtime"\n\nWaybarRunner {}\n',
+        )
+        settings = json.loads((plugin_dir / "manifest.json").read_text())["metadata"]["defaultSettings"]
+        self.assertEqual(settings["onClickArgv"], ["vpn", "toggle"])
+        self.assertEqual(settings["textArgv"], ["vpn-status"])
+
+        with redirect_stdout(io.StringIO()):
+            converter.generate_shared_runtime(plugin_dir.parent.parent)
+        runtime_dir = plugin_dir.parent / "waybar-runtime"
+        runner = (runtime_dir / "WaybarRunner.qml").read_text()
+        self.assertIn("settingOr(defaultSettings.textCommand, \"\")", runner)
+        self.assertIn("WaybarPill 1.0 WaybarPill.qml", (runtime_dir / "qmldir").read_text())
+
 
 if __name__ == "__main__":
     unittest.main()
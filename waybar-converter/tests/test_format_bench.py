@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import waybar_format_bench  # noqa: E402
+
+
+class FormatBenchTests(unittest.TestCase):
+    def test_format_replay_matches_corpus(self):
+        cases = waybar_format_bench.load_format_corpus(waybar_format_bench.FORMAT_CORPUS_PATH)
+        python = waybar_format_bench.bench_python_formatter(cases, 1)
+        port = [(waybar_format_bench.qml_format_equivalent(case), 0.0) for case in cases]
+        divergences = waybar_format_bench.compare_formatters(cases, python, port)
+        self.assertEqual([d["module"] for d in divergences if not d["known"]], [])
+        self.assertEqual(
+            {d["module"] for d in divergences},
+            {case["module"] for case in cases if case.get("known")},
+        )
+        engine, qml = waybar_format_bench.bench_qml_formatter(cases, 1)
+        if engine != "node":
+            self.skipTest("node not installed")
+        self.assertEqual([rendered for rendered, _ in qml], [rendered for rendered, _ in port])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import asyncio
+import io
+import json
+import socket
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import waybar_serve  # noqa: E402
+import waybar_to_noctalia as converter  # noqa: E402
+
+
+class ServeTests(unittest.TestCase):
+    CONFIG = '{"custom/vpn": {"exec": "vpn-status", "interval": 5}, // comment\n "modules-right": ["custom/vpn"]}'
+
+    def test_service_converts_and_caches(self):
+        service = waybar_serve.ConversionService()
+        first = service.handle(json.dumps({"id": 1, "config": self.CONFIG, "options": {"compact": True}}))
+        self.assertTrue(first["ok"])
+        self.assertEqual(first["modules"], ["vpn"])
+        self.assertIn("widgets/vpn.json", first["files"])
+        self.assertFalse(first["cached"])
+        second = service.handle(json.dumps({"id": 2, "config": self.CONFIG, "options": {"compact": True}}))
+        self.assertTrue(second["cached"])
+        self.assertEqual(second["files"], first["files"])
+
+        bad = service.handle(json.dumps({"id": 3, "config": self.CONFIG, "options": {"mode": "nope"}}))
+        self.assertFalse(bad["ok"])
+        self.assertIn("invalid choice", bad["error"])
+        self.assertFalse(service.handle(b"[1]")["ok"])
+
+    def test_service_options(self):
+        self.assertEqual(
+            waybar_serve.options_to_argv({"alert_module": ["vpn", "nope"], "compact": True}),
+            ["--alert-module", "vpn", "--alert-module", "nope", "--compact"],
+        )
+        service = waybar_serve.ConversionService()
+        response = service.handle(json.dumps({"config": self.CONFIG, "options": {"alert_module": ["vpn", "nope"]}}))
+        self.assertTrue(response["ok"])
+        # Warnings written to stderr reach the client instead of the server log.
+        self.assertIn("--alert-module nope does not match", response["log"])
+        for option in ("output_dir", "profile", "probe"):
+            with self.subTest(option=option):
+                rejected = service.handle(json.dumps({"config": self.CONFIG, "options": {option: True}}))
+                self.assertFalse(rejected["ok"])
+                self.assertIn("not supported by serve", rejected["error"])
+
+    def test_service_reads_files_only_below_roots(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name) / "waybar"
+        root.mkdir()
+        (root / "config").write_text(self.CONFIG)
+        (Path(tmp.name) / "secret").write_text("{}")
+        service = waybar_serve.ConversionService(roots=[root])
+        self.assertEqual(service.handle(json.dumps({"path": str(root / "config")}))["modules"], ["vpn"])
+        for path in (Path(tmp.name) / "secret", root / ".." / "secret", root / "missing"):
+            with self.subTest(path=path):
+                response = service.handle(json.dumps({"path": str(path)}))
+                self.assertFalse(response["ok"])
+                self.assertNotIn("Errno", response["error"])
+        outside = service.handle(json.dumps({"config": self.CONFIG, "options": {"event_rules": str(Path(tmp.name) / "secret")}}))
+        self.assertIn("event_rules must be inside", outside["error"])
+
+    def test_service_cache_follows_event_rules_and_reuses_transforms(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        rules = Path(tmp.name) / "rules.json"
+        rules.write_text(json.dumps([{"name": "vpn", "match": "^vpn-status", "events": "vpn-events"}]))
+        service = waybar_serve.ConversionService(roots=[Path(tmp.name)])
+        request = json.dumps({"config": self.CONFIG, "options": {"event_rules": str(rules), "mode": "widgets"}})
+        first = service.handle(request)
+        self.assertIn("vpn-events", first["files"]["widgets/vpn.json"])
+        rules.write_text("[]")
+        second = service.handle(request)
+        self.assertFalse(second["cached"])
+        self.assertNotIn("vpn-events", second["files"]["widgets/vpn.json"])
+
+        calls = []
+        original = converter._transform_command
+
+        def counting(module, limits):
+            calls.append(module.name)
+            return original(module, limits)
+
+        converter._transform_command = counting
+        self.addCleanup(setattr, converter, "_transform_command", original)
+        edited = self.CONFIG.replace('"modules-right"', '"custom/new": {"exec": "new-status"}, "modules-right"')
+        response = service.handle(json.dumps({"config": edited, "options": {"event_rules": str(rules), "mode": "widgets"}}))
+        self.assertTrue(response["ok"])
+        # Only the added module is transformed; vpn comes from the warm cache.
+        self.assertEqual(set(calls), {"new"})
+
+    def test_service_help_option_stays_off_server_stdout(self):
+        service = waybar_serve.ConversionService()
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            for options in ({"help": True}, {"h": True}, {"prob": True}):
+                self.assertFalse(service.handle(json.dumps({"config": self.CONFIG, "options": options}))["ok"])
+        self.assertEqual(stdout.getvalue(), "")
+
+    def test_unix_socket_roundtrip(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        socket_path = Path(tmp.name) / "serve.sock"
+
+        async def exercise():
+            task = asyncio.create_task(waybar_serve.serve(socket_path))
+            while not socket_path.exists():
+                await asyncio.sleep(0.01)
+
+            async def request(request_id):
+                reader, writer = await asyncio.open_unix_connection(str(socket_path))
+                writer.write(json.dumps({"id": request_id, "config": self.CONFIG}).encode() + b"\n")
+                await writer.drain()
+                response = json.loads(await reader.readline())
+                writer.close()
+                return response
+
+            responses = await asyncio.gather(request("a"), request("b"))
+            task.cancel()
+            return responses
+
+        with redirect_stdout(io.StringIO()):
+            responses = asyncio.run(exercise())
+        self.assertEqual([(r["id"], r["ok"]) for r in responses], [("a", True), ("b", True)])
+        self.assertFalse(socket_path.exists())
+
+    def test_serve_refuses_live_socket_and_replaces_stale_one(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        socket_path = Path(tmp.name) / "serve.sock"
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(listener.close)
+        listener.bind(str(socket_path))
+        listener.listen(1)
+        with self.assertRaisesRegex(OSError, "already listening"):
+            waybar_serve.remove_stale_socket(socket_path)
+        self.assertTrue(socket_path.exists())
+
+        listener.close()
+        waybar_serve.remove_stale_socket(socket_path)
+        self.assertFalse(socket_path.exists())
+        socket_path.write_text("not a socket")
+        with self.assertRaisesRegex(OSError, "not a socket"):
+            waybar_serve.remove_stale_socket(socket_path)
+
+    def test_serve_socket_is_owner_only(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        socket_path = Path(tmp.name) / "serve.sock"
+
+        async def exercise():
+            task = asyncio.create_task(waybar_serve.serve(socket_path))
+            while not socket_path.exists():
+                await asyncio.sleep(0.01)
+            mode = socket_path.stat().st_mode
+            task.cancel()
+            return mode
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(asyncio.run(exercise()) & 0o077, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
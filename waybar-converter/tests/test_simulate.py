@@ -0,0 +1,55 @@
+import io
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import waybar_simulate  # noqa: E402
+import waybar_to_noctalia as converter  # noqa: E402
+
+
+class SimulatorTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.out = Path(tmp.name)
+
+    def test_simulator_replays_scheduling(self):
+        slow = waybar_simulate.SimTask(name="slow", command="slow", interval_s=2, timeout_s=10)
+        gated = waybar_simulate.SimTask(name="gated", command="gated", interval_s=10, exec_if="check")
+        stream = waybar_simulate.SimTask(name="stream", command="stream", stream=True, restart_s=1)
+        costs = {"slow": [(3.0, 0.5, True)], "gated": [(0.1, 0.1, True)], "check": [(0.01, 0.0, False)]}
+        stats = waybar_simulate.BarSimulator([slow, gated], costs, changes_per_hour=0).run(60)
+        # Ticks at 0, 2, ... 60 land every other time on a run still going.
+        self.assertEqual((stats["slow"].forks, stats["slow"].skipped), (16, 15))
+        self.assertAlmostEqual(stats["slow"].cpu_s, 8.0)
+        self.assertEqual((stats["gated"].forks, stats["gated"].exec_if_skips), (14, 7))
+        # An urgent request for a queued run promotes it instead of being dropped.
+        hog, b, c = (waybar_simulate.SimTask(name=n, command=n, interval_s=5, priority=3) for n in ("hog", "b", "c"))
+        sim = waybar_simulate.BarSimulator([hog, b, c], spawn_budget=1)
+        for task, urgent in ((hog, False), (b, False), (c, False), (c, True)):
+            sim.request(task, urgent)
+        self.assertEqual(sim.stats["c"].skipped, 0)
+        sim.finish(hog, 0.0, True)
+        self.assertEqual((sim.running, list(sim.queued)), ({"c"}, ["b"]))
+        # Five-second lifetimes are never healthy: the circuit opens after 8 failures.
+        stats = waybar_simulate.BarSimulator([stream], changes_per_hour=0, stream_lifetime_s=5).run(600)
+        self.assertEqual((stats["stream"].forks, stats["stream"].restarts), (8, 7))
+
+        with redirect_stdout(io.StringIO()):
+            converter.generate_widget_configs([converter.WaybarModule(
+                name="vpn", source="config", exec_cmd="vpn-status", interval=5, on_click="vpn toggle",
+            )], self.out, 60)
+        tasks, budget = waybar_simulate.load_sim_tasks(self.out)
+        self.assertEqual([(t.name, t.interval_s, t.click_refresh) for t in tasks], [("vpn", 5, True)])
+        stats = waybar_simulate.BarSimulator(tasks, changes_per_hour=3600, clicks_per_hour=60).run(3600)["vpn"]
+        self.assertGreater(stats.forks, 720)
+        self.assertLessEqual(max(stats.stale_s), 5.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Waybar to Noctalia fleet audit
+
+Loads the custom modules of many Waybar configs, for example a directory with
+one config per host, and reports the most common commands, an interval
+histogram and how often each wrapper the converter would emit is used.
+
+Usage:
+    python waybar_audit.py PATH [PATH ...] [--top N] [--columns FILE] [--json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Optional
+
+from waybar_to_noctalia import (
+    DEFAULT_WAYBAR_INTERVAL,
+    ModuleInterner,
+    ModuleRecord,
+    extract_module_records,
+    parse_waybar_config_text,
+)
+
+
+INTERVAL_BUCKETS = (1, 5, 10, 30, 60, 300, 3600)
+
+
+def module_wrappers(record: ModuleRecord) -> str:
+    """The shell wrappers the converter puts around a module's command, "+"-joined."""
+    wrappers = []
+    if record.return_type == "json":
+        wrappers.append("json-format")
+    elif record.format not in ("{}", "{text}"):
+        wrappers.append("plain-format")
+    if record.exec_if:
+        wrappers.append("exec-if")
+    if record.timeout_ms:
+        wrappers.append("timeout")
+    if record.interval_mode == "once" and record.restart_interval:
+        wrappers.append("restart")
+    return sys.intern("+".join(wrappers) or "none")
+
+
+def module_columns(records: list[ModuleRecord]) -> dict[str, list]:
+    """Transpose records into one list per field, plus a derived ``wrappers`` column."""
+    columns = {name: list(values) for name, values in zip(ModuleRecord._fields, zip(*records))}
+    if not columns:
+        columns = {name: [] for name in ModuleRecord._fields}
+    columns["wrappers"] = [module_wrappers(record) for record in records]
+    return columns
+
+
+def interval_bucket(mode: str, interval: Optional[int]) -> str:
+    if mode == "once":
+        return "stream"
+    for limit in INTERVAL_BUCKETS:
+        if (interval or 0) <= limit:
+            return f"<={limit}s"
+    return f">{INTERVAL_BUCKETS[-1]}s"
+
+
+def audit_report(columns: dict[str, list], top: int = 10) -> dict:
+    """Group-by summaries over a module column set."""
+    commands = Counter(columns["exec_cmd"])
+    buckets = Counter(map(interval_bucket, columns["interval_mode"], columns["interval"]))
+    return {
+        "modules": len(columns["name"]),
+        "sources": len(set(columns["source"])),
+        "distinctCommands": len(commands),
+        "commands": commands.most_common(top),
+        "intervals": [
+            (label, buckets[label])
+            for label in ("stream", *(f"<={limit}s" for limit in INTERVAL_BUCKETS), f">{INTERVAL_BUCKETS[-1]}s")
+            if buckets[label]
+        ],
+        "wrappers": Counter(columns["wrappers"]).most_common(),
+    }
+
+
+def iter_config_paths(paths: list[str]) -> Iterable[Path]:
+    """Config files named on the command line; directories are searched recursively."""
+    for entry in paths:
+        path = Path(entry)
+        if not path.is_dir():
+            yield path
+            continue
+        for candidate in sorted(path.rglob("config*")):
+            if candidate.is_file() and candidate.suffix in ("", ".json", ".jsonc"):
+                yield candidate
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Load custom modules from many Waybar configs and report command, interval and wrapper usage",
+    )
+    parser.add_argument("paths", nargs="+", help="Config files, or directories searched for config/config.json(c)")
+    parser.add_argument("--top", type=int, default=10, help="Commands to list (default: 10)")
+    parser.add_argument("--columns", metavar="FILE", help="Also write every module as JSON columns (one array per field)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    interner = ModuleInterner()
+    records: list[ModuleRecord] = []
+    failed = 0
+    for path in iter_config_paths(args.paths):
+        try:
+            config = parse_waybar_config_text(path.read_text(encoding="utf-8", errors="replace"))
+        except (OSError, ValueError) as e:
+            print(f"Warning: skipping {path}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        for record in extract_module_records(config, DEFAULT_WAYBAR_INTERVAL, 2, interner):
+            records.append(record._replace(source=interner.text(f"{path}:{record.source}")))
+
+    columns = module_columns(records)
+    if args.columns:
+        with open(args.columns, "w", encoding="utf-8") as f:
+            json.dump(columns, f, ensure_ascii=False, default=dict)
+    report = {**audit_report(columns, args.top), "unreadable": failed}
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print(f"{report['modules']} module(s) from {report['sources']} config section(s); "
+          f"{report['distinctCommands']} distinct command(s)")
+    print("\nMost common commands:")
+    for command, count in report["commands"]:
+        print(f"  {count:>7}  {command if len(command) <= 80 else command[:77] + '...'}")
+    print("\nIntervals:")
+    for label, count in report["intervals"]:
+        print(f"  {label:>8}  {count}")
+    print("\nWrappers:")
+    for wrappers, count in report["wrappers"]:
+        print(f"  {count:>7}  {wrappers}")
+    if args.columns:
+        print(f"\nColumns: {args.columns}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Waybar to Noctalia formatter benchmark
+
+Replays a corpus of recorded module outputs through the widget formatters
+(the inline Python piped after widget commands) and the plugin formatter
+(pickIcon/applyFormat/parseOutput from Main.qml), reporting per-update cost
+and any outputs the two render differently.
+
+Usage:
+    python waybar_format_bench.py [--corpus FILE] [--repeat N] [--json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import io
+import json
+import math
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Optional
+
+from waybar_to_noctalia import (
+    DEFAULT_WAYBAR_INTERVAL,
+    PYTHON_JSON_FORMAT_CODE,
+    PYTHON_PLAIN_FORMAT_CODE,
+    OutputLimits,
+    WaybarModule,
+    build_plugin_defaults,
+    extract_js_function,
+    render_main_qml,
+)
+
+
+FORMAT_CORPUS_PATH = Path(__file__).resolve().parent / "samples" / "recorded-outputs.jsonl"
+FORMAT_BENCH_REPEAT = 200
+
+# Runs the QML formatting functions extracted from Main.qml. The root
+# properties they read and write are plain variables here.
+FORMAT_BENCH_JS = r"""
+const input = JSON.parse(require("fs").readFileSync(0, "utf8"));
+var formatString = "", formatIcons = [], parseJson = false, publishesShared = false;
+var maxTooltipChars = input.maxTooltipChars, truncatedTooltips = 0;
+var displayText = "", displayIcon = "", displayTooltip = "";
+function refreshed() {}
+eval(input.functions);
+const results = [];
+for (const c of input.cases) {
+  formatString = c.format;
+  formatIcons = c.formatIcons;
+  parseJson = c.returnType === "json";
+  const started = process.hrtime.bigint();
+  for (let i = 0; i < input.repeat; i++) {
+    displayText = displayIcon = displayTooltip = "";
+    parseOutput(c.output);
+  }
+  const ns = Number(process.hrtime.bigint() - started) / input.repeat;
+  results.push({text: displayText, icon: displayIcon, tooltip: displayTooltip, ns: ns});
+}
+process.stdout.write(JSON.stringify(results));
+"""
+
+
+def load_format_corpus(path: Path) -> list[dict]:
+    """Recorded module outputs, one JSON object per line."""
+    cases = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            if not isinstance(case, dict) or not isinstance(case.get("output"), str):
+                raise ValueError(f"{path}:{number}: expected an object with an \"output\" string")
+            case.setdefault("module", f"line{number}")
+            case.setdefault("returnType", "")
+            case.setdefault("format", "{}")
+            case.setdefault("formatIcons", [])
+            cases.append(case)
+    return cases
+
+
+def qml_formatter_source() -> str:
+    """pickIcon/applyFormat/clipTooltip/parseOutput exactly as a generated plugin ships them."""
+    module = WaybarModule(name="bench", source="bench", exec_cmd="true", interval=5, return_type="json")
+    defaults = build_plugin_defaults(module, DEFAULT_WAYBAR_INTERVAL)
+    qml = render_main_qml(defaults, '"bench"', {"dynamic", "json", "plain"})
+    return "\n".join(extract_js_function(qml, name) for name in ("pickIcon", "applyFormat", "clipTooltip", "parseOutput"))
+
+
+def js_string(value: object) -> str:
+    """String(value) as JavaScript renders parsed JSON values."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, list):
+        return ",".join("" if v is None else js_string(v) for v in value)
+    if isinstance(value, dict):
+        return "[object Object]"
+    return str(value)
+
+
+def js_parse_int(value: object) -> Optional[int]:
+    match = re.match(r"\s*([+-]?\d+)", js_string(value)) if value is not None else None
+    return int(match.group(1)) if match else None
+
+
+def qml_format_equivalent(case: dict) -> tuple[str, str, str]:
+    """Python port of the QML parseOutput path, used when no JS engine is installed."""
+
+    def truthy(value: object) -> bool:
+        return value not in (None, False, 0, "") and value == value
+
+    def apply_format(fmt: str, data: dict, icon: str) -> str:
+        text = js_string(data["text"]) if truthy(data.get("text")) else ""
+        if not fmt or fmt in ("{}", "{text}"):
+            return text
+        out = fmt.replace("{}", text, 1)
+        for key, value in (
+            ("{text}", text),
+            ("{icon}", icon or ""),
+            ("{percentage}", js_string(data["percentage"]) if "percentage" in data else ""),
+            ("{class}", js_string(data["class"]) if "class" in data else ""),
+            ("{alt}", js_string(data["alt"]) if "alt" in data else ""),
+        ):
+            out = out.replace(key, value)
+        return out
+
+    def clip(tooltip: str) -> str:
+        cap = OutputLimits.tooltip_chars
+        return tooltip[:cap] + "\u2026" if len(tooltip) > cap else tooltip
+
+    raw = case["output"].strip()
+    if not raw:
+        return "", "", ""
+    if case["returnType"] != "json":
+        return apply_format(case["format"], {"text": raw}, ""), "", clip(raw)
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return raw, "", clip(raw)
+    if not isinstance(data, dict):
+        data = {}
+    icons = case["formatIcons"]
+    icon = js_string(data["icon"]) if truthy(data.get("icon")) else ""
+    if icons:
+        pct = js_parse_int(data.get("percentage"))
+        if pct is not None:
+            icon = icons[max(0, min(len(icons) - 1, math.floor(pct * len(icons) / 100)))]
+        elif not icon:
+            icon = icons[0]
+    tooltip = js_string(data["tooltip"]) if truthy(data.get("tooltip")) else ""
+    return apply_format(case["format"], data, icon), icon, clip(tooltip)
+
+
+def run_python_formatter(case: dict, code) -> tuple[str, str, str]:
+    """Run the inline widget formatter in-process with its argv and stdin faked."""
+    fmt_b64 = base64.b64encode(case["format"].encode("utf-8")).decode("ascii")
+    if case["returnType"] == "json":
+        icons_b64 = base64.b64encode(json.dumps(case["formatIcons"]).encode("utf-8")).decode("ascii")
+        argv = ["-c", icons_b64, fmt_b64, str(OutputLimits.stdout_bytes), str(OutputLimits.tooltip_chars)]
+    else:
+        argv = ["-c", fmt_b64, str(OutputLimits.stdout_bytes)]
+    saved = sys.argv, sys.stdin
+    out = io.StringIO()
+    sys.argv, sys.stdin = argv, io.TextIOWrapper(io.BytesIO(case["output"].encode("utf-8")))
+    try:
+        with redirect_stdout(out):
+            exec(code, {"__name__": "__main__"})
+    except SystemExit:
+        pass
+    finally:
+        sys.argv, sys.stdin = saved
+    if case["returnType"] != "json":
+        return out.getvalue(), "", case["output"].strip()
+    if not out.getvalue():
+        return "", "", ""
+    payload = json.loads(out.getvalue())
+    return (
+        js_string(payload.get("text", "")),
+        js_string(payload.get("icon", "")),
+        js_string(payload.get("tooltip", "")),
+    )
+
+
+def bench_python_formatter(cases: list[dict], repeat: int) -> list[tuple[tuple[str, str, str], float]]:
+    codes = {
+        "json": compile(PYTHON_JSON_FORMAT_CODE, "<json-format>", "exec"),
+        "": compile(PYTHON_PLAIN_FORMAT_CODE, "<plain-format>", "exec"),
+    }
+    results = []
+    for case in cases:
+        code = codes["json" if case["returnType"] == "json" else ""]
+        started = time.perf_counter_ns()
+        for _ in range(repeat):
+            rendered = run_python_formatter(case, code)
+        results.append((rendered, (time.perf_counter_ns() - started) / repeat))
+    return results
+
+
+def bench_qml_formatter(cases: list[dict], repeat: int) -> tuple[str, list[tuple[tuple[str, str, str], float]]]:
+    """Run the QML formatter under node when available, else the Python port."""
+    node = shutil.which("node")
+    if node:
+        request = {
+            "functions": qml_formatter_source(), "cases": cases, "repeat": repeat,
+            "maxTooltipChars": OutputLimits.tooltip_chars,
+        }
+        proc = subprocess.run(
+            [node, "-e", FORMAT_BENCH_JS],
+            input=json.dumps(request),
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        if proc.returncode == 0:
+            return "node", [((r["text"], r["icon"], r["tooltip"]), r["ns"]) for r in json.loads(proc.stdout)]
+        print(f"Warning: node failed ({proc.stderr.strip()[:200]}); using the Python port", file=sys.stderr)
+    results = []
+    for case in cases:
+        started = time.perf_counter_ns()
+        for _ in range(repeat):
+            rendered = qml_format_equivalent(case)
+        results.append((rendered, (time.perf_counter_ns() - started) / repeat))
+    return "python port", results
+
+
+def compare_formatters(cases: list[dict], python_results: list, qml_results: list) -> list[dict]:
+    """Cases where the two implementations render differently.
+
+    Plain-output widgets carry no icon or tooltip, so only text is compared
+    for them.
+    """
+    divergences = []
+    for case, (py, _), (qml, _) in zip(cases, python_results, qml_results):
+        fields = ("text", "icon", "tooltip") if case["returnType"] == "json" else ("text",)
+        diffs = {
+            name: {"python": a, "qml": b}
+            for name, a, b in zip(("text", "icon", "tooltip"), py, qml)
+            if name in fields and a != b
+        }
+        if diffs:
+            divergences.append({"module": case["module"], "output": case["output"], "known": case.get("known"), "fields": diffs})
+    return divergences
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Replay recorded module outputs through the widget (Python) and plugin (QML) formatters",
+    )
+    parser.add_argument("--corpus", default=str(FORMAT_CORPUS_PATH), help="JSONL corpus of recorded outputs (default: samples/recorded-outputs.jsonl)")
+    parser.add_argument("--repeat", type=int, default=FORMAT_BENCH_REPEAT, help=f"Replays per record (default: {FORMAT_BENCH_REPEAT})")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        cases = load_format_corpus(Path(args.corpus))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    repeat = max(1, args.repeat)
+    python_results = bench_python_formatter(cases, repeat)
+    engine, qml_results = bench_qml_formatter(cases, repeat)
+    divergences = compare_formatters(cases, python_results, qml_results)
+    unexpected = [d for d in divergences if not d["known"]]
+
+    def timing(results: list) -> dict:
+        per_update = sorted(ns / 1000 for _, ns in results)
+        total_s = sum(per_update) / 1e6
+        return {
+            "meanUs": round(statistics.fmean(per_update), 2),
+            "p95Us": round(per_update[min(len(per_update) - 1, int(len(per_update) * 0.95))], 2),
+            "updatesPerS": round(len(per_update) / total_s) if total_s else None,
+        }
+
+    report = {
+        "records": len(cases),
+        "repeat": repeat,
+        "python": timing(python_results),
+        "qml": {"engine": engine, **timing(qml_results)},
+        "divergences": divergences,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print(f"Replayed {len(cases)} record(s) x {repeat}")
+        print(f"{'formatter':<22} {'mean us':>9} {'p95 us':>9} {'updates/s':>10}")
+        for label, stats in ((
+            "python (widgets)", report["python"]), (f"qml ({engine})", report["qml"])
+        ):
+            print(f"{label:<22} {stats['meanUs']:>9.2f} {stats['p95Us']:>9.2f} {stats['updatesPerS'] or 0:>10}")
+        for d in divergences:
+            tag = f"known: {d['known']}" if d["known"] else "DIVERGES"
+            print(f"  {d['module']}: {tag}")
+            for name, values in d["fields"].items():
+                print(f"    {name}: python={values['python']!r} qml={values['qml']!r}")
+        print(f"{len(divergences)} divergence(s), {len(unexpected)} unexpected")
+    if unexpected:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Waybar to Noctalia conversion service
+
+Keeps the converter loaded and answers conversion requests (newline-delimited
+JSON) over a Unix socket, for settings UIs that convert snippets
+interactively.
+
+Usage:
+    python waybar_serve.py [--socket PATH] [--cache-size N] [--allow-path DIR]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import copy
+import hashlib
+import io
+import json
+import os
+import signal
+import socket
+import stat
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Optional
+
+from waybar_to_noctalia import (
+    TransformResult,
+    build_arg_parser,
+    convert_config,
+    parse_waybar_config_text,
+    transform_cache,
+)
+
+
+DEFAULT_SERVE_CACHE_SIZE = 64
+SERVE_TRANSFORMS_PER_CONFIG = 32  # transform cache entries kept per --cache-size slot
+
+
+def default_socket_path() -> Path:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return Path(runtime_dir) / "waybar-converter.sock"
+
+
+def default_serve_roots() -> list[Path]:
+    config_home = os.environ.get("XDG_CONFIG_HOME") or str(Path.home() / ".config")
+    return [Path(config_home) / "waybar"]
+
+
+# Options a served conversion cannot honour: output goes into the response,
+# profiles and help would print to the server's stdout, and probing would run
+# the submitted commands on the server.
+SERVE_REJECTED_OPTIONS = (
+    "output_dir", "profile", "profile_json", "profile_stats",
+    "probe", "probe_apply", "probe_runs", "probe_timeout", "probe_sandbox", "help",
+)
+
+
+def options_to_argv(options: dict) -> list[str]:
+    """Turn a request's options object into CLI flags (``shared_runtime`` -> ``--shared-runtime``).
+
+    A list value repeats the flag once per element, for options such as
+    ``alert_module`` that may be given several times.
+    """
+    argv = []
+    for key, value in options.items():
+        flag = "--" + str(key).replace("_", "-")
+        for item in value if isinstance(value, list) else [value]:
+            if item is True:
+                argv.append(flag)
+            elif item is not False and item is not None:
+                argv.extend([flag, str(item)])
+    return argv
+
+
+class ConversionService:
+    """Request handling for ``serve``: warm parser and parse, transform and result caches.
+
+    Results are keyed by config text, normalized options and the content of
+    any event rules file, so repeated requests for the same snippet are
+    answered without converting again. Edited snippets still reuse the
+    transforms of their unchanged modules. Files (``path``, ``event_rules``)
+    are only read below ``roots``.
+    """
+
+    def __init__(self, cache_size: int = DEFAULT_SERVE_CACHE_SIZE, roots: Optional[list[Path]] = None) -> None:
+        self.parser = build_arg_parser()
+        # Abbreviations such as --prob would slip past SERVE_REJECTED_OPTIONS.
+        self.parser.allow_abbrev = False
+        self.cache_size = cache_size
+        self.roots = [root.expanduser().resolve() for root in (default_serve_roots() if roots is None else roots)]
+        self.parsed: OrderedDict[str, object] = OrderedDict()
+        self.results: OrderedDict[tuple, dict] = OrderedDict()
+        self.transforms: OrderedDict[tuple, TransformResult] = OrderedDict()
+
+    def _remember(self, cache: OrderedDict, key: object, value: object) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def parse_options(self, options: dict) -> argparse.Namespace:
+        if not isinstance(options, dict):
+            raise ValueError("options must be an object")
+        rejected = [key for key in options if str(key).replace("-", "_") in SERVE_REJECTED_OPTIONS]
+        if rejected:
+            raise ValueError(f"option(s) not supported by serve: {', '.join(map(str, rejected))}")
+        output = io.StringIO()
+        try:
+            with redirect_stdout(output), redirect_stderr(output):
+                return self.parser.parse_args(options_to_argv(options))
+        except SystemExit:
+            message = output.getvalue().strip().splitlines()
+            raise ValueError(message[-1] if message else "invalid options") from None
+
+    def read_allowed(self, name: str, value: object) -> bytes:
+        """Read a file named by a request, refusing anything outside ``roots``."""
+        path = Path(str(value)).expanduser().resolve()
+        if not any(path == root or root in path.parents for root in self.roots):
+            raise ValueError(f"{name} must be inside {', '.join(map(str, self.roots)) or 'an allowed directory'}")
+        try:
+            return path.read_bytes()
+        except OSError:
+            raise ValueError(f"cannot read {name} {value}") from None
+
+    def parse_config(self, text: str) -> tuple[str, object]:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        config = self.parsed.get(digest)
+        if config is None:
+            config = parse_waybar_config_text(text)
+            self._remember(self.parsed, digest, config)
+        else:
+            self.parsed.move_to_end(digest)
+        return digest, config
+
+    def convert(self, request: dict) -> dict:
+        if "config" in request:
+            text = request["config"]
+            if not isinstance(text, str):
+                text = json.dumps(text)
+        elif "path" in request:
+            text = self.read_allowed("path", request["path"]).decode("utf-8", errors="replace")
+        else:
+            raise ValueError("request needs 'config' (text or object) or 'path'")
+
+        args = self.parse_options(request.get("options") or {})
+        # The rules file is read again during conversion; keying on its
+        # content keeps cached results from outliving an edit.
+        rules = self.read_allowed("event_rules", args.event_rules) if args.event_rules else b""
+        digest, config = self.parse_config(text)
+        key = (digest, json.dumps(vars(args), sort_keys=True, default=str), hashlib.sha256(rules).hexdigest())
+        cached = self.results.get(key)
+        if cached is not None:
+            self.results.move_to_end(key)
+            return {**cached, "cached": True}
+
+        log = io.StringIO()
+        # XDG_RUNTIME_DIR is a tmpfs on most desktops, so the scratch output
+        # never touches disk.
+        scratch_root = os.environ.get("XDG_RUNTIME_DIR") or None
+        try:
+            with transform_cache(self.transforms), \
+                    tempfile.TemporaryDirectory(prefix="waybar-serve-", dir=scratch_root) as tmp:
+                output_dir = Path(tmp)
+                with redirect_stdout(log), redirect_stderr(log):
+                    modules, builtins = convert_config(copy.deepcopy(config), output_dir, args)
+                files = {
+                    path.relative_to(output_dir).as_posix(): path.read_text(encoding="utf-8")
+                    for path in sorted(output_dir.rglob("*"))
+                    if path.is_file()
+                }
+        finally:
+            while len(self.transforms) > self.cache_size * SERVE_TRANSFORMS_PER_CONFIG:
+                self.transforms.popitem(last=False)
+
+        warnings = json.loads(files.get("widget_warnings.json", "{}"))
+        result = {
+            "modules": [module.name for module in modules],
+            "builtins": [builtin.name for builtin in builtins],
+            "files": files,
+            "warnings": warnings,
+            "log": log.getvalue(),
+        }
+        self._remember(self.results, key, result)
+        return {**result, "cached": False}
+
+    def handle(self, line: bytes) -> dict:
+        started = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            request_id = request.get("id")
+            response = {"id": request_id, "ok": True, **self.convert(request)}
+        except (OSError, ValueError) as e:
+            # json.JSONDecodeError is a ValueError.
+            response = {"id": request_id, "ok": False, "error": str(e)}
+        except Exception as e:  # keep serving other requests
+            response = {"id": request_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+        response["elapsedMs"] = round((time.perf_counter() - started) * 1000, 3)
+        return response
+
+
+async def serve_client(
+    service: ConversionService,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    executor: ThreadPoolExecutor,
+) -> None:
+    """Answer newline-delimited JSON requests until the client disconnects."""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            # Conversions run on the single worker thread, so the loop keeps
+            # serving other clients meanwhile and the stdout/stderr
+            # redirection inside one never overlaps another. More threads
+            # would not convert faster: the work is pure Python under the GIL.
+            response = await loop.run_in_executor(executor, service.handle, line)
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def remove_stale_socket(socket_path: Path) -> None:
+    """Remove a socket left behind by a server that is no longer running.
+
+    Raises OSError if the path is not a socket or another server still
+    answers on it, rather than stealing its address.
+    """
+    try:
+        mode = socket_path.lstat().st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(f"{socket_path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(socket_path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        socket_path.unlink()
+        return
+    finally:
+        probe.close()
+    raise OSError(f"another server is already listening on {socket_path}")
+
+
+async def serve(
+    socket_path: Path, cache_size: int = DEFAULT_SERVE_CACHE_SIZE, roots: Optional[list[Path]] = None
+) -> None:
+    service = ConversionService(cache_size, roots)
+    remove_stale_socket(socket_path)
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="waybar-serve")
+    # Create the socket owner-only from the start instead of chmodding it
+    # after bind, when other users could already connect.
+    umask = os.umask(0o077)
+    try:
+        server = await asyncio.start_unix_server(
+            lambda reader, writer: serve_client(service, reader, writer, executor),
+            path=str(socket_path),
+            limit=16 * 1024 * 1024,
+        )
+    finally:
+        os.umask(umask)
+    print(f"Serving conversions on {socket_path}", flush=True)
+
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, lambda: stopped.done() or stopped.set_result(None))
+    try:
+        async with server:
+            await stopped
+    finally:
+        executor.shutdown(wait=False)
+        if socket_path.exists():
+            socket_path.unlink()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve conversion requests (newline-delimited JSON) over a Unix socket",
+    )
+    parser.add_argument(
+        "--socket",
+        default=str(default_socket_path()),
+        help="Socket path (default: $XDG_RUNTIME_DIR/waybar-converter.sock)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_SERVE_CACHE_SIZE,
+        help=f"Parsed configs and results to keep warm (default: {DEFAULT_SERVE_CACHE_SIZE})",
+    )
+    parser.add_argument(
+        "--allow-path",
+        metavar="DIR",
+        action="append",
+        help="Directory requests may read config and event rules files from; repeatable "
+        "(default: $XDG_CONFIG_HOME/waybar)",
+    )
+    args = parser.parse_args(argv)
+    roots = [Path(root) for root in args.allow_path] if args.allow_path else None
+    try:
+        asyncio.run(serve(Path(args.socket), args.cache_size, roots))
+    except OSError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
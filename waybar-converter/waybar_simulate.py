@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Waybar to Noctalia bar simulator
+
+Replays the scheduling of a converted bar (plugin manifests or widget JSON)
+on a virtual clock to estimate process spawns, CPU time, concurrency and
+staleness before the bar is deployed.
+
+Usage:
+    python waybar_simulate.py OUTPUT_DIR [--duration S] [--real] [--json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import random
+import re
+import statistics
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+
+from waybar_to_noctalia import (
+    PROBE_RUNS,
+    PROBE_TIMEOUT_S,
+    RestartPolicy,
+    run_probe_command,
+)
+
+
+SIM_DURATION_S = 3600
+SIM_STUB_WALL_MS = 5.0
+SIM_STUB_CPU_MS = 2.0
+
+
+@dataclass
+class SimTask:
+    """A converted module as the simulator schedules it."""
+    name: str
+    command: str
+    interval_s: float = 0.0
+    stream: bool = False
+    exec_if: str = ""
+    timeout_s: float = 0.0
+    restart_s: float = 0.0
+    click_refresh: bool = False
+    priority: int = 1
+    restart: RestartPolicy = field(default_factory=RestartPolicy)
+
+
+@dataclass
+class SimStats:
+    """What one module cost over a simulated run."""
+    name: str
+    forks: int = 0
+    skipped: int = 0
+    exec_if_skips: int = 0
+    timeouts: int = 0
+    restarts: int = 0
+    cpu_s: float = 0.0
+    busy_s: float = 0.0
+    overlap_s: float = 0.0
+    stale_s: list[float] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        stale = sorted(self.stale_s)
+        return {
+            "name": self.name,
+            "forks": self.forks,
+            "skipped": self.skipped,
+            "execIfSkips": self.exec_if_skips,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+            "cpuS": round(self.cpu_s, 3),
+            "busyS": round(self.busy_s, 3),
+            "overlapS": round(self.overlap_s, 3),
+            "staleMeanS": round(statistics.fmean(stale), 3) if stale else None,
+            "staleP95S": round(stale[min(len(stale) - 1, int(len(stale) * 0.95))], 3) if stale else None,
+            "staleMaxS": round(stale[-1], 3) if stale else None,
+        }
+
+
+def load_sim_tasks(path: Path) -> tuple[list[SimTask], int]:
+    """Read converter output back into tasks; returns them and the spawn budget.
+
+    Plugin manifests are preferred since they carry the scheduling settings
+    directly. Without plugins the per-module widget files are used, whose
+    commands already include the exec-if and timeout wrappers.
+    """
+    manifests = sorted(path.glob("plugins/*/manifest.json")) or sorted(path.glob("*/manifest.json"))
+    if path.name == "manifest.json":
+        manifests = [path]
+    tasks: list[SimTask] = []
+    budget = 0
+    for manifest_path in manifests:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            settings = json.load(f).get("metadata", {}).get("defaultSettings", {})
+        if not settings.get("textCommand") or settings.get("fileRead") or settings.get("sharedRole") == "consumer":
+            # File reads never fork and consumers reuse their source's runs.
+            continue
+        if settings.get("hyprland"):
+            continue  # driven by Hyprland events, which are not simulated
+        budget = max(budget, int(settings.get("spawnBudget") or 0))
+        tasks.append(SimTask(
+            name=re.sub(r"^waybar-", "", manifest_path.parent.name),
+            command=settings["textCommand"],
+            interval_s=float(settings.get("interval") or 0),
+            stream=settings.get("intervalMode") == "once",
+            exec_if=settings.get("execIf") or "",
+            timeout_s=(settings.get("timeoutMs") or 0) / 1000,
+            restart_s=(settings.get("restartIntervalMs") or 0) / 1000,
+            click_refresh=settings.get("execOnEvent", True) and any(
+                settings.get(key) for key in ("onClick", "onClickRight", "onClickMiddle")
+            ),
+            priority=int(settings.get("spawnPriority") or 1),
+            restart=RestartPolicy(
+                max_delay_ms=settings.get("restartBackoffMaxMs", RestartPolicy.max_delay_ms),
+                healthy_ms=settings.get("restartHealthyMs", RestartPolicy.healthy_ms),
+                max_failures=settings.get("restartMaxFailures", RestartPolicy.max_failures),
+            ),
+        ))
+    if manifests:
+        return tasks, budget
+
+    if path.is_dir():
+        widget_paths = sorted(path.glob("widgets/*.json")) or sorted(path.glob("*.json"))
+    else:
+        widget_paths = [path]
+    for widget_path in widget_paths:
+        with open(widget_path, "r", encoding="utf-8") as f:
+            widget = json.load(f)
+        if not isinstance(widget, dict) or not widget.get("textCommand"):
+            continue
+        tasks.append(SimTask(
+            name=widget_path.stem,
+            command=widget["textCommand"],
+            interval_s=(widget.get("textIntervalMs") or 0) / 1000,
+            stream=bool(widget.get("textStream")),
+            click_refresh=any(widget.get(f"{side}ClickUpdateText") for side in ("left", "right", "middle")),
+        ))
+    return tasks, 0
+
+
+def measure_sim_costs(tasks: list[SimTask], samples: int, timeout_s: float) -> dict[str, list[tuple[float, float, bool]]]:
+    """Run each polled command (and its exec-if) for real and keep the costs.
+
+    Returns (wall s, CPU s, succeeded) samples keyed by command. Streaming
+    commands do not exit, so they are left to the stub costs.
+    """
+    commands = {c for task in tasks if not task.stream for c in (task.command, task.exec_if) if c}
+    costs: dict[str, list[tuple[float, float, bool]]] = {}
+    for command in sorted(commands):
+        runs = []
+        for _ in range(max(1, samples)):
+            wall_ms, cpu_ms, _, code = run_probe_command(command, timeout_s)
+            runs.append((wall_ms / 1000, cpu_ms / 1000, code == 0))
+        costs[command] = runs
+    return costs
+
+
+class BarSimulator:
+    """Replays the plugin runner's scheduling against a virtual clock.
+
+    Poll ticks are skipped while the previous run is still going (the
+    ``textProc.running`` check), exec-if gates each run, timeouts cut runs
+    short, click refreshes jump the spawn budget queue, and streams restart
+    with the same backoff and circuit breaker as Main.qml. Source values
+    change at random; the time until a run started after a change finishes
+    is that change's stale-display latency.
+    """
+
+    def __init__(
+        self,
+        tasks: list[SimTask],
+        costs: Optional[dict[str, list[tuple[float, float, bool]]]] = None,
+        spawn_budget: int = 0,
+        stub_wall_ms: float = SIM_STUB_WALL_MS,
+        stub_cpu_ms: float = SIM_STUB_CPU_MS,
+        changes_per_hour: float = 60,
+        clicks_per_hour: float = 0,
+        stream_lifetime_s: float = 0,
+        seed: int = 0,
+    ) -> None:
+        self.rng = random.Random(seed)
+        self.tasks = tasks
+        self.costs = costs or {}
+        self.spawn_budget = spawn_budget
+        self.stub = (stub_wall_ms / 1000, stub_cpu_ms / 1000, True)
+        self.changes_per_hour = changes_per_hour
+        self.clicks_per_hour = clicks_per_hour
+        self.stream_lifetime_s = stream_lifetime_s
+        self.stats = {task.name: SimStats(task.name) for task in tasks}
+        self.events: list = []
+        self.seq = 0
+        self.now = 0.0
+        self.running: set[str] = set()
+        self.queue: list = []
+        self.queued: dict[str, tuple[int, int]] = {}  # name -> (priority, seq) of its live queue entry
+        self.in_flight = 0
+        self.pending: dict[str, list[float]] = {task.name: [] for task in tasks}
+        self.stream_up: dict[str, bool] = {}
+        self.stream_started: dict[str, float] = {}
+        self.stream_failures: dict[str, int] = {}
+        self.runs: list[tuple[float, float, str]] = []
+
+    def at(self, when: float, action, *args) -> None:
+        self.seq += 1
+        heapq.heappush(self.events, (when, self.seq, action, args))
+
+    def cost(self, command: str) -> tuple[float, float, bool]:
+        samples = self.costs.get(command)
+        return self.rng.choice(samples) if samples else self.stub
+
+    def poisson(self, per_hour: float, duration_s: float) -> Iterable[float]:
+        if per_hour <= 0:
+            return
+        t = self.rng.expovariate(per_hour / 3600)
+        while t < duration_s:
+            yield t
+            t += self.rng.expovariate(per_hour / 3600)
+
+    def run(self, duration_s: float = SIM_DURATION_S) -> dict[str, SimStats]:
+        for task in self.tasks:
+            if task.stream:
+                self.at(0.0, self.start_stream, task)
+            else:
+                self.at(0.0, self.request, task, False)
+                if task.interval_s > 0:
+                    self.at(task.interval_s, self.tick, task)
+            for t in self.poisson(self.changes_per_hour, duration_s):
+                self.at(t, self.change, task)
+            if task.click_refresh:
+                for t in self.poisson(self.clicks_per_hour, duration_s):
+                    self.at(t, self.click, task)
+        while self.events and self.events[0][0] <= duration_s:
+            self.now, _, action, args = heapq.heappop(self.events)
+            action(*args)
+        for name, changes in self.pending.items():
+            # Still stale when the clock stops; counted as at least this long.
+            self.stats[name].stale_s.extend(duration_s - t for t in changes)
+        self.measure_overlap(duration_s)
+        return self.stats
+
+    def tick(self, task: SimTask) -> None:
+        self.request(task, False)
+        self.at(self.now + task.interval_s, self.tick, task)
+
+    def click(self, task: SimTask) -> None:
+        stats = self.stats[task.name]
+        stats.forks += 1
+        wall, cpu, _ = self.stub
+        stats.cpu_s += cpu
+        self.runs.append((self.now, self.now + wall, task.name))
+        if not task.stream:
+            self.request(task, True)
+
+    def change(self, task: SimTask) -> None:
+        if task.stream and self.stream_up.get(task.name):
+            self.stats[task.name].stale_s.append(0.0)
+        else:
+            self.pending[task.name].append(self.now)
+
+    def request(self, task: SimTask, urgent: bool) -> None:
+        priority = 0 if urgent else task.priority
+        if task.name in self.queued and priority < self.queued[task.name][0]:
+            # SpawnBudget moves an already-queued run up, keeping its age;
+            # the old heap entry goes stale and is dropped when popped.
+            entry = (priority, self.queued[task.name][1])
+            self.queued[task.name] = entry
+            heapq.heappush(self.queue, (*entry, task))
+            return
+        if task.name in self.running or task.name in self.queued:
+            self.stats[task.name].skipped += 1
+            return
+        if self.spawn_budget > 0 and self.in_flight >= self.spawn_budget:
+            self.queued[task.name] = (priority, self.seq)
+            heapq.heappush(self.queue, (priority, self.seq, task))
+            self.seq += 1
+            return
+        self.launch(task)
+
+    def launch(self, task: SimTask) -> None:
+        stats = self.stats[task.name]
+        self.running.add(task.name)
+        self.in_flight += 1
+        wall, cpu, updated = 0.0, 0.0, True
+        stats.forks += 1
+        if task.exec_if:
+            stats.forks += 1
+            wall, cpu, updated = self.cost(task.exec_if)
+            if not updated:
+                stats.exec_if_skips += 1
+        if updated:
+            run_wall, run_cpu, _ = self.cost(task.command)
+            wall, cpu = wall + run_wall, cpu + run_cpu
+            if task.timeout_s and wall > task.timeout_s:
+                cpu *= task.timeout_s / wall
+                wall = task.timeout_s
+                stats.timeouts += 1
+                updated = False
+        stats.cpu_s += cpu
+        stats.busy_s += wall
+        self.runs.append((self.now, self.now + wall, task.name))
+        self.at(self.now + wall, self.finish, task, self.now, updated)
+
+    def finish(self, task: SimTask, started: float, updated: bool) -> None:
+        self.running.discard(task.name)
+        self.in_flight -= 1
+        if updated:
+            pending = self.pending[task.name]
+            self.stats[task.name].stale_s.extend(self.now - t for t in pending if t <= started)
+            self.pending[task.name] = [t for t in pending if t > started]
+        while self.queue and (self.spawn_budget <= 0 or self.in_flight < self.spawn_budget):
+            priority, seq, queued = heapq.heappop(self.queue)
+            if self.queued.get(queued.name) != (priority, seq):
+                continue  # superseded by a promotion
+            del self.queued[queued.name]
+            self.launch(queued)
+            break
+
+    def start_stream(self, task: SimTask) -> None:
+        stats = self.stats[task.name]
+        stats.forks += 1
+        wall, cpu, _ = self.stub
+        stats.cpu_s += cpu
+        self.stream_started[task.name] = self.now
+        self.at(self.now + wall, self.stream_ready, task)
+        if self.stream_lifetime_s > 0:
+            self.at(self.now + self.stream_lifetime_s, self.stream_exit, task)
+
+    def stream_ready(self, task: SimTask) -> None:
+        self.stream_up[task.name] = True
+        self.stats[task.name].stale_s.extend(self.now - t for t in self.pending[task.name])
+        self.pending[task.name] = []
+
+    def stream_exit(self, task: SimTask) -> None:
+        self.stream_up[task.name] = False
+        if task.restart_s <= 0:
+            return
+        policy = task.restart
+        if (self.now - self.stream_started[task.name]) * 1000 >= policy.healthy_ms:
+            failures = 0
+        else:
+            failures = self.stream_failures.get(task.name, 0) + 1
+        self.stream_failures[task.name] = failures
+        if policy.max_failures > 0 and failures >= policy.max_failures:
+            return
+        delay_ms = max(500, task.restart_s * 1000) * 2 ** max(0, failures - 1)
+        delay_ms = min(delay_ms, max(500, policy.max_delay_ms)) * self.rng.uniform(0.8, 1.2)
+        self.stats[task.name].restarts += 1
+        self.at(self.now + delay_ms / 1000, self.start_stream, task)
+
+    def measure_overlap(self, duration_s: float) -> None:
+        """Credit each module with the time its runs shared with other modules' runs."""
+        edges = []
+        for start, end, name in self.runs:
+            edges.append((start, 1, name))
+            edges.append((min(end, duration_s), -1, name))
+        edges.sort(key=lambda edge: (edge[0], edge[1]))
+        active: dict[str, int] = {}
+        last = 0.0
+        self.peak_concurrency = 0
+        for when, delta, name in edges:
+            if sum(active.values()) >= 2:
+                for running in active:
+                    self.stats[running].overlap_s += when - last
+            last = when
+            active[name] = active.get(name, 0) + delta
+            if not active[name]:
+                del active[name]
+            self.peak_concurrency = max(self.peak_concurrency, sum(active.values()))
+
+
+def format_sim_report(stats: list[SimStats], duration_s: float, peak: int) -> str:
+    lines = [
+        f"Simulated {duration_s / 60:g} min; peak concurrent commands: {peak}",
+        f"{'module':<18} {'forks':>6} {'skipped':>7} {'timeouts':>8} {'cpu s':>8} {'busy s':>8} "
+        f"{'overlap s':>9} {'stale avg/p95/max s':>22}",
+    ]
+    for entry in stats:
+        d = entry.to_dict()
+        stale = "-" if d["staleMeanS"] is None else f"{d['staleMeanS']:.1f}/{d['staleP95S']:.1f}/{d['staleMaxS']:.1f}"
+        lines.append(
+            f"{entry.name[:18]:<18} {entry.forks:>6} {entry.skipped:>7} {entry.timeouts:>8} "
+            f"{entry.cpu_s:>8.2f} {entry.busy_s:>8.2f} {entry.overlap_s:>9.2f} {stale:>22}"
+        )
+    lines.append(
+        f"{'total':<18} {sum(s.forks for s in stats):>6} {sum(s.skipped for s in stats):>7} "
+        f"{sum(s.timeouts for s in stats):>8} {sum(s.cpu_s for s in stats):>8.2f} {sum(s.busy_s for s in stats):>8.2f}"
+    )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Estimate what a converted bar costs by replaying its scheduling on a virtual clock",
+    )
+    parser.add_argument("path", help="Converter output directory, a plugin manifest.json or a widget JSON file")
+    parser.add_argument("--duration", type=float, default=SIM_DURATION_S, help=f"Simulated seconds (default: {SIM_DURATION_S})")
+    parser.add_argument("--real", action="store_true", help="Time the real polled commands (and exec-if checks) instead of stub costs (Linux only)")
+    parser.add_argument("--samples", type=int, default=PROBE_RUNS, help=f"Real runs per command with --real (default: {PROBE_RUNS})")
+    parser.add_argument("--stub-ms", type=float, default=SIM_STUB_WALL_MS, help=f"Wall time of a stub command run (default: {SIM_STUB_WALL_MS:g})")
+    parser.add_argument("--stub-cpu-ms", type=float, default=SIM_STUB_CPU_MS, help=f"CPU time of a stub command run (default: {SIM_STUB_CPU_MS:g})")
+    parser.add_argument("--changes-per-hour", type=float, default=60, help="How often each module's source value changes (default: 60)")
+    parser.add_argument("--clicks-per-hour", type=float, default=0, help="Clicks per module with click refresh (default: 0)")
+    parser.add_argument("--stream-lifetime", type=float, default=0, help="Seconds before each stream exits and restarts (default: 0, never)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for changes, clicks and cost sampling")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        tasks, budget = load_sim_tasks(Path(args.path))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not tasks:
+        print(f"No command-running modules found in {args.path}")
+        sys.exit(1)
+
+    costs = None
+    if args.real:
+        if not sys.platform.startswith("linux"):
+            parser.error("--real is only supported on Linux")
+        if not args.json:
+            print(f"Timing {len(tasks)} module(s) ({args.samples} run(s) each)...")
+        costs = measure_sim_costs(tasks, args.samples, PROBE_TIMEOUT_S)
+
+    simulator = BarSimulator(
+        tasks,
+        costs,
+        spawn_budget=budget,
+        stub_wall_ms=args.stub_ms,
+        stub_cpu_ms=args.stub_cpu_ms,
+        changes_per_hour=args.changes_per_hour,
+        clicks_per_hour=args.clicks_per_hour,
+        stream_lifetime_s=args.stream_lifetime,
+        seed=args.seed,
+    )
+    stats = list(simulator.run(args.duration).values())
+    if args.json:
+        print(json.dumps({
+            "durationS": args.duration,
+            "spawnBudget": budget,
+            "peakConcurrency": simulator.peak_concurrency,
+            "modules": [entry.to_dict() for entry in stats],
+        }, indent=2))
+    else:
+        print(format_sim_report(stats, args.duration, simulator.peak_concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,15 +18,81 @@ from __future__ import annotations
 
 import argparse
 import base64
+import cProfile
+import glob
 import json
+import math
+import os
+import re
 import shlex
+import shutil
+import signal
+import statistics
+import subprocess
 import sys
-from dataclasses import dataclass, field
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import Iterable, Optional
+from types import MappingProxyType
+from typing import Iterable, NamedTuple, Optional
 
 
 DEFAULT_WAYBAR_INTERVAL = 60
+MIN_COMMAND_TIMEOUT_MS = 1000
+MAX_COMMAND_TIMEOUT_MS = 300000
+DEFAULT_IDLE_PAUSE_S = 600
+DEFAULT_MAX_UPDATE_RATE = 20  # streamed lines applied per second
+STDERR_LOG_WINDOW_MS = 10000  # plugin stderr forwarding: per-window budget
+STDERR_LOG_LINES = 10  # stderr lines logged per window
+NICE_PREFIX = ["nice", "-n", "10", "ionice", "-c", "3"]  # background modules
+POWER_HINT_MAX_INTERVAL = 10  # widget hints only flag pollers at or below this
+
+BUILTIN_MODULE_KINDS = ("cpu", "memory", "battery", "clock", "network", "pulseaudio")
+
+# Waybar's own defaults when a built-in module omits interval/format.
+BUILTIN_DEFAULT_INTERVALS = {"cpu": 10, "memory": 30, "battery": 60, "clock": 60, "network": 60}
+BUILTIN_DEFAULT_FORMATS = {
+    "cpu": "{usage}%",
+    "memory": "{percentage}%",
+    "battery": "{capacity}%",
+    "clock": "{:%H:%M}",
+    "network": "{ifname}",
+    "pulseaudio": "{volume}%",
+}
+
+# Native Noctalia bar widgets used for `--mode widgets`.
+BUILTIN_NATIVE_WIDGETS = {
+    "cpu": {"type": "SystemMonitor", "showCpuUsage": True},
+    "memory": {"type": "SystemMonitor", "showMemoryUsage": True},
+    "battery": {"type": "Battery"},
+    "clock": {"type": "Clock"},
+    "network": {"type": "WiFi"},
+    "pulseaudio": {"type": "Volume"},
+}
+
+STRFTIME_TO_QT = {
+    "H": "HH", "k": "H", "M": "mm", "S": "ss", "I": "hh", "l": "h", "p": "AP",
+    "A": "dddd", "a": "ddd", "B": "MMMM", "b": "MMM", "h": "MMM", "d": "dd",
+    "e": "d", "m": "MM", "Y": "yyyy", "y": "yy", "Z": "t", "R": "HH:mm",
+    "T": "HH:mm:ss", "F": "yyyy-MM-dd", "D": "MM/dd/yy",
+}
+
+# Characters that only mean something to a shell: operators, redirects,
+# expansions, globbing and grouping. Any of these outside single quotes (or
+# `$`/backtick inside double quotes) forces the command through `sh -c`.
+SHELL_METACHARS = set("|&;<>()$`*?[]{}~!#\n")
+SHELL_BUILTINS = {
+    ".", ":", "[", "[[", "alias", "case", "cd", "command", "eval", "exec",
+    "export", "for", "if", "read", "set", "source", "trap", "ulimit",
+    "umask", "unset", "until", "wait", "while",
+}
 
 
 @dataclass
@@ -55,6 +121,131 @@ class WaybarModule:
     escape: bool = False
     exec_on_event: bool = True
     restart_interval: Optional[int] = None
+    timeout_ms: int = 0
+    shared_source: str = ""  # name of the module whose runner this one shares
+    shared_consumers: list = field(default_factory=list)  # set on the leader only
+    probe: Optional[ProbeResult] = None  # set by --probe
+    always_poll: bool = False  # alerting module: keep polling while hidden
+    event_rule: str = ""  # set when a poll module was rewritten to event-driven
+    polled_exec: str = ""  # the original exec of a rewritten module
+    event_requires: list = field(default_factory=list)  # programs the event source needs at runtime
+    patch_stream: bool = False  # stream lines may be {"$patch": true, ...} partial updates
+    hyprland: Optional[HyprlandQuery] = None  # set by --hyprland-provider
+
+    @property
+    def shared_role(self) -> str:
+        if not self.shared_source:
+            return ""
+        return "leader" if self.shared_source == self.name else "consumer"
+
+
+class ModuleRecord(NamedTuple):
+    """Immutable, tuple-backed copy of a parsed custom module for bulk analysis.
+
+    Fields mirror :class:`WaybarModule` minus the converter-time state
+    (probe results, rewrites, runtime options). Built through a
+    :class:`ModuleInterner`, equal strings and format-icon lists are shared
+    between records, so loading the same module from many hosts costs little
+    more than the tuple itself.
+    """
+    name: str
+    source: str
+    exec_cmd: str
+    exec_if: str
+    interval: Optional[int]
+    interval_mode: str
+    interval_defaulted: bool
+    interval_signal_override: bool
+    signal: Optional[int]
+    format: str
+    format_icons: object  # tuple, or a read-only mapping for per-state icons
+    return_type: str
+    max_length: Optional[int]
+    min_length: Optional[int]
+    tooltip: bool
+    on_click: str
+    on_click_middle: str
+    on_click_right: str
+    on_scroll_up: str
+    on_scroll_down: str
+    escape: bool
+    exec_on_event: bool
+    restart_interval: Optional[int]
+    timeout_ms: int
+    shared_source: str
+    shared_consumers: tuple  # set on the leader only
+
+    @classmethod
+    def from_module(cls, module: WaybarModule, interner: "ModuleInterner") -> "ModuleRecord":
+        return cls._make(
+            interner.icons(getattr(module, name)) if name in ("format_icons", "shared_consumers")
+            else interner.text(getattr(module, name))
+            for name in cls._fields
+        )
+
+    def to_module(self) -> WaybarModule:
+        values = self._asdict()
+        values["format_icons"] = thaw_icons(self.format_icons)
+        values["shared_consumers"] = list(self.shared_consumers)
+        return WaybarModule(**values)
+
+
+def thaw_icons(value: object) -> object:
+    if isinstance(value, MappingProxyType):
+        return {key: thaw_icons(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw_icons(item) for item in value]
+    return value
+
+
+class ModuleInterner:
+    """Hands out one shared object per distinct string or format-icon list."""
+
+    def __init__(self) -> None:
+        self.icon_lists: dict[tuple, tuple] = {}
+        self.icon_maps: dict[str, MappingProxyType] = {}
+
+    def text(self, value: object) -> object:
+        return sys.intern(value) if type(value) is str else value
+
+    def icons(self, value: object) -> object:
+        if isinstance(value, dict):
+            key = json.dumps(value, sort_keys=True)
+            frozen = self.icon_maps.get(key)
+            if frozen is None:
+                frozen = self.icon_maps[key] = MappingProxyType(
+                    {self.text(k): self.icons(v) for k, v in value.items()}
+                )
+            return frozen
+        if isinstance(value, (list, tuple)):
+            frozen = tuple(self.icons(item) for item in value)
+            return self.icon_lists.setdefault(frozen, frozen)
+        return self.text(value)
+
+
+@dataclass
+class BuiltinModule:
+    """Represents a parsed Waybar built-in module (cpu, memory, battery, ...)."""
+    name: str
+    kind: str
+    source: str
+    interval: int = 0
+    format: str = ""
+    format_alt: str = ""
+    formats: dict = field(default_factory=dict)  # "format-<variant>" -> format
+    format_icons: object = field(default_factory=list)  # list, or dict of lists
+    states: dict = field(default_factory=dict)
+    tooltip: bool = True
+    tooltip_format: str = ""
+    tooltip_formats: dict = field(default_factory=dict)
+    max_length: Optional[int] = None
+    on_click: str = ""
+    on_click_middle: str = ""
+    on_click_right: str = ""
+    on_scroll_up: str = ""
+    on_scroll_down: str = ""
+    exec_on_event: bool = True
+    options: dict = field(default_factory=dict)  # kind-specific (bat, interface, ...)
 
 
 @dataclass
@@ -109,11 +300,151 @@ class NoctaliaWidgetConfig:
         return data
 
 
+@dataclass
+class FileReadSpec:
+    """A command that only reads a /sys or /proc file, compiled to a file read."""
+    path: str
+    op: str = "cat"  # "cat", "head" or "awk"
+    lines: Optional[int] = None  # head -n
+    fields: list[int] = field(default_factory=list)  # awk $N (0 = whole line)
+    separator: str = ""  # awk -F; empty means whitespace
+
+    def to_dict(self) -> dict:
+        data: dict[str, object] = {"path": self.path, "op": self.op}
+        if self.lines is not None:
+            data["lines"] = self.lines
+        if self.fields:
+            data["fields"] = list(self.fields)
+        if self.separator:
+            data["separator"] = self.separator
+        return data
+
+
+@dataclass
+class ProbeResult:
+    """Measurements from running a module's command at conversion time."""
+    runs: int = 0
+    wall_ms: list[float] = field(default_factory=list)
+    cpu_ms: list[float] = field(default_factory=list)
+    output_bytes: int = 0  # largest output seen
+    distinct_outputs: int = 0
+    timed_out: int = 0
+    exit_codes: list[int] = field(default_factory=list)
+    skipped: str = ""
+    recommended_interval: Optional[int] = None
+    recommended_timeout_ms: Optional[int] = None
+    notes: list[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        if self.skipped:
+            return {"skipped": self.skipped}
+        data: dict[str, object] = {
+            "runs": self.runs,
+            "wallMs": self.wall_ms,
+            "cpuMs": self.cpu_ms,
+            "outputBytes": self.output_bytes,
+            "distinctOutputs": self.distinct_outputs,
+        }
+        if self.timed_out:
+            data["timedOut"] = self.timed_out
+        if self.recommended_interval is not None:
+            data["recommendedInterval"] = self.recommended_interval
+            data["recommendedTimeoutMs"] = self.recommended_timeout_ms
+        if self.notes:
+            data["notes"] = list(self.notes)
+        return data
+
+
+@dataclass
+class PowerPolicy:
+    """Poll interval multipliers applied by plugins while running on battery.
+
+    Scaling is opt-in: at the default of 1 plugins carry no power code.
+    """
+    battery_scale: float = 1.0
+    low_battery_scale: float = 1.0
+    low_battery_percent: int = 20
+
+    @property
+    def active(self) -> bool:
+        return max(self.battery_scale, self.low_battery_scale) > 1
+
+    def to_settings(self) -> dict:
+        return {
+            "batteryIntervalScale": self.battery_scale,
+            "lowBatteryIntervalScale": self.low_battery_scale,
+            "lowBatteryPercent": self.low_battery_percent,
+        }
+
+    def to_hint(self, interval: int) -> dict:
+        return {
+            "acInterval": interval,
+            "batteryInterval": math.ceil(interval * max(1.0, self.battery_scale)),
+            "lowBatteryInterval": math.ceil(interval * max(1.0, self.low_battery_scale)),
+            "lowBatteryPercent": self.low_battery_percent,
+        }
+
+
+@dataclass
+class OutputLimits:
+    """Per-module caps on what a runner keeps from one command run."""
+    stdout_bytes: int = 64 * 1024  # longer output is read and discarded
+    stderr_bytes: int = 4096  # stderr logged per window (see STDERR_LOG_WINDOW_MS)
+    tooltip_chars: int = 4096
+
+    def to_settings(self) -> dict:
+        return {
+            "maxOutputBytes": self.stdout_bytes,
+            "maxStderrBytes": self.stderr_bytes,
+            "maxTooltipChars": self.tooltip_chars,
+        }
+
+
+@dataclass
+class RestartPolicy:
+    """Backoff for streaming commands that keep exiting."""
+    max_delay_ms: int = 60000  # backoff cap
+    healthy_ms: int = 30000  # uptime after which the failure count resets
+    max_failures: int = 8  # quick exits in a row before giving up; 0 = never
+
+    def to_settings(self) -> dict:
+        return {
+            "restartBackoffMaxMs": self.max_delay_ms,
+            "restartHealthyMs": self.healthy_ms,
+            "restartMaxFailures": self.max_failures,
+        }
+
+
+@dataclass
+class EventRule:
+    """Turns a polled command into a re-read driven by an event stream."""
+    name: str
+    match: str  # regex searched for in the module's exec
+    events: str  # long-running command printing a line per change
+    filter: str = ""  # only event lines matching this ERE (grep -E) trigger a re-read
+    requires: list[str] = field(default_factory=list)  # programs that must exist
+
+    def __post_init__(self) -> None:
+        self.pattern = re.compile(self.match)
+
+
+@dataclass
+class HyprlandQuery:
+    """A hyprctl read served by the shared HyprlandProvider singleton."""
+    query: str  # request written to Hyprland's socket, e.g. "j/activewindow"
+    events: list[str]  # event names after which the answer can change
+    direct: bool = True  # the provider's answer is the module output (no pipe)
+
+    def to_dict(self) -> dict:
+        return {"query": self.query, "events": list(self.events), "direct": self.direct}
+
+
 @dataclass
 class TransformResult:
     command: str
     parse_json: bool
     warnings: list[str] = field(default_factory=list)
+    file_read: Optional[FileReadSpec] = None
 
 
 def remove_trailing_commas(content: str) -> str:
@@ -200,16 +531,20 @@ def strip_jsonc_comments(content: str) -> str:
     return remove_trailing_commas(cleaned)
 
 
+def parse_waybar_config_text(content: str) -> object:
+    """Parse Waybar JSONC text; raises json.JSONDecodeError on bad input."""
+    return json.loads(strip_jsonc_comments(content))
+
+
 def parse_waybar_config(config_path: Path) -> object:
     """Parse a Waybar JSONC configuration file."""
     with open(config_path, "r", encoding="utf-8") as f:
         content = f.read()
 
-    clean_json = strip_jsonc_comments(content)
-
     try:
-        return json.loads(clean_json)
+        return parse_waybar_config_text(content)
     except json.JSONDecodeError as e:
+        clean_json = strip_jsonc_comments(content)
         print(f"Error parsing Waybar config: {e}")
         print(f"Problematic content near position {e.pos}:")
         start = max(0, e.pos - 50)
@@ -249,8 +584,29 @@ def normalize_interval(raw_value: object, default_interval: int) -> tuple[str, i
     return "poll", parsed, False
 
 
+def resolve_timeout_ms(
+    interval_mode: str, interval: Optional[int], command_timeout: Optional[float] = None
+) -> int:
+    """Derive a per-run command timeout from the poll interval.
+
+    A poll command that is still running when its next tick is due is treated as
+    hung, so the timeout defaults to one interval (clamped). Streaming modules are
+    long-running by design and get no timeout. An explicit ``command_timeout``
+    in seconds overrides the derived value; ``0`` disables timeouts.
+    """
+    if interval_mode != "poll":
+        return 0
+    if command_timeout is not None:
+        return max(0, int(command_timeout * 1000))
+    interval_ms = (interval or DEFAULT_WAYBAR_INTERVAL) * 1000
+    return max(MIN_COMMAND_TIMEOUT_MS, min(interval_ms, MAX_COMMAND_TIMEOUT_MS))
+
+
 def extract_custom_modules(
-    config: object, default_interval: int, signal_poll_interval: int
+    config: object,
+    default_interval: int,
+    signal_poll_interval: int,
+    command_timeout: Optional[float] = None,
 ) -> list[WaybarModule]:
     """Extract custom modules from Waybar config."""
     modules: list[WaybarModule] = []
@@ -290,10 +646,27 @@ def extract_custom_modules(
                 module.interval_mode = interval_mode
                 module.interval = interval
                 module.interval_defaulted = defaulted
+                module.timeout_ms = resolve_timeout_ms(interval_mode, interval, command_timeout)
 
                 modules.append(module)
 
-    return dedupe_modules(modules)
+    return assign_shared_sources(dedupe_modules(modules))
+
+
+def extract_module_records(
+    config: object,
+    default_interval: int,
+    signal_poll_interval: int,
+    interner: ModuleInterner,
+    command_timeout: Optional[float] = None,
+) -> list[ModuleRecord]:
+    """Extract custom modules as compact :class:`ModuleRecord` tuples.
+
+    The records share strings and icon lists with every other record built
+    through the same ``interner``.
+    """
+    modules = extract_custom_modules(config, default_interval, signal_poll_interval, command_timeout)
+    return [ModuleRecord.from_module(module, interner) for module in modules]
 
 
 def dedupe_modules(modules: list[WaybarModule]) -> list[WaybarModule]:
@@ -307,109 +680,685 @@ def dedupe_modules(modules: list[WaybarModule]) -> list[WaybarModule]:
     return modules
 
 
+def shared_source_key(module: WaybarModule) -> Optional[tuple]:
+    """Key under which modules produce identical raw output, or None."""
+    if not module.exec_cmd:
+        return None
+    return (module.exec_cmd, module.exec_if, module.interval_mode, module.interval)
+
+
+def assign_shared_sources(modules: list[WaybarModule]) -> list[WaybarModule]:
+    """Group modules that run the same command so they can share one runner.
+
+    Multi-bar configs repeat modules per monitor, and several modules often
+    run the same `exec` with different formats. The first module of each
+    group becomes the leader; the rest consume its raw output.
+    """
+    leaders: dict[tuple, WaybarModule] = {}
+    for module in modules:
+        key = shared_source_key(module)
+        if key is None:
+            continue
+        leader = leaders.setdefault(key, module)
+        if leader is module:
+            continue
+        leader.shared_source = leader.name
+        leader.shared_consumers.append(module.name)
+        module.shared_source = leader.name
+    return modules
+
+
+HYPRLAND_EVENT_SOCKET = '"$XDG_RUNTIME_DIR/hypr/$HYPRLAND_INSTANCE_SIGNATURE/.socket2.sock"'
+
+DEFAULT_EVENT_RULES = (
+    EventRule(
+        name="playerctl",
+        match=r"^\s*playerctl\b(?=.*\s(?:metadata|status)\b)(?!.*\s(?:-F|--follow)\b)"
+        r"(?!.*\s(?:play|pause|play-pause|stop|next|previous|position|volume|open|shuffle|loop)\b)",
+        events="playerctl --follow metadata --format '{{status}} {{playerName}} {{title}}'",
+        requires=["playerctl"],
+    ),
+    EventRule(
+        name="pulseaudio",
+        match=r"^\s*(?:pactl\s+(?:get-sink-(?:volume|mute)|get-default-sink|list\s+sinks)"
+        r"|pamixer\s+(?:--(?:sink|source)\s+\S+\s+)?--get-(?:volume(?:-human)?|mute)\b|wpctl\s+get-volume\b)",
+        events="pactl subscribe",
+        filter=r"on (sink|server)",
+        requires=["pactl"],
+    ),
+    EventRule(
+        name="networkmanager",
+        match=r"^\s*nmcli\b(?!.*\bmonitor\b)"
+        r"(?!.*\s(?:up|down|on|off|connect|disconnect|add|modify|delete|reload|rescan|set|edit)\b)",
+        events="nmcli monitor",
+        requires=["nmcli"],
+    ),
+    EventRule(
+        name="hyprland",
+        match=r"^\s*hyprctl\s+(?:-j\s+)?(?:activewindow|activeworkspace|workspaces|monitors)\b",
+        events=f"socat -u UNIX-CONNECT:{HYPRLAND_EVENT_SOCKET} -",
+        filter=r"^(activewindow|workspace|focusedmon|monitor|createworkspace|destroyworkspace)",
+        requires=["socat", "hyprctl"],
+    ),
+)
+
+EVENT_RESTART_INTERVAL = 5  # seconds before a dead event source is restarted
+
+
+def load_event_rules(path: Path) -> list[EventRule]:
+    """Read user rewrite rules: a JSON(C) list of EventRule objects."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.loads(strip_jsonc_comments(f.read()))
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a list of rules")
+    rules = []
+    for index, entry in enumerate(data):
+        if not isinstance(entry, dict) or not all(isinstance(entry.get(key), str) for key in ("name", "match", "events")):
+            raise ValueError(f"{path}: rule {index} needs string 'name', 'match' and 'events'")
+        try:
+            rules.append(EventRule(
+                name=entry["name"],
+                match=entry["match"],
+                events=entry["events"],
+                filter=entry.get("filter", ""),
+                requires=list(entry.get("requires", [])),
+            ))
+        except re.error as e:
+            raise ValueError(f"{path}: rule {entry['name']}: bad regex: {e}") from None
+    return rules
+
+
+def event_wrapper(command: str, rule: EventRule, interval: int = DEFAULT_WAYBAR_INTERVAL) -> str:
+    """Shell command that prints ``command`` once, then again per event.
+
+    Streams are read line by line, so each run's output is joined into one
+    line (newlines in pretty-printed JSON are whitespace, so JSON stays
+    valid). The rule's ``requires`` are checked where the plugin runs, not
+    where it was converted: without them ``command`` is polled every
+    ``interval`` seconds as before.
+    """
+    run = f"{{ {command}; }} </dev/null | paste -sd ' ' -"
+    source = rule.events
+    if rule.filter:
+        source += f" | grep --line-buffered -E {shlex.quote(rule.filter)}"
+    events = f"{run}; {source} | while read -r _; do {run}; done"
+    if not rule.requires:
+        return events
+    check = " && ".join(f"command -v {shlex.quote(program)} >/dev/null" for program in rule.requires)
+    return f"if {check}; then {events}; else while :; do {run}; sleep {interval}; done; fi"
+
+
+def rewrite_polls_to_events(
+    modules: list[WaybarModule], rules: Iterable[EventRule] = DEFAULT_EVENT_RULES
+) -> list[WaybarModule]:
+    """Switch poll modules whose command has a native event source to streaming.
+
+    The first matching rule wins, so user rules should come before the
+    defaults. Modules already compiled to file reads (those never fork) or
+    routed to the Hyprland provider are left alone.
+    """
+    for module in modules:
+        if module.interval_mode != "poll" or not module.exec_cmd or module.event_rule or module.hyprland:
+            continue
+        if transform_command(module).file_read:
+            continue
+        rule = next((rule for rule in rules if rule.pattern.search(module.exec_cmd)), None)
+        if rule is None:
+            continue
+        module.polled_exec = module.exec_cmd
+        module.exec_cmd = event_wrapper(module.exec_cmd, rule, module.interval or DEFAULT_WAYBAR_INTERVAL)
+        module.event_rule = rule.name
+        module.event_requires = list(rule.requires)
+        module.interval_mode = "once"
+        module.timeout_ms = 0
+        if module.restart_interval is None:
+            module.restart_interval = EVENT_RESTART_INTERVAL
+    return modules
+
+
+def forks_avoided_per_hour(module: WaybarModule) -> int:
+    """Poll runs per hour a rewritten module no longer makes (before events)."""
+    if not module.event_rule or not module.interval:
+        return 0
+    return 3600 // module.interval
+
+
+# hyprctl reads the provider can serve, with the Hyprland events after which
+# their answer can change. Every query is also refreshed on "configreloaded".
+HYPRCTL_QUERY_EVENTS = {
+    "activewindow": ["activewindow", "activewindowv2", "windowtitle", "windowtitlev2", "closewindow",
+                     "movewindow", "movewindowv2", "fullscreen", "changefloatingmode", "pin",
+                     "workspace", "workspacev2", "focusedmon", "focusedmonv2"],
+    "activeworkspace": ["workspace", "workspacev2", "focusedmon", "focusedmonv2", "renameworkspace",
+                        "openwindow", "closewindow", "movewindow", "movewindowv2", "fullscreen",
+                        "activewindowv2"],
+    "workspaces": ["workspace", "workspacev2", "createworkspace", "createworkspacev2", "destroyworkspace",
+                   "destroyworkspacev2", "renameworkspace", "moveworkspace", "moveworkspacev2",
+                   "openwindow", "closewindow", "movewindow", "movewindowv2", "fullscreen",
+                   "activewindowv2"],
+    "monitors": ["monitoradded", "monitoraddedv2", "monitorremoved", "focusedmon", "focusedmonv2",
+                 "workspace", "workspacev2", "moveworkspace", "moveworkspacev2", "activespecial"],
+    "clients": ["openwindow", "closewindow", "movewindow", "movewindowv2", "windowtitle", "windowtitlev2",
+                "changefloatingmode", "fullscreen", "pin", "minimized", "urgent"],
+    "submap": ["submap"],
+    "devices": ["activelayout"],
+}
+
+
+def recognize_hyprctl_query(command: str) -> Optional[HyprlandQuery]:
+    """Match ``hyprctl [-j] <query>``, optionally piped into a formatter.
+
+    Without a pipe the provider's cached answer is the module output. With one
+    the module keeps its command but runs it only after a matching event.
+    """
+    head, sep, tail = command.partition("|")
+    if sep and tail.startswith("|"):
+        return None
+    argv = split_simple_command(head)
+    if not argv or argv[0] != "hyprctl":
+        return None
+    json_output = False
+    queries = []
+    for arg in argv[1:]:
+        if arg in ("-j", "--json"):
+            json_output = True
+        elif arg.startswith("-"):
+            return None  # --batch, -i INSTANCE, ...
+        else:
+            queries.append(arg)
+    if len(queries) != 1 or queries[0] not in HYPRCTL_QUERY_EVENTS:
+        return None
+    return HyprlandQuery(
+        query=f"j/{queries[0]}" if json_output else queries[0],
+        events=[*HYPRCTL_QUERY_EVENTS[queries[0]], "configreloaded"],
+        direct=not sep,
+    )
+
+
+def route_hyprctl_modules(modules: list[WaybarModule]) -> list[WaybarModule]:
+    """Hand polled hyprctl reads to the shared provider instead of a timer."""
+    for module in modules:
+        if module.interval_mode != "poll" or module.exec_if or module.event_rule:
+            continue
+        module.hyprland = recognize_hyprctl_query(module.exec_cmd)
+    return modules
+
+
+def safe_file_stem(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "-", name)
+
+
+def unquoted_metachars(command: str) -> set[str]:
+    """Shell metacharacters that are active (not protected by quoting)."""
+    found: set[str] = set()
+    quote = ""
+    for char in command:
+        if quote == "'":
+            if char == "'":
+                quote = ""
+            continue
+        if quote == '"':
+            if char == '"':
+                quote = ""
+            elif char in "$`\\":
+                found.add(char)
+            continue
+        if char in "'\"":
+            quote = char
+        elif char in SHELL_METACHARS:
+            found.add(char)
+    return found
+
+
+def split_simple_command(command: str) -> Optional[list[str]]:
+    """Return the argv for a command that needs no shell, or None.
+
+    A command is simple when it is a single program invocation: no pipes,
+    redirects, `&&`/`;` lists, globbing, variable or command expansion,
+    leading `VAR=value` assignments, or shell builtins.
+    """
+    if not command or not command.strip():
+        return None
+
+    if unquoted_metachars(command):
+        return None
+
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None
+
+    if not argv or argv[0] in SHELL_BUILTINS or "=" in argv[0]:
+        return None
+    return argv
+
+
+GLOB_CHARS = set("*?[]")
+AWK_PRINT_RE = re.compile(r"^\s*\{\s*print\s+(\$\d+(?:\s*,\s*\$\d+)*)\s*;?\s*\}\s*$")
+
+
+def resolve_pseudo_file(path: str) -> tuple[Optional[str], list[str]]:
+    """Resolve a /sys or /proc path, expanding globs against this machine."""
+    if not path.startswith(("/sys/", "/proc/")):
+        return None, []
+    if not GLOB_CHARS & set(path):
+        return path, []
+    matches = sorted(glob.glob(path))
+    if len(matches) != 1:
+        return None, []
+    return matches[0], [f"glob {path} resolved to {matches[0]} at conversion time."]
+
+
+def recognize_file_read(command: str) -> tuple[Optional[FileReadSpec], list[str]]:
+    """Detect plain cat/head/awk reads of a single /sys or /proc file.
+
+    These poll a tiny pseudo-file but cost an `sh` plus a reader process per
+    tick; plugins can read the file in-process instead.
+    """
+    if not command or unquoted_metachars(command) - GLOB_CHARS:
+        return None, []
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None, []
+    if len(argv) < 2:
+        return None, []
+
+    program, args = argv[0], argv[1:]
+    spec: Optional[FileReadSpec] = None
+    raw_path = args[-1]
+
+    if program == "cat" and len(args) == 1:
+        spec = FileReadSpec(path=raw_path)
+    elif program == "head":
+        options = args[:-1]
+        lines: Optional[int] = None
+        if len(options) == 1 and re.fullmatch(r"-\d+", options[0]):
+            lines = int(options[0][1:])
+        elif len(options) == 1 and re.fullmatch(r"-n\d+", options[0]):
+            lines = int(options[0][2:])
+        elif len(options) == 2 and options[0] == "-n" and options[1].isdigit():
+            lines = int(options[1])
+        elif not options:
+            lines = 10
+        if lines is not None:
+            spec = FileReadSpec(path=raw_path, op="head", lines=lines)
+    elif program == "awk":
+        options = args[:-1]
+        separator = ""
+        if options and options[0].startswith("-F"):
+            separator = options[0][2:] or (options[1] if len(options) > 1 else "")
+            options = options[1:] if options[0] != "-F" else options[2:]
+        match = AWK_PRINT_RE.match(options[0]) if len(options) == 1 else None
+        if match and len(separator) <= 1:
+            fields = [int(part.strip()[1:]) for part in match.group(1).split(",")]
+            spec = FileReadSpec(path=raw_path, op="awk", fields=fields, separator=separator)
+
+    if spec is None:
+        return None, []
+    resolved, warnings = resolve_pseudo_file(spec.path)
+    if resolved is None:
+        return None, []
+    spec.path = resolved
+    return spec, warnings
+
+
 def build_exec_if_wrapper(exec_cmd: str, exec_if: str) -> str:
     if not exec_if:
         return exec_cmd
     return f"if {exec_if}; then {exec_cmd}; fi"
 
 
-def build_python_json_transform(exec_cmd: str, format_str: str, format_icons: list) -> str:
+def build_restart_wrapper(
+    command: str, base_s: int, policy: RestartPolicy, name: str, parse_json: bool
+) -> str:
+    """Supervise a streaming command in sh with the plugin restart policy.
+
+    Each quick failing exit (non-zero status, including signals) doubles
+    the delay (from ``base_s``, capped, +-20% jitter); a clean exit or a run
+    lasting ``healthy_ms`` resets it, so Waybar's periodic restart pattern
+    keeps running. After ``max_failures`` quick failures in a row a final
+    status line is printed and the loop ends.
+    """
+    if not command:
+        return command
+    base = max(0.5, base_s)
+    delay = (
+        "awk -v n=\"$n\" -v s=\"$(( $$ + t ))\" "
+        f"'BEGIN {{ srand(s); d = {base:g} * 2 ^ (n > 0 ? n - 1 : 0); if (d > {policy.max_delay_ms / 1000:g}) d = {policy.max_delay_ms / 1000:g}; "
+        "printf \"%.2f\", d * (0.8 + rand() * 0.4) }'"
+    )
+    steps = [
+        "n=0",
+        "while :; do t=$(date +%s)",
+        f"{{ {command}; }}",
+        "rc=$?",
+        f"if [ $rc -eq 0 ] || [ $(( $(date +%s) - t )) -ge {math.ceil(policy.healthy_ms / 1000)} ]; then n=0; else n=$((n + 1)); fi",
+    ]
+    if policy.max_failures > 0:
+        message = f"{name}: stopped after {policy.max_failures} failed restarts"
+        line = json.dumps({"text": "\u26a0", "tooltip": message}) if parse_json else f"\u26a0 {message}"
+        steps.append(f"if [ $n -ge {policy.max_failures} ]; then printf '%s\\n' {shlex.quote(line)}; exit 1; fi")
+    steps.append(f'sleep "$({delay})"')
+    return "; ".join(steps) + "; done"
+
+
+def build_timeout_wrapper(command: str, timeout_ms: int) -> str:
+    """Run a command under coreutils timeout so overruns kill its process group.
+
+    Simple commands are executed by timeout directly; only commands that need
+    shell features get a nested ``sh -c``.
+    """
+    if not command or timeout_ms <= 0:
+        return command
+    seconds = f"{timeout_ms / 1000:g}"
+    argv = split_simple_command(command)
+    if argv:
+        return f"timeout -k 1 {seconds} {' '.join(shlex.quote(arg) for arg in argv)}"
+    return f"timeout -k 1 {seconds} sh -c {shlex.quote(command)}"
+
+
+# Inline formatters piped after the module command: argv carries base64
+# format icons / format string and the output caps, stdin the raw output.
+# Output past the cap is drained, never held, and counted on stderr.
+PYTHON_CAPPED_READ_CODE = (
+    "def drain(limit, kept):\n"
+    "  extra = 0\n"
+    "  while True:\n"
+    "    chunk = sys.stdin.buffer.read(65536)\n"
+    "    if not chunk: break\n"
+    "    extra += len(chunk)\n"
+    "  if extra:\n"
+    "    sys.stderr.write('output truncated: %d byte(s) over the %d byte cap\\n' % (extra, limit))\n"
+    "  return kept\n"
+    "def read_capped(limit):\n"
+    "  if limit <= 0: return sys.stdin.buffer.read().decode('utf-8', 'replace')\n"
+    "  return drain(limit, sys.stdin.buffer.read(limit).decode('utf-8', 'replace'))\n"
+    "def read_line(limit):\n"
+    "  line = sys.stdin.buffer.readline(limit) if limit > 0 else sys.stdin.buffer.readline()\n"
+    "  if not line: return None\n"
+    "  if limit > 0 and len(line) >= limit and not line.endswith(b'\\n'):\n"
+    "    extra = 0\n"
+    "    while True:\n"
+    "      rest = sys.stdin.buffer.readline(65536)\n"
+    "      extra += len(rest)\n"
+    "      if not rest or rest.endswith(b'\\n'): break\n"
+    "    sys.stderr.write('line truncated: %d byte(s) over the %d byte cap\\n' % (extra, limit))\n"
+    "  return line.decode('utf-8', 'replace').strip()\n"
+    "def arg_int(index, default):\n"
+    "  try:\n"
+    "    return int(sys.argv[index])\n"
+    "  except (IndexError, ValueError):\n"
+    "    return default\n"
+)
+
+# render() is shared by the one-shot JSON formatter and the --patch-stream
+# line merger; tooltip_cap is set by each from its argv.
+PYTHON_JSON_RENDER_CODE = (
+    "tooltip_cap = 0\n"
+    "def safe_int(val):\n"
+    "  try:\n"
+    "    return int(float(val))\n"
+    "  except Exception:\n"
+    "    return None\n"
+    "def apply_format(fmt, data, icon):\n"
+    "  if fmt in ('{}','{text}'): return data.get('text','')\n"
+    "  out = fmt.replace('{}', str(data.get('text','')));\n"
+    "  replacements = {\n"
+    "    '{text}': str(data.get('text','')),\n"
+    "    '{icon}': str(icon),\n"
+    "    '{percentage}': str(data.get('percentage','')) ,\n"
+    "    '{class}': str(data.get('class','')),\n"
+    "    '{alt}': str(data.get('alt','')),\n"
+    "  }\n"
+    "  for key, value in replacements.items():\n"
+    "    out = out.replace(key, value)\n"
+    "  return out\n"
+    "def render(data, icons, fmt):\n"
+    "  percentage = safe_int(data.get('percentage'))\n"
+    "  icon = data.get('icon') or ''\n"
+    "  if icons:\n"
+    "    if percentage is not None:\n"
+    "      idx = int(percentage * len(icons) / 100)\n"
+    "      if idx >= len(icons):\n"
+    "        idx = len(icons) - 1\n"
+    "      if idx >= 0:\n"
+    "        icon = icons[idx]\n"
+    "    elif not icon:\n"
+    "      icon = icons[0]\n"
+    "  text = data.get('text','')\n"
+    "  tooltip = data.get('tooltip','')\n"
+    "  if tooltip_cap > 0 and isinstance(tooltip, str) and len(tooltip) > tooltip_cap:\n"
+    "    tooltip = tooltip[:tooltip_cap] + '\\u2026'\n"
+    "  display = apply_format(fmt, {**data, 'text': text}, icon)\n"
+    "  return {'text': display, 'tooltip': tooltip, 'icon': icon}\n"
+)
+
+PYTHON_JSON_FORMAT_CODE = (
+    "import base64,json,sys\n"
+    + PYTHON_CAPPED_READ_CODE
+    + PYTHON_JSON_RENDER_CODE
+    + "icons = json.loads(base64.b64decode(sys.argv[1] or 'W10='))\n"
+    "fmt = base64.b64decode(sys.argv[2] or 'e30=').decode('utf-8', 'ignore')\n"
+    "tooltip_cap = arg_int(4, 0)\n"
+    "raw = read_capped(arg_int(3, 0))\n"
+    "raw = raw.strip()\n"
+    "if not raw:\n"
+    "  sys.exit(0)\n"
+    "try:\n"
+    "  data = json.loads(raw)\n"
+    "except Exception:\n"
+    "  data = {'text': raw, 'tooltip': raw}\n"
+    "sys.stdout.write(json.dumps(render(data, icons, fmt)))"
+)
+
+
+PYTHON_PLAIN_FORMAT_CODE = (
+    "import base64,sys\n"
+    + PYTHON_CAPPED_READ_CODE
+    + "fmt = base64.b64decode(sys.argv[1] or 'e30=').decode('utf-8', 'ignore')\n"
+    "raw = read_capped(arg_int(2, 0))\n"
+    "raw = raw.rstrip('\\n')\n"
+    "if not raw:\n"
+    "  sys.exit(0)\n"
+    "text = raw\n"
+    "out = fmt.replace('{}', text).replace('{text}', text)\n"
+    "sys.stdout.write(out)"
+)
+
+
+# Folds {"$patch": true, ...} stream lines into the last full object and
+# emits the full object per line, formatted unless the icons argument is
+# "-", for runners that only understand full lines.
+PATCH_MERGE_CODE = (
+    "import base64,json,sys\n"
+    + PYTHON_CAPPED_READ_CODE
+    + PYTHON_JSON_RENDER_CODE
+    + "icons = None if sys.argv[1] == '-' else json.loads(base64.b64decode(sys.argv[1] or 'W10='))\n"
+    "fmt = base64.b64decode(sys.argv[2] or 'e30=').decode('utf-8', 'ignore')\n"
+    "limit = arg_int(3, 0)\n"
+    "tooltip_cap = arg_int(4, 0)\n"
+    "state = {}\n"
+    "while True:\n"
+    "  raw = read_line(limit)\n"
+    "  if raw is None:\n"
+    "    break\n"
+    "  if not raw:\n"
+    "    continue\n"
+    "  try:\n"
+    "    data = json.loads(raw)\n"
+    "  except Exception:\n"
+    "    data = None\n"
+    "  if not isinstance(data, dict):\n"
+    "    print(raw, flush=True)\n"
+    "    continue\n"
+    "  if data.pop('$patch', False):\n"
+    "    for key, value in data.items():\n"
+    "      if value is None:\n"
+    "        state.pop(key, None)\n"
+    "      else:\n"
+    "        state[key] = value\n"
+    "  else:\n"
+    "    state = data\n"
+    "  print(json.dumps(render(state, icons, fmt) if icons is not None else state), flush=True)"
+)
+
+
+# Formats a stream one line at a time, the per-line counterpart of the
+# one-shot formatters above (which read until the command exits). argv:
+# "json" or "plain", icons, format, output cap, tooltip cap.
+PYTHON_LINE_FORMAT_CODE = (
+    "import base64,json,sys\n"
+    + PYTHON_CAPPED_READ_CODE
+    + PYTHON_JSON_RENDER_CODE
+    + "parse_json = sys.argv[1] == 'json'\n"
+    "icons = json.loads(base64.b64decode(sys.argv[2] or 'W10='))\n"
+    "fmt = base64.b64decode(sys.argv[3] or 'e30=').decode('utf-8', 'ignore')\n"
+    "limit = arg_int(4, 0)\n"
+    "tooltip_cap = arg_int(5, 0)\n"
+    "while True:\n"
+    "  raw = read_line(limit)\n"
+    "  if raw is None:\n"
+    "    break\n"
+    "  if not raw:\n"
+    "    continue\n"
+    "  if not parse_json:\n"
+    "    print(fmt.replace('{}', raw).replace('{text}', raw), flush=True)\n"
+    "    continue\n"
+    "  try:\n"
+    "    data = json.loads(raw)\n"
+    "  except Exception:\n"
+    "    data = None\n"
+    "  if not isinstance(data, dict):\n"
+    "    data = {'text': raw, 'tooltip': raw}\n"
+    "  print(json.dumps(render(data, icons, fmt)), flush=True)"
+)
+
+
+def build_python_line_format(
+    exec_cmd: str, parse_json: bool, format_str: str, format_icons: list, limits: Optional[OutputLimits] = None
+) -> str:
+    limits = limits or OutputLimits()
     icons_b64 = base64.b64encode(json.dumps(format_icons).encode("utf-8")).decode("ascii")
     fmt_b64 = base64.b64encode(format_str.encode("utf-8")).decode("ascii")
-
-    python_code = (
-        "import base64,json,sys;"
-        "def safe_int(val):\n"
-        "  try:\n"
-        "    return int(float(val))\n"
-        "  except Exception:\n"
-        "    return None\n"
-        "def apply_format(fmt, data, icon):\n"
-        "  if fmt in ('{}','{text}'): return data.get('text','')\n"
-        "  out = fmt.replace('{}', str(data.get('text','')));\n"
-        "  replacements = {\n"
-        "    '{text}': str(data.get('text','')),\n"
-        "    '{icon}': str(icon),\n"
-        "    '{percentage}': str(data.get('percentage','')) ,\n"
-        "    '{class}': str(data.get('class','')),\n"
-        "    '{alt}': str(data.get('alt','')),\n"
-        "  }\n"
-        "  for key, value in replacements.items():\n"
-        "    out = out.replace(key, value)\n"
-        "  return out\n"
-        "icons = json.loads(base64.b64decode(sys.argv[1] or 'W10='))\n"
-        "fmt = base64.b64decode(sys.argv[2] or 'e30=').decode('utf-8', 'ignore')\n"
-        "raw = sys.stdin.read()\n"
-        "raw = raw.strip()\n"
-        "if not raw:\n"
-        "  sys.exit(0)\n"
-        "try:\n"
-        "  data = json.loads(raw)\n"
-        "except Exception:\n"
-        "  data = {'text': raw, 'tooltip': raw}\n"
-        "percentage = safe_int(data.get('percentage'))\n"
-        "icon = data.get('icon') or ''\n"
-        "if icons:\n"
-        "  if percentage is not None:\n"
-        "    idx = int(percentage * len(icons) / 100)\n"
-        "    if idx >= len(icons):\n"
-        "      idx = len(icons) - 1\n"
-        "    if idx >= 0:\n"
-        "      icon = icons[idx]\n"
-        "  elif not icon:\n"
-        "    icon = icons[0]\n"
-        "text = data.get('text','')\n"
-        "tooltip = data.get('tooltip','')\n"
-        "display = apply_format(fmt, {**data, 'text': text}, icon)\n"
-        "payload = {'text': display, 'tooltip': tooltip, 'icon': icon}\n"
-        "sys.stdout.write(json.dumps(payload))"
+    return (
+        f"({exec_cmd}) | python3 -c {shlex.quote(PYTHON_LINE_FORMAT_CODE)} {'json' if parse_json else 'plain'} "
+        f"{shlex.quote(icons_b64)} {shlex.quote(fmt_b64)} {limits.stdout_bytes} {limits.tooltip_chars}"
     )
 
-    python_code_escaped = shlex.quote(python_code)
+
+def build_patch_merge_wrapper(
+    exec_cmd: str, format_str: str = "", format_icons: Optional[list] = None, limits: Optional[OutputLimits] = None
+) -> str:
+    limits = limits or OutputLimits()
+    icons_b64 = "-"
+    if format_icons is not None:
+        icons_b64 = base64.b64encode(json.dumps(format_icons).encode("utf-8")).decode("ascii")
+    fmt_b64 = base64.b64encode(format_str.encode("utf-8")).decode("ascii")
     return (
-        f"output=$({exec_cmd}); "
-        f"printf '%s' \"$output\" | "
-        f"python3 -c {python_code_escaped} {shlex.quote(icons_b64)} {shlex.quote(fmt_b64)}"
+        f"({exec_cmd}) | python3 -c {shlex.quote(PATCH_MERGE_CODE)} {shlex.quote(icons_b64)} "
+        f"{shlex.quote(fmt_b64)} {limits.stdout_bytes} {limits.tooltip_chars}"
     )
 
 
-def build_python_plain_format(exec_cmd: str, format_str: str) -> str:
+def build_python_json_transform(
+    exec_cmd: str, format_str: str, format_icons: list, limits: Optional[OutputLimits] = None
+) -> str:
+    limits = limits or OutputLimits()
+    icons_b64 = base64.b64encode(json.dumps(format_icons).encode("utf-8")).decode("ascii")
     fmt_b64 = base64.b64encode(format_str.encode("utf-8")).decode("ascii")
 
-    python_code = (
-        "import base64,sys;"
-        "fmt = base64.b64decode(sys.argv[1] or 'e30=').decode('utf-8', 'ignore')\n"
-        "raw = sys.stdin.read()\n"
-        "raw = raw.rstrip('\n')\n"
-        "if not raw:\n"
-        "  sys.exit(0)\n"
-        "text = raw\n"
-        "out = fmt.replace('{}', text).replace('{text}', text)\n"
-        "sys.stdout.write(out)"
+    # Piped rather than captured in a shell variable, so the formatter can
+    # stop keeping output at the cap while the command runs on.
+    python_code_escaped = shlex.quote(PYTHON_JSON_FORMAT_CODE)
+    return (
+        f"({exec_cmd}) | "
+        f"python3 -c {python_code_escaped} {shlex.quote(icons_b64)} {shlex.quote(fmt_b64)} "
+        f"{limits.stdout_bytes} {limits.tooltip_chars}"
     )
 
-    python_code_escaped = shlex.quote(python_code)
+
+def build_python_plain_format(exec_cmd: str, format_str: str, limits: Optional[OutputLimits] = None) -> str:
+    limits = limits or OutputLimits()
+    fmt_b64 = base64.b64encode(format_str.encode("utf-8")).decode("ascii")
+
+    python_code_escaped = shlex.quote(PYTHON_PLAIN_FORMAT_CODE)
     return (
-        f"output=$({exec_cmd}); "
-        f"printf '%s' \"$output\" | "
-        f"python3 -c {python_code_escaped} {shlex.quote(fmt_b64)}"
+        f"({exec_cmd}) | "
+        f"python3 -c {python_code_escaped} {shlex.quote(fmt_b64)} {limits.stdout_bytes}"
     )
 
 
-def transform_command(module: WaybarModule) -> TransformResult:
+# Set around a conversion (see transform_cache) so each module is transformed
+# once; the conversion service keeps its cache across requests. Keyed by the
+# module and limits reprs.
+_transform_cache: ContextVar[Optional[OrderedDict]] = ContextVar("transform_cache", default=None)
+
+
+@contextmanager
+def transform_cache(cache: Optional[OrderedDict] = None):
+    """Reuse transform_command results inside the block.
+
+    Without ``cache`` an outer cache is joined, or a fresh one lives for the
+    block; a long-lived caller passes its own to keep results across blocks.
+    """
+    if cache is None and _transform_cache.get() is not None:
+        yield
+        return
+    token = _transform_cache.set(OrderedDict() if cache is None else cache)
+    try:
+        yield
+    finally:
+        _transform_cache.reset(token)
+
+
+def transform_command(module: WaybarModule, limits: Optional[OutputLimits] = None) -> TransformResult:
+    cache = _transform_cache.get()
+    if cache is None:
+        return _transform_command(module, limits)
+    key = (repr(module), repr(limits))
+    result = cache.get(key)
+    if result is None:
+        result = cache[key] = _transform_command(module, limits)
+    else:
+        cache.move_to_end(key)
+    return replace(result, warnings=list(result.warnings))
+
+
+def _transform_command(module: WaybarModule, limits: Optional[OutputLimits]) -> TransformResult:
     exec_cmd = module.exec_cmd
     warnings: list[str] = []
 
     if not exec_cmd:
         return TransformResult(command="", parse_json=False, warnings=warnings)
 
+    file_read: Optional[FileReadSpec] = None
+    if not module.exec_if and module.return_type != "json":
+        file_read, read_warnings = recognize_file_read(exec_cmd)
+        warnings.extend(read_warnings)
+
     format_str = module.format or "{}"
     return_type = module.return_type
     has_format = format_str not in ("{}", "{text}")
     needs_json_wrap = return_type == "json" or module.format_icons or has_format
 
+    if module.patch_stream:
+        # The one-shot formatter would wait for the stream to end; merge and
+        # format line by line instead.
+        command = build_patch_merge_wrapper(exec_cmd, format_str, module.format_icons, limits)
+        command = build_exec_if_wrapper(command, module.exec_if)
+        return TransformResult(command=command, parse_json=True, warnings=warnings)
+
+    if module.interval_mode == "once" and (return_type == "json" and needs_json_wrap or has_format):
+        # Streams (including poll modules rewritten to events) never reach
+        # EOF, so the one-shot formatters would never print.
+        parse_json = return_type == "json"
+        command = build_python_line_format(exec_cmd, parse_json, format_str, module.format_icons, limits)
+        command = build_exec_if_wrapper(command, module.exec_if)
+        return TransformResult(command=command, parse_json=parse_json, warnings=warnings)
+
     if needs_json_wrap and return_type == "json":
-        command = build_python_json_transform(exec_cmd, format_str, module.format_icons)
+        command = build_python_json_transform(exec_cmd, format_str, module.format_icons, limits)
         command = build_exec_if_wrapper(command, module.exec_if)
         return TransformResult(command=command, parse_json=True, warnings=warnings)
 
@@ -418,26 +1367,220 @@ def transform_command(module: WaybarModule) -> TransformResult:
         return TransformResult(command=command, parse_json=True, warnings=warnings)
 
     if has_format:
-        command = build_python_plain_format(exec_cmd, format_str)
+        command = build_python_plain_format(exec_cmd, format_str, limits)
         command = build_exec_if_wrapper(command, module.exec_if)
         warnings.append("Applied format to plain-text output using python wrapper.")
-        return TransformResult(command=command, parse_json=False, warnings=warnings)
+        return TransformResult(
+            command=command, parse_json=False, warnings=warnings, file_read=file_read
+        )
 
     if module.format_icons:
         warnings.append("format-icons provided but return-type is not json; icons cannot be applied.")
 
     command = build_exec_if_wrapper(exec_cmd, module.exec_if)
-    return TransformResult(command=command, parse_json=False, warnings=warnings)
+    return TransformResult(
+        command=command, parse_json=False, warnings=warnings, file_read=file_read
+    )
+
+
+PROBE_RUNS = 3
+PROBE_TIMEOUT_S = 10.0
+PROBE_MAX_OUTPUT = 64 * 1024
+PROBE_BUSY_RATIO = 0.5  # runtime above this share of the interval is flagged
+PROBE_CPU_SHARE = 0.05  # CPU time above this share of the interval is flagged
+PROBE_SANDBOXES = ("auto", "bwrap", "env", "none")
+PROBE_ENV_KEEP = ("PATH", "LANG", "LC_ALL")  # everything else is dropped from probe runs
+
+
+def probe_sandbox_argv(sandbox: str, home: str) -> list[str]:
+    """Command prefix that isolates a probe run, or an empty list for ``none``.
+
+    ``bwrap`` mounts the whole filesystem read-only with a private ``/tmp``
+    (the working directory) and no network; ``env`` (the ``auto`` fallback without bwrap) only
+    clears the environment and points ``HOME`` at ``home``. Both keep just
+    :data:`PROBE_ENV_KEEP` from the environment.
+    """
+    if sandbox == "none":
+        return []
+    if sandbox == "auto":
+        sandbox = "bwrap" if shutil.which("bwrap") else "env"
+    env = ["env", "-i", *(f"{key}={os.environ[key]}" for key in PROBE_ENV_KEEP if key in os.environ)]
+    if sandbox == "env":
+        return [*env, f"HOME={home}"]
+    return [
+        "bwrap", "--ro-bind", "/", "/", "--dev", "/dev", "--proc", "/proc", "--tmpfs", "/tmp",
+        "--unshare-net", "--unshare-ipc", "--die-with-parent", "--chdir", "/tmp", "--",
+        *env, f"HOME={Path.home()}",
+    ]
+
+
+def kill_process_group(pgid: int) -> None:
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_probe_command(
+    command: str, timeout_s: float, sandbox: str = "auto"
+) -> tuple[float, float, bytes, Optional[int]]:
+    """Run ``command`` once in its own session; returns wall ms, CPU ms, output, exit code.
+
+    The run goes through :func:`probe_sandbox_argv` and, unless ``sandbox``
+    is ``none``, starts in an empty read-only directory. The exit code is
+    ``None`` when the run was killed at ``timeout_s``. The whole process
+    group is killed afterwards so background children cannot outlive the
+    probe.
+    """
+    timed_out = threading.Event()
+
+    def expire(pgid: int) -> None:
+        timed_out.set()
+        kill_process_group(pgid)
+
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryDirectory(prefix="waybar-probe-") as home:
+        os.chmod(home, 0o500)
+        started = time.perf_counter()
+        proc = subprocess.Popen(
+            [*probe_sandbox_argv(sandbox, home), "sh", "-c", command],
+            stdin=subprocess.DEVNULL,
+            stdout=out,
+            stderr=subprocess.DEVNULL,
+            cwd=None if sandbox == "none" else home,
+            start_new_session=True,
+        )
+        timer = threading.Timer(timeout_s, expire, (proc.pid,))
+        timer.start()
+        try:
+            # wait4 reports the rusage of the shell and every child it waited for.
+            _, status, usage = os.wait4(proc.pid, 0)
+        finally:
+            timer.cancel()
+        wall_ms = (time.perf_counter() - started) * 1000
+        proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        kill_process_group(proc.pid)
+        out.seek(0)
+        output = out.read(PROBE_MAX_OUTPUT)
+
+    cpu_ms = (usage.ru_utime + usage.ru_stime) * 1000
+    return wall_ms, cpu_ms, output, None if timed_out.is_set() else proc.returncode
+
+
+def recommend_from_probe(module: WaybarModule, result: ProbeResult) -> None:
+    """Fill in recommended interval/timeout and notes from the measurements."""
+    if not result.wall_ms:
+        return
+    worst_ms = max(result.wall_ms)
+    interval_s = module.interval or DEFAULT_WAYBAR_INTERVAL
+
+    if result.timed_out:
+        result.notes.append(f"timed out on {result.timed_out}/{result.runs} probe run(s)")
+        return
+
+    needed_s = math.ceil(worst_ms / 1000 / PROBE_BUSY_RATIO)
+    result.recommended_interval = max(interval_s, needed_s)
+    if worst_ms >= interval_s * 1000 * PROBE_BUSY_RATIO:
+        result.notes.append(
+            f"runtime {worst_ms:.0f}ms is close to the {interval_s}s interval; "
+            f"recommend {result.recommended_interval}s"
+        )
+    result.recommended_timeout_ms = max(
+        MIN_COMMAND_TIMEOUT_MS, min(math.ceil(worst_ms * 3 / 100) * 100, MAX_COMMAND_TIMEOUT_MS)
+    )
+
+    cpu_ms = statistics.median(result.cpu_ms)
+    share = cpu_ms / (result.recommended_interval * 1000)
+    if share >= PROBE_CPU_SHARE:
+        result.notes.append(f"uses {cpu_ms:.0f}ms CPU per run (~{share:.0%} of a core at this interval)")
+    if result.exit_codes and all(code != 0 for code in result.exit_codes):
+        result.notes.append(f"exited with status {result.exit_codes[-1]} on every probe run")
+
+
+def probe_module(
+    module: WaybarModule, runs: int = PROBE_RUNS, timeout_s: float = PROBE_TIMEOUT_S, sandbox: str = "auto"
+) -> ProbeResult:
+    """Run a module's command a few times and measure its cost."""
+    result = ProbeResult()
+    if not module.exec_cmd:
+        result.skipped = "no exec command"
+        return result
+    if module.interval_mode != "poll":
+        result.skipped = "streaming module (runs continuously)"
+        return result
+    if module.exec_if:
+        _, _, _, code = run_probe_command(module.exec_if, timeout_s, sandbox)
+        if code != 0:
+            result.skipped = "exec-if timed out" if code is None else f"exec-if failed (exit {code})"
+            return result
+
+    outputs = set()
+    for _ in range(max(1, runs)):
+        wall_ms, cpu_ms, output, code = run_probe_command(module.exec_cmd, timeout_s, sandbox)
+        result.runs += 1
+        result.wall_ms.append(round(wall_ms, 1))
+        result.cpu_ms.append(round(cpu_ms, 1))
+        result.output_bytes = max(result.output_bytes, len(output))
+        outputs.add(output)
+        if code is None:
+            result.timed_out += 1
+        else:
+            result.exit_codes.append(code)
+    result.distinct_outputs = len(outputs)
+    recommend_from_probe(module, result)
+    return result
+
+
+def probe_modules(
+    modules: list[WaybarModule],
+    runs: int = PROBE_RUNS,
+    timeout_s: float = PROBE_TIMEOUT_S,
+    apply: bool = False,
+    keep_timeouts: bool = False,
+    sandbox: str = "auto",
+) -> None:
+    """Probe every module (in parallel across modules) and attach the results.
+
+    Modules sharing a runner are probed once. With ``apply`` the recommended
+    interval replaces the configured one when it is longer, and the timeout
+    follows the measurements unless ``keep_timeouts`` is set.
+    """
+    leaders = [m for m in modules if m.shared_role != "consumer"]
+    workers = max(1, min(8, len(leaders), os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = dict(zip(
+            (m.name for m in leaders),
+            pool.map(lambda m: probe_module(m, runs, timeout_s, sandbox), leaders),
+        ))
+
+    for module in modules:
+        result = results.get(module.shared_source if module.shared_role == "consumer" else module.name)
+        if result is None:
+            continue
+        module.probe = result
+        if apply and result.recommended_interval:
+            if result.recommended_interval > (module.interval or 0):
+                module.interval = result.recommended_interval
+                module.interval_defaulted = False
+            if not keep_timeouts and module.timeout_ms:
+                module.timeout_ms = result.recommended_timeout_ms
 
 
 def convert_module_to_widget(
-    module: WaybarModule, default_interval: int
+    module: WaybarModule,
+    default_interval: int,
+    restart: Optional[RestartPolicy] = None,
+    limits: Optional[OutputLimits] = None,
 ) -> tuple[NoctaliaWidgetConfig, list[str]]:
     """Convert a Waybar module to a Noctalia CustomButton configuration."""
     warnings: list[str] = []
 
-    transform = transform_command(module)
+    transform = transform_command(module, limits)
     warnings.extend(transform.warnings)
+    command = transform.command
+    if module.interval_mode == "once" and module.restart_interval:
+        command = build_restart_wrapper(
+            command, module.restart_interval, restart or RestartPolicy(), module.name, transform.parse_json
+        )
 
     if module.interval_signal_override:
         warnings.append(
@@ -448,7 +1591,9 @@ def convert_module_to_widget(
             f"interval not set; defaulting to {default_interval}s (Waybar default)."
         )
 
-    widget = NoctaliaWidgetConfig(textCommand=transform.command)
+    widget = NoctaliaWidgetConfig(
+        textCommand=build_timeout_wrapper(command, module.timeout_ms)
+    )
 
     if module.interval_mode == "once":
         widget.textStream = True
@@ -487,156 +1632,1388 @@ def convert_module_to_widget(
             "vertical": min(module.max_length, 10),
         }
 
-    if module.restart_interval:
-        warnings.append("restart-interval is not supported for CustomButton widgets.")
-
-    return widget, warnings
-
+    if module.restart_interval and module.interval_mode == "once":
+        warnings.append("restart-interval is emulated by a sh restart loop with backoff around the command.")
 
-def escape_qml_string(s: str) -> str:
-    """Escape a string for use in QML."""
-    return s.replace("\\", "\\\\").replace('"', "\\\"").replace("\n", "\\n")
-
-
-def render_list_literal(values: list) -> str:
-    return json.dumps(values, ensure_ascii=True)
+    if module.shared_role == "consumer":
+        warnings.append(
+            f"runs the same command as {module.shared_source}; "
+            "CustomButton cannot share runners, see widget_hints.json."
+        )
 
+    if module.probe:
+        warnings.extend(f"probe: {note}" for note in module.probe.notes)
 
-def generate_plugin_scaffold(module: WaybarModule, output_dir: Path, default_interval: int) -> None:
-    """Generate a full Noctalia plugin scaffold for a Waybar module."""
+    return widget, warnings
 
-    plugin_id = f"waybar-{module.name}"
-    plugin_dir = output_dir / "plugins" / plugin_id
-    plugin_dir.mkdir(parents=True, exist_ok=True)
 
-    interval_setting = module.interval if module.interval is not None else default_interval
+def build_widget_hints(module: WaybarModule, power: Optional[PowerPolicy] = None) -> dict:
+    """Runtime hints CustomButton cannot express, keyed per widget."""
+    hints: dict[str, object] = {}
+    power = power or PowerPolicy()
+    if power.active and module.interval_mode == "poll" and module.interval <= POWER_HINT_MAX_INTERVAL:
+        hints["power"] = power.to_hint(module.interval)
+    if module.shared_source:
+        hints["sharedSource"] = module.shared_source
+        hints["sharedRole"] = module.shared_role
+        if module.shared_consumers:
+            hints["sharedWith"] = list(module.shared_consumers)
+    if module.probe:
+        hints["probe"] = module.probe.to_dict()
+    return hints
 
-    manifest = {
-        "id": plugin_id,
-        "name": f"Waybar {module.name.replace('-', ' ').title()}",
-        "version": "1.0.0",
-        "author": "waybar-converter",
-        "description": f"Converted from Waybar custom/{module.name} module",
-        "entryPoints": {
-            "main": "Main.qml",
-            "barWidget": "BarWidget.qml",
-            "settings": "Settings.qml",
-        },
-        "metadata": {
-            "defaultSettings": {
-                "textCommand": module.exec_cmd,
-                "interval": interval_setting,
-                "intervalMode": module.interval_mode,
-                "restartIntervalMs": (module.restart_interval or 0) * 1000,
-                "parseJson": module.return_type == "json",
-            }
-        },
-    }
 
-    with open(plugin_dir / "manifest.json", "w", encoding="utf-8") as f:
-        json.dump(manifest, f, indent=2)
+def escape_qml_string(s: str) -> str:
+    """Escape a string for use in QML."""
+    return s.replace("\\", "\\\\").replace('"', "\\\"").replace("\n", "\\n")
 
-    format_literal = escape_qml_string(module.format or "{}")
-    icons_literal = render_list_literal(module.format_icons)
-    exec_if_literal = escape_qml_string(module.exec_if)
 
-    main_qml = f'''import QtQuick
+ACTION_SETTINGS = (
+    ("left", "onClick", "on_click", "runDetached"),
+    ("right", "onClickRight", "on_click_right", "runDetached"),
+    ("middle", "onClickMiddle", "on_click_middle", "runDetached"),
+    ("scrollUp", "onScrollUp", "on_scroll_up", "runScroll"),
+    ("scrollDown", "onScrollDown", "on_scroll_down", "runScroll"),
+)
+
+
+def build_action_settings(module: WaybarModule) -> dict:
+    """Click/scroll commands (and their pre-split argv) as manifest settings."""
+    settings = {"execOnEvent": module.exec_on_event}
+    for _, key, attr, _ in ACTION_SETTINGS:
+        command = getattr(module, attr)
+        settings[key] = command
+        settings[f"{key}Argv"] = split_simple_command(command) or []
+    return settings
+
+
+def render_bar_widget_qml(module, fallbacks: Optional[dict[str, str]] = None) -> str:
+    """Render BarWidget.qml for a converted module.
+
+    ``fallbacks`` maps "left", "right", "middle", "scrollUp" and "scrollDown"
+    to a JS statement run when the module has no command for that action;
+    scroll fallbacks can use ``steps``, the number of coalesced wheel notches.
+    With ``module=None`` the commands are read from the manifest
+    defaultSettings instead (the shared runtime pill). Otherwise handlers,
+    helpers and the WheelHandler are only emitted for actions the module has.
+    """
+    fallbacks = fallbacks or {}
+
+    def handler(kind: str, call: str) -> str:
+        if kind not in fallbacks:
+            return call
+        return f"{{ if (!{call}) {fallbacks[kind]}; }}"
+
+    calls = {}
+    for kind, key, attr, runner in ACTION_SETTINGS:
+        if module is None:
+            args = f'defaultSettings.{key} || "", defaultSettings.{key}Argv || [], defaultSettings.execOnEvent !== false'
+        else:
+            command = getattr(module, attr)
+            argv = qml_literal(split_simple_command(command) or [])
+            args = f'"{escape_qml_string(command)}", {argv}, {str(module.exec_on_event).lower()}'
+        if runner == "runScroll":
+            args += ", steps"
+        calls[kind] = handler(kind, f"{runner}({args})")
+    left_call, right_call, middle_call = calls["left"], calls["right"], calls["middle"]
+    scroll_up_call, scroll_down_call = calls["scrollUp"], calls["scrollDown"]
+
+    if module is None:
+        features = set(RUNTIME_FEATURES)
+    else:
+        features = {
+            kind for kind, _, attr, _ in ACTION_SETTINGS if getattr(module, attr) or kind in fallbacks
+        }
+    if features & {"left", "right", "middle"}:
+        features.add("click")
+    if features & {"scrollUp", "scrollDown"}:
+        features.add("scroll")
+    if module is None or (
+        isinstance(module, WaybarModule) and module.interval_mode == "poll" and not module.always_poll
+    ):
+        features.add("visibility")
+
+    return select_sections(f'''import QtQuick
+import QtQuick.Controls
+import QtQuick.Layouts
 import Quickshell
+//@if scroll
 import Quickshell.Io
+//@endif
+import qs.Commons
+import qs.Modules.Bar.Extras
+import qs.Modules.Panels.Settings
+import qs.Services.UI
+import qs.Widgets
 
 Item {{
   id: root
 
   property var pluginApi: null
+  property ShellScreen screen
+
+  property string widgetId: ""
+  property string section: ""
+  property int sectionWidgetIndex: -1
+  property int sectionWidgetsCount: 0
+  property real scaling: 1.0
+
+  readonly property var pluginMain: pluginApi?.mainInstance
 
+//@if dynamic
   readonly property var defaultSettings: pluginApi?.manifest?.metadata?.defaultSettings || ({{}})
 
-  function settingOr(value, fallback) {{
-    return (value !== undefined && value !== null) ? value : fallback;
-  }}
+//@endif
+  readonly property string barPosition: Settings.data.bar.position
+  readonly property bool isBarVertical: barPosition === "left" || barPosition === "right"
 
-  readonly property string textCommand: settingOr(pluginApi?.pluginSettings?.textCommand, settingOr(defaultSettings.textCommand, "{escape_qml_string(module.exec_cmd)}"))
-  readonly property int intervalSeconds: settingOr(pluginApi?.pluginSettings?.interval, settingOr(defaultSettings.interval, {interval_setting}))
-  readonly property string intervalMode: settingOr(pluginApi?.pluginSettings?.intervalMode, settingOr(defaultSettings.intervalMode, "{module.interval_mode}"))
-  readonly property int restartIntervalMs: settingOr(pluginApi?.pluginSettings?.restartIntervalMs, settingOr(defaultSettings.restartIntervalMs, 0))
-  readonly property bool parseJson: settingOr(pluginApi?.pluginSettings?.parseJson, settingOr(defaultSettings.parseJson, {str(module.return_type == "json").lower()}))
+  readonly property string pillText: isBarVertical ? "" : (pluginMain?.displayText || "")
+  readonly property string iconName: pluginMain?.displayIcon || ""
+
+  implicitWidth: pill.width
+  implicitHeight: pill.height
+//@if visibility
 
-  readonly property string execIf: "{exec_if_literal}"
-  readonly property string formatString: "{format_literal}"
-  readonly property var formatIcons: {icons_literal}
-  readonly property bool escapeMarkup: {str(module.escape).lower()}
+  // Lets the runner pause polling while no instance of this widget is visible.
+  readonly property string visibilityKey: Math.random().toString(36).slice(2)
+  readonly property bool shownOnBar: visible && (QsWindow.window?.visible ?? true)
 
-  property string displayText: ""
-  property string displayIcon: ""
-  property string displayTooltip: ""
+  function reportVisibility() {{
+    pluginMain?.setWidgetVisible(visibilityKey, shownOnBar);
+  }}
 
-  readonly property bool isStreaming: intervalMode === "once"
+  onShownOnBarChanged: reportVisibility()
+  onPluginMainChanged: reportVisibility()
+  Component.onCompleted: reportVisibility()
+  Component.onDestruction: pluginMain?.setWidgetVisible(visibilityKey, false)
+//@endif
 
-  signal refreshed()
+  BarPill {{
+    id: pill
 
-  SplitParser {{
-    id: stdoutSplit
-    onRead: line => root.parseOutput(line)
+    screen: root.screen
+    density: Settings.data.bar.density
+    oppositeDirection: BarService.getPillDirection(root)
+    icon: iconName
+    text: pillText
+    tooltipText: {{
+      var base = pluginMain?.displayTooltip || pluginMain?.displayText || "";
+      var note = pluginMain?.statusNote || "";
+      return note ? (base ? `${{base}}\n(${{note}})` : `(${{note}})`) : base;
+    }}
+    forceOpen: !isBarVertical && (pluginMain?.displayText || "") !== ""
+//@if left
+    onClicked: {left_call}
+//@endif
+//@if right
+    onRightClicked: {right_call}
+//@endif
+//@if middle
+    onMiddleClicked: {middle_call}
+//@endif
   }}
+//@if click
 
-  StdioCollector {{
-    id: stdoutCollect
-    onStreamFinished: () => root.parseOutput(this.text)
+  // Simple commands arrive pre-split by the converter and skip the shell.
+  function execArgv(cmd, argv) {{
+    Quickshell.execDetached(argv.length > 0 ? argv : ["sh", "-c", cmd]);
   }}
 
-  StdioCollector {{
-    id: stderrCollect
-    onStreamFinished: () => {{
-      if (this.text && this.text.trim().length > 0) {{
-        Logger.w("{plugin_id}", this.text.trim())
-      }}
+  function runDetached(cmd, argv, shouldRefresh) {{
+    if (!cmd) return false;
+    execArgv(cmd, argv);
+    if (shouldRefresh) {{
+      pluginMain?.refresh();
     }}
+    return true;
   }}
+//@endif
+//@if scroll
 
-  Process {{
-    id: textProc
-    command: ["sh", "-lc", root.buildCommand()]
-    stdout: isStreaming ? stdoutSplit : stdoutCollect
-    stderr: stderrCollect
-    onExited: (exitCode, exitStatus) => {{
-      if (isStreaming && restartIntervalMs > 0) {{
-        restartTimer.start();
-      }}
+  // Wheel events are summed over a short window and mapped to one command
+  // run, with "{{steps}}" in the command replaced by the notch count. The
+  // refresh waits for that run to exit; a burst arriving meanwhile is queued.
+  property real scrollAccum: 0
+  property var queuedScroll: null
+
+  function withSteps(value, steps) {{
+    return String(value).split("{{steps}}").join(String(steps));
+  }}
+
+  function runScroll(cmd, argv, shouldRefresh, steps) {{
+    if (!cmd) return false;
+    if (scrollProc.running) {{
+      var merged = queuedScroll && queuedScroll.cmd === cmd ? queuedScroll.steps + steps : steps;
+      queuedScroll = {{ cmd: cmd, argv: argv, refresh: shouldRefresh, steps: merged }};
+      return true;
     }}
+    scrollProc.refreshAfter = shouldRefresh;
+    scrollProc.command = argv.length > 0 ? argv.map(arg => withSteps(arg, steps)) : ["sh", "-c", withSteps(cmd, steps)];
+    scrollProc.running = true;
+    return true;
   }}
 
-  Timer {{
+  function flushScroll() {{
+    var accum = scrollAccum;
+    scrollAccum = 0;
+    if (accum === 0) return;
+    var steps = Math.max(1, Math.round(Math.abs(accum) / 120));
+    if (accum > 0) {{
+      {scroll_up_call};
+    }} else {{
+      {scroll_down_call};
+    }}
+  }}
+
+  Process {{
+    id: scrollProc
+    property bool refreshAfter: false
+    onExited: (exitCode, exitStatus) => {{
+      var next = root.queuedScroll;
+      root.queuedScroll = null;
+      if (next) {{
+        root.runScroll(next.cmd, next.argv, next.refresh || refreshAfter, next.steps);
+      }} else if (refreshAfter) {{
+        pluginMain?.refresh();
+      }}
+    }}
+  }}
+
+  Timer {{
+    id: scrollTimer
+    interval: 120
+    repeat: false
+    onTriggered: root.flushScroll()
+  }}
+
+  WheelHandler {{
+    enabled: true
+    onWheel: (event) => {{
+      root.scrollAccum += event.angleDelta.y;
+      if (!scrollTimer.running) scrollTimer.start();
+    }}
+  }}
+//@endif
+}}
+''', features)
+
+
+def qml_literal(value: object) -> str:
+    """Render a JSON-compatible value as a QML/JS literal."""
+    return json.dumps(value, ensure_ascii=True)
+
+
+SECTION_RE = re.compile(r"^[ \t]*//@(?:if (\S+)|endif)[ \t]*\n", re.MULTILINE)
+
+# Template sections: "dynamic" keeps the settings-driven mode switches, the
+# rest name the runner paths and click/scroll handlers a module may need.
+RUNTIME_FEATURES = frozenset({
+    "dynamic", "poll", "stream", "coprocess", "fileRead", "shared", "json", "plain",
+    "left", "right", "middle", "scrollUp", "scrollDown", "visibility", "idle", "power", "budget",
+    "nice", "patch", "hyprland", "runtime",
+})
+
+
+def select_sections(template: str, features: Iterable[str]) -> str:
+    """Keep the ``//@if a&!b`` ... ``//@endif`` template sections that apply.
+
+    Marker lines are dropped from the output and the blank lines left around
+    a dropped section collapse into one; sections may nest.
+    """
+    features = set(features)
+    # re.split yields text, condition (None for endif), text, condition, ...
+    parts = SECTION_RE.split(template)
+    kept = [parts[0]]
+    stack: list[bool] = []
+    for i in range(1, len(parts), 2):
+        cond = parts[i]
+        if cond is None:
+            stack.pop()
+        else:
+            stack.append(all(
+                term[1:] not in features if term.startswith("!") else term in features
+                for term in cond.split("&")
+            ))
+        if all(stack):
+            kept.append(parts[i + 1])
+    if stack:
+        raise ValueError("unterminated //@if section in QML template")
+    return re.sub(r"\n{3,}", "\n\n", "".join(kept))
+
+
+def extract_js_function(source: str, name: str) -> str:
+    """Cut ``function name(...) { ... }`` out of rendered QML by brace matching."""
+    start = source.index(f"function {name}(")
+    depth = 0
+    for i in range(source.index("{", start), len(source)):
+        if source[i] == "{":
+            depth += 1
+        elif source[i] == "}":
+            depth -= 1
+            if not depth:
+                return source[start:i + 1]
+    raise ValueError(f"unbalanced braces in {name}")
+
+
+def plugin_features(defaults: dict, fallbacks: Optional[dict[str, str]] = None) -> set[str]:
+    """Template sections a specialized plugin needs, from its defaultSettings."""
+    streaming = defaults.get("intervalMode") == "once"
+    features = {"stream" if streaming else "poll", "json" if defaults.get("parseJson") else "plain"}
+    if defaults.get("sharedRole"):
+        features.add("shared")
+    if not streaming and defaults.get("fileRead"):
+        features.add("fileRead")
+    needs_shell = bool(defaults.get("execIf")) or not defaults.get("textArgv")
+    if not streaming and defaults.get("shellMode") == "coprocess" and needs_shell:
+        features.add("coprocess")
+    if streaming and defaults.get("patchProtocol") and defaults.get("parseJson") and not defaults.get("sharedRole"):
+        features.add("patch")
+    if not streaming and defaults.get("spawnBudget", 0) > 0:
+        features.add("budget")
+    if not streaming and defaults.get("hyprland"):
+        features.add("hyprland")
+    if not streaming and max(defaults.get("batteryIntervalScale", 1), defaults.get("lowBatteryIntervalScale", 1)) > 1:
+        features.add("power")
+    # Scheduling policies only cost objects and timers when they can act.
+    if not streaming and not defaults.get("alwaysPoll"):
+        features.add("visibility")
+        if defaults.get("idlePauseSeconds", 0) > 0:
+            features.add("idle")
+    if features & {"budget", "hyprland", "power"}:
+        features.add("runtime")  # singletons from the waybar-runtime folder
+    if defaults.get("niceCommand"):
+        features.add("nice")
+    for kind, key, _, _ in ACTION_SETTINGS:
+        if defaults.get(key) or kind in (fallbacks or {}):
+            features.add(kind)
+    return features
+
+
+def render_main_qml(defaults: dict, log_tag: str, features: Optional[set[str]] = None) -> str:
+    """Render the runner (plugin Main.qml) for a custom module.
+
+    ``defaults`` holds the manifest defaultSettings baked in as fallbacks and
+    ``log_tag`` is the JS expression used as the Logger tag. ``features``
+    (see :func:`plugin_features`) limits the output to the objects and
+    functions the module needs; ``None`` keeps everything.
+    """
+
+    def lit(key: str) -> str:
+        return qml_literal(defaults[key])
+
+    return select_sections(f'''import QtQuick
+import Quickshell
+import Quickshell.Io
+//@if idle
+import Quickshell.Wayland
+//@endif
+//@if runtime&!dynamic
+import "../waybar-runtime"
+//@endif
+import qs.Commons
+
+Item {{
+  id: root
+
+  property var pluginApi: null
+
+  readonly property var defaultSettings: pluginApi?.manifest?.metadata?.defaultSettings || ({{}})
+
+  function settingOr(value, fallback) {{
+    return (value !== undefined && value !== null) ? value : fallback;
+  }}
+
+  readonly property string textCommand: settingOr(pluginApi?.pluginSettings?.textCommand, settingOr(defaultSettings.textCommand, {lit("textCommand")}))
+//@if poll
+  readonly property int intervalSeconds: settingOr(pluginApi?.pluginSettings?.interval, settingOr(defaultSettings.interval, {lit("interval")}))
+//@endif
+//@if dynamic
+  readonly property string intervalMode: settingOr(pluginApi?.pluginSettings?.intervalMode, settingOr(defaultSettings.intervalMode, {lit("intervalMode")}))
+//@endif
+//@if stream
+  readonly property int restartIntervalMs: settingOr(pluginApi?.pluginSettings?.restartIntervalMs, settingOr(defaultSettings.restartIntervalMs, {lit("restartIntervalMs")}))
+  readonly property real maxUpdateRate: settingOr(pluginApi?.pluginSettings?.maxUpdateRate, settingOr(defaultSettings.maxUpdateRate, {lit("maxUpdateRate")}))
+//@endif
+//@if patch
+  readonly property bool patchProtocol: settingOr(pluginApi?.pluginSettings?.patchProtocol, settingOr(defaultSettings.patchProtocol, {lit("patchProtocol")}))
+//@endif
+//@if dynamic
+  readonly property bool parseJson: settingOr(pluginApi?.pluginSettings?.parseJson, settingOr(defaultSettings.parseJson, {lit("parseJson")}))
+//@endif
+//@if poll
+  readonly property int timeoutMs: settingOr(pluginApi?.pluginSettings?.timeoutMs, settingOr(defaultSettings.timeoutMs, {lit("timeoutMs")}))
+//@endif
+  readonly property bool loginShell: settingOr(pluginApi?.pluginSettings?.loginShell, settingOr(defaultSettings.loginShell, {lit("loginShell")}))
+
+  // Converter-classified argv for the default command. Only used while the
+  // command is unchanged from the manifest; edited commands go through sh.
+  readonly property string defaultTextCommand: settingOr(defaultSettings.textCommand, {lit("textCommand")})
+  readonly property var textArgv: settingOr(defaultSettings.textArgv, {lit("textArgv")})
+  readonly property var directArgv: (!execIf && textArgv.length > 0 && textCommand === defaultTextCommand) ? textArgv : []
+
+//@if dynamic
+  // "spawn" forks a fresh sh per run; "coprocess" sends shell commands to one
+  // long-lived sh over stdin. Only poll commands that need a shell use it.
+  readonly property string shellMode: settingOr(pluginApi?.pluginSettings?.shellMode, settingOr(defaultSettings.shellMode, {lit("shellMode")}))
+  readonly property bool useCoprocess: shellMode === "coprocess" && !isStreaming && directArgv.length === 0
+//@endif
+//@if coprocess&!dynamic
+  // Shell commands go to one long-lived sh over stdin instead of a fork each.
+  readonly property bool useCoprocess: directArgv.length === 0
+//@endif
+
+//@if shared
+  // Modules with identical exec/exec-if/interval share one runner: the
+  // leader publishes raw output to a runtime file that consumers watch, and
+  // consumers request refreshes through a second file. No process per consumer.
+  // Polling consumers also report in a file of their own whether they want
+  // output, so a leader whose group is all hidden pauses too.
+  readonly property string sharedSource: settingOr(defaultSettings.sharedSource, {lit("sharedSource")})
+  readonly property string sharedRole: settingOr(defaultSettings.sharedRole, {lit("sharedRole")})
+  readonly property string sharedName: settingOr(defaultSettings.sharedName, {lit("sharedName")})
+  readonly property var sharedConsumers: settingOr(defaultSettings.sharedConsumers, {lit("sharedConsumers")})
+  readonly property string sharedPath: sharedSource ? `${{Quickshell.env("XDG_RUNTIME_DIR") || "/tmp"}}/noctalia-waybar-${{sharedSource}}` : ""
+  readonly property bool useSharedSource: sharedRole === "consumer" && textCommand === defaultTextCommand
+  readonly property bool publishesShared: sharedRole === "leader" && textCommand === defaultTextCommand
+//@endif
+
+//@if fileRead
+  // cat/head/awk over a /sys or /proc file, compiled by the converter into
+  // an in-process read: no process at all per tick.
+  readonly property var fileRead: settingOr(defaultSettings.fileRead, {lit("fileRead")})
+  readonly property bool useFileRead: !!(fileRead && fileRead.path) && textCommand === defaultTextCommand
+//@endif
+
+//@if hyprland
+  // hyprctl reads answered by the HyprlandProvider singleton, re-queried only
+  // after a Hyprland event that can change them: no process per tick.
+  readonly property var hyprland: settingOr(defaultSettings.hyprland, {lit("hyprland")})
+//@if shared
+  readonly property bool useHyprland: !!(hyprland && hyprland.query) && !isStreaming && textCommand === defaultTextCommand && !useSharedSource
+//@endif
+//@if !shared
+  readonly property bool useHyprland: !!(hyprland && hyprland.query) && !isStreaming && textCommand === defaultTextCommand
+//@endif
+//@endif
+
+  readonly property string execIf: settingOr(defaultSettings.execIf, {lit("execIf")})
+  readonly property string formatString: settingOr(defaultSettings.format, {lit("format")})
+//@if json
+  readonly property var formatIcons: settingOr(defaultSettings.formatIcons, {lit("formatIcons")})
+//@endif
+//@if dynamic
+  readonly property bool escapeMarkup: settingOr(defaultSettings.escape, {lit("escape")})
+//@endif
+  readonly property string logTag: {log_tag}
+
+  property string displayText: ""
+  property string displayIcon: ""
+  property string displayTooltip: ""
+
+//@if poll
+  // Overrun accounting: ticks skipped because the previous run was still
+  // going, and runs killed for exceeding timeoutMs.
+  property int missedTicks: 0
+  property int timeoutCount: 0
+  property bool runTimedOut: false
+//@if budget
+
+  // Bar-wide spawn budget: runs beyond SpawnBudget.limit wait in a shared
+  // queue by spawnPriority; refreshes from clicks jump ahead at priority 0.
+  readonly property int spawnBudget: settingOr(defaultSettings.spawnBudget, {lit("spawnBudget")})
+  readonly property int spawnPriority: settingOr(defaultSettings.spawnPriority, {lit("spawnPriority")})
+  property bool spawnQueued: false
+  property bool holdsSpawnSlot: false
+//@endif
+//@if nice
+
+  // Slow background module: runs under nice/ionice.
+  readonly property bool niceCommand: settingOr(defaultSettings.niceCommand, {lit("niceCommand")})
+//@endif
+
+  // Visibility-aware scheduling: polling pauses while no bar widget instance
+  // is visible (bar hidden, screen gone, widget not placed) or the user has
+  // been idle for idlePauseSeconds (blanked or locked screen), and resumes
+  // with an immediate run. alwaysPoll keeps alerting modules going.
+  readonly property bool alwaysPoll: settingOr(pluginApi?.pluginSettings?.alwaysPoll, settingOr(defaultSettings.alwaysPoll, {lit("alwaysPoll")}))
+//@if visibility
+  property var visibleWidgets: ({{}})
+  property int visibleWidgetCount: 0
+  property bool visibilityKnown: false
+  readonly property bool widgetsVisible: !visibilityKnown || visibleWidgetCount > 0
+//@endif
+//@if !visibility
+  readonly property bool widgetsVisible: true
+//@endif
+//@if idle
+  readonly property int idlePauseSeconds: settingOr(pluginApi?.pluginSettings?.idlePauseSeconds, settingOr(defaultSettings.idlePauseSeconds, {lit("idlePauseSeconds")}))
+  readonly property bool userIdle: idleMonitor.enabled && idleMonitor.isIdle
+//@endif
+//@if !idle
+  readonly property bool userIdle: false
+//@endif
+//@if shared
+  property var activeConsumers: ({{}})
+  readonly property bool pollActive: alwaysPoll || (widgetsVisible && !userIdle) || (publishesShared && Object.keys(activeConsumers).length > 0)
+//@endif
+//@if !shared
+  readonly property bool pollActive: alwaysPoll || (widgetsVisible && !userIdle)
+//@endif
+//@if power
+
+  // Power policy: on battery the poll interval is multiplied by
+  // batteryIntervalScale, or lowBatteryIntervalScale at low charge. The
+  // battery state comes from the shared PowerState singleton.
+  readonly property real batteryIntervalScale: settingOr(pluginApi?.pluginSettings?.batteryIntervalScale, settingOr(defaultSettings.batteryIntervalScale, {lit("batteryIntervalScale")}))
+  readonly property real lowBatteryIntervalScale: settingOr(pluginApi?.pluginSettings?.lowBatteryIntervalScale, settingOr(defaultSettings.lowBatteryIntervalScale, {lit("lowBatteryIntervalScale")}))
+  readonly property int lowBatteryPercent: settingOr(pluginApi?.pluginSettings?.lowBatteryPercent, settingOr(defaultSettings.lowBatteryPercent, {lit("lowBatteryPercent")}))
+  readonly property bool onBattery: PowerState.onBattery
+  readonly property real powerScale: !onBattery ? 1 : Math.max(1, PowerState.percent <= lowBatteryPercent ? lowBatteryIntervalScale : batteryIntervalScale)
+  property bool holdsPowerState: false
+  readonly property int pollIntervalMs: Math.max(250, intervalSeconds * 1000 * powerScale)
+//@endif
+//@if !power
+  readonly property int pollIntervalMs: Math.max(250, intervalSeconds * 1000)
+//@endif
+//@endif
+
+//@if stream
+  // Rate limiting: streamed lines within one 1/maxUpdateRate window collapse
+  // to the newest, which is applied at the end of the window. droppedLines
+  // counts the superseded ones and is logged when the stream ends.
+  // pendingLine is null when only merged patch state awaits rendering.
+  property var pendingLine: ""
+  property bool hasPendingLine: false
+  property double lastLineApplied: 0
+  property int droppedLines: 0
+
+  // Restart policy: quick exits double the delay from restartIntervalMs up to
+  // restartBackoffMaxMs (+-20% jitter); a run lasting restartHealthyMs resets
+  // it. After restartMaxFailures quick exits the circuit opens and restarts
+  // stop until the next click or settings save.
+  readonly property int restartBackoffMaxMs: settingOr(pluginApi?.pluginSettings?.restartBackoffMaxMs, settingOr(defaultSettings.restartBackoffMaxMs, {lit("restartBackoffMaxMs")}))
+  readonly property int restartHealthyMs: settingOr(pluginApi?.pluginSettings?.restartHealthyMs, settingOr(defaultSettings.restartHealthyMs, {lit("restartHealthyMs")}))
+  readonly property int restartMaxFailures: settingOr(pluginApi?.pluginSettings?.restartMaxFailures, settingOr(defaultSettings.restartMaxFailures, {lit("restartMaxFailures")}))
+  property double streamStartedAt: 0
+  property int restartFailures: 0
+  property bool circuitOpen: false
+
+//@endif
+//@if patch
+  // Partial-update protocol: a {{"$patch": true, ...}} line merges its fields
+  // into the last full object (null removes a field); any other JSON line
+  // replaces it. Every line is merged as it arrives, so rate limiting only
+  // skips renders, and a render only redoes the parts whose fields changed.
+  property var streamState: ({{}})
+  property bool formatDirty: false
+  property bool tooltipDirty: false
+
+//@endif
+  // Output caps: one poll run keeps at most maxOutputBytes of stdout, as does
+  // one streamed line, and tooltips are cut at maxTooltipChars. Output past a
+  // cap is still read, so the command never blocks, but dropped at once.
+  // stderr is logged per line, at most maxStderrBytes and {STDERR_LOG_LINES} lines
+  // per {STDERR_LOG_WINDOW_MS // 1000}s; the rest is counted. Output and stderr caps count
+  // UTF-8 bytes, as the Python wrappers do; the tooltip cap counts characters.
+  readonly property int maxOutputBytes: settingOr(defaultSettings.maxOutputBytes, {lit("maxOutputBytes")})
+  readonly property int maxStderrBytes: settingOr(defaultSettings.maxStderrBytes, {lit("maxStderrBytes")})
+  readonly property int maxTooltipChars: settingOr(defaultSettings.maxTooltipChars, {lit("maxTooltipChars")})
+  property var stdoutBuffer: ({{ text: "", bytes: 0, clipped: false }})
+  property var stderrBuffer: ({{ text: "", bytes: 0, clipped: false }})
+  property var stderrWindow: ({{ start: 0, bytes: 0, lines: 0, suppressed: 0 }})
+  property int truncatedOutputs: 0
+  property int truncatedTooltips: 0
+  property int suppressedStderr: 0
+
+  readonly property string statusNote: {{
+    var notes = [];
+    if (truncatedOutputs > 0) notes.push(`output cut at ${{maxOutputBytes}} bytes ${{truncatedOutputs}}x`);
+//@if poll
+    if (timeoutCount > 0) notes.push(`timed out ${{timeoutCount}}x`);
+    if (missedTicks > 0) notes.push(`${{missedTicks}} missed update(s)`);
+//@endif
+//@if stream
+    if (circuitOpen) notes.push(`stopped after ${{restartFailures}} failed restarts`);
+    else if (restartFailures > 0) notes.push(`restarted ${{restartFailures}}x`);
+//@endif
+    return notes.join(", ");
+  }}
+
+//@if coprocess
+  // Coprocess framing: each request ends with a line "<token> <exit code>".
+  readonly property string coprocNonce: Math.random().toString(36).slice(2)
+  property int coprocSeq: 0
+  property string coprocToken: ""
+  property bool coprocBusy: false
+  property bool coprocPending: false
+  property var coprocLines: []
+  property int coprocBytes: 0
+  property var coprocStdoutBuffer: ({{ text: "", bytes: 0, clipped: false }})
+  property var coprocStderrBuffer: ({{ text: "", bytes: 0, clipped: false }})
+//@endif
+
+//@if dynamic
+  readonly property bool isStreaming: intervalMode === "once"
+//@endif
+//@if !dynamic
+  readonly property bool isStreaming: {str(defaults["intervalMode"] == "once").lower()}
+//@endif
+
+  signal refreshed()
+
+  // Raw chunks rather than lines or a whole-run collector, so the capped
+  // buffers below are the only place output accumulates.
+//@if stream
+  SplitParser {{
+    id: stdoutSplit
+    splitMarker: ""
+    onRead: data => root.splitLines(root.stdoutBuffer, data, root.maxOutputBytes).forEach(line => root.acceptLine(line))
+  }}
+
+//@endif
+//@if poll
+  SplitParser {{
+    id: stdoutCollect
+    splitMarker: ""
+    onRead: data => root.collectOutput(data)
+  }}
+
+//@endif
+  SplitParser {{
+    id: stderrSplit
+    splitMarker: ""
+    onRead: data => root.splitLines(root.stderrBuffer, data, root.maxStderrBytes).forEach(line => root.logStderr(line))
+  }}
+
+  // setsid makes the shell a process group leader so a timeout can kill
+  // every child it spawned, not just the shell itself.
+  Process {{
+    id: textProc
+    command: ["setsid"].concat(root.buildArgv())
+//@if poll&stream
+    stdout: isStreaming ? stdoutSplit : stdoutCollect
+//@endif
+//@if poll&!stream
+    stdout: stdoutCollect
+//@endif
+//@if stream&!poll
+    stdout: stdoutSplit
+//@endif
+    stderr: stderrSplit
+//@if poll
+    onRunningChanged: {{
+      if (running && !isStreaming && timeoutMs > 0) {{
+        timeoutTimer.restart();
+      }} else if (!running) {{
+        timeoutTimer.stop();
+//@if budget
+        root.releaseSpawnSlot();
+//@endif
+      }}
+    }}
+//@endif
+//@if stream
+    onStarted: {{
+      root.streamStartedAt = Date.now();
+//@if patch
+      root.streamState = ({{}});
+//@endif
+    }}
+//@endif
+    onExited: (exitCode, exitStatus) => {{
+      root.flushOutput();
+//@if stream
+      if (isStreaming && root.droppedLines > 0) {{
+        Logger.d(root.logTag, `stream exited, ${{root.droppedLines}} line(s) coalesced so far`);
+      }}
+      if (isStreaming && restartIntervalMs > 0) {{
+        root.scheduleRestart(exitCode, exitStatus);
+      }}
+//@endif
+    }}
+  }}
+
+//@if coprocess
+  Process {{
+    id: shellProc
+    command: ["setsid", "sh"].concat(root.loginShell ? ["-l"] : [])
+    stdinEnabled: true
+    stdout: SplitParser {{
+      splitMarker: ""
+      onRead: data => root.splitLines(root.coprocStdoutBuffer, data, root.maxOutputBytes).forEach(line => root.handleCoprocLine(line))
+    }}
+    stderr: SplitParser {{
+      splitMarker: ""
+      onRead: data => root.splitLines(root.coprocStderrBuffer, data, root.maxStderrBytes).forEach(line => root.logStderr(line))
+    }}
+    onStarted: {{
+      if (root.coprocPending) {{
+        root.coprocPending = false;
+        root.sendToCoprocess();
+      }}
+    }}
+    onExited: (exitCode, exitStatus) => {{
+      root.takeBuffer(root.coprocStdoutBuffer);
+      var err = root.takeBuffer(root.coprocStderrBuffer);
+      if (err) root.logStderr(err);
+      if (root.coprocBusy) {{
+        root.coprocBusy = false;
+        timeoutTimer.stop();
+        Logger.w(root.logTag, `shell coprocess exited (${{exitCode}}) during a run`);
+      }}
+      if (root.useCoprocess) coprocRestartTimer.start();
+    }}
+  }}
+
+  Timer {{
+    id: coprocRestartTimer
+    interval: 1000
+    repeat: false
+    onTriggered: {{
+      if (root.useCoprocess && !shellProc.running) shellProc.running = true;
+    }}
+  }}
+
+//@endif
+//@if fileRead
+  FileView {{
+    id: fileReader
+    path: root.useFileRead ? root.fileRead.path : ""
+    blockLoading: true
+    preload: false
+    printErrors: false
+  }}
+
+//@endif
+//@if hyprland
+  Connections {{
+    target: root.useHyprland ? HyprlandProvider : null
+    function onUpdated(query) {{
+      if (query !== root.hyprland.query) return;
+      if (root.hyprland.direct) root.parseOutput(HyprlandProvider.cache[query]);
+      else root.runCommand(false);
+    }}
+    Component.onDestruction: {{
+      if (root.useHyprland) HyprlandProvider.unsubscribe(root.hyprland.query);
+    }}
+  }}
+
+//@endif
+//@if shared
+  FileView {{
+    id: sharedOutput
+    path: root.sharedPath ? root.sharedPath + ".out" : ""
+    watchChanges: root.useSharedSource
+    atomicWrites: false
+    printErrors: false
+    onFileChanged: reload()
+    onLoaded: {{
+      if (root.useSharedSource) root.parseOutput(text());
+    }}
+  }}
+
+  FileView {{
+    id: sharedRequest
+    path: root.sharedPath ? root.sharedPath + ".req" : ""
+    watchChanges: root.publishesShared
+    atomicWrites: false
+    printErrors: false
+    onFileChanged: {{
+      if (root.publishesShared) root.refresh();
+    }}
+  }}
+
+//@if poll
+  FileView {{
+    id: sharedActive
+    path: root.useSharedSource && root.sharedName ? `${{root.sharedPath}}.${{root.sharedName}}.active` : ""
+    atomicWrites: false
+    printErrors: false
+  }}
+
+  Instantiator {{
+    model: root.publishesShared ? root.sharedConsumers : []
+    delegate: FileView {{
+      required property string modelData
+      path: `${{root.sharedPath}}.${{modelData}}.active`
+      watchChanges: true
+      atomicWrites: false
+      printErrors: false
+      onFileChanged: reload()
+      onLoaded: root.setConsumerActive(modelData, text().trim() === "1")
+      onLoadFailed: root.setConsumerActive(modelData, false)
+    }}
+  }}
+
+//@endif
+//@endif
+//@if poll
+  Timer {{
     id: pollTimer
-    interval: Math.max(250, intervalSeconds * 1000)
+    interval: root.pollIntervalMs
     repeat: true
-    running: intervalMode === "poll" && textCommand.length > 0
+//@if shared
+    running: !isStreaming && textCommand.length > 0 && !useSharedSource && pollActive
+//@endif
+//@if !shared
+    running: !isStreaming && textCommand.length > 0 && pollActive
+//@endif
+//@if hyprland
+      && !useHyprland
+//@endif
     triggeredOnStart: true
     onTriggered: runCommand()
+//@if power
+    onRunningChanged: root.trackPowerState(running)
+    Component.onDestruction: root.trackPowerState(false)
+//@endif
+  }}
+
+//@if idle
+  IdleMonitor {{
+    id: idleMonitor
+    enabled: root.idlePauseSeconds > 0 && !root.alwaysPoll
+    timeout: Math.max(1, root.idlePauseSeconds)
+    respectInhibitors: true
+  }}
+
+//@endif
+//@if visibility
+  // Bar widgets report in once loaded; if none has after this grace period,
+  // the widget is not placed on any bar and polling stops.
+  Timer {{
+    id: visibilityGraceTimer
+    interval: 10000
+    running: true
+    repeat: false
+    onTriggered: root.visibilityKnown = true
+  }}
+
+//@endif
+
+  Timer {{
+    id: timeoutTimer
+    interval: Math.max(100, timeoutMs)
+    repeat: false
+    onTriggered: root.killOverrun()
   }}
 
+//@endif
+//@if stream
   Timer {{
     id: restartTimer
-    interval: Math.max(500, restartIntervalMs)
     repeat: false
     onTriggered: runCommand()
   }}
 
+  Timer {{
+    id: coalesceTimer
+    repeat: false
+    onTriggered: root.flushPendingLine()
+  }}
+
+//@endif
+//@if stream
+  function scheduleRestart(exitCode, exitStatus) {{
+    // Only non-zero or crashed exits count; a clean exit is Waybar's
+    // restart-interval pattern and always restarts after the base interval.
+    var failed = exitCode !== 0 || exitStatus !== 0;
+    if (!failed || Date.now() - streamStartedAt >= restartHealthyMs) {{
+      restartFailures = 0;
+    }} else {{
+      restartFailures += 1;
+    }}
+    if (restartMaxFailures > 0 && restartFailures >= restartMaxFailures) {{
+      circuitOpen = true;
+      Logger.w(root.logTag, `stream exited ${{restartFailures}}x in a row, not restarting until refreshed`);
+      return;
+    }}
+    var delay = Math.max(500, restartIntervalMs) * Math.pow(2, Math.max(0, restartFailures - 1));
+    delay = Math.min(delay, Math.max(500, restartBackoffMaxMs));
+    restartTimer.interval = Math.round(delay * (0.8 + Math.random() * 0.4));
+    restartTimer.start();
+  }}
+
+  function acceptLine(line) {{
+//@if patch
+    if (acceptsPatches() && mergeStreamLine(line)) line = null;
+//@endif
+    if (maxUpdateRate <= 0) {{
+      applyLine(line);
+      return;
+    }}
+    if (hasPendingLine && pendingLine !== null) droppedLines += 1;
+    pendingLine = line;
+    hasPendingLine = true;
+    if (coalesceTimer.running) return;
+    var wait = lastLineApplied + 1000 / maxUpdateRate - Date.now();
+    if (wait <= 0) {{
+      flushPendingLine();
+    }} else {{
+      coalesceTimer.interval = Math.ceil(wait);
+      coalesceTimer.start();
+    }}
+  }}
+
+  function flushPendingLine() {{
+    if (!hasPendingLine) return;
+    var line = pendingLine;
+    hasPendingLine = false;
+    pendingLine = "";
+    lastLineApplied = Date.now();
+    applyLine(line);
+  }}
+
+  function applyLine(line) {{
+//@if patch
+    if (line === null) {{
+      renderStreamState();
+      return;
+    }}
+//@endif
+    parseOutput(line);
+  }}
+
+//@endif
+//@if patch
+  function acceptsPatches() {{
+//@if dynamic
+    if (!parseJson) return false;
+//@endif
+//@if shared
+    if (publishesShared) return false;
+//@endif
+    return patchProtocol;
+  }}
+
+  // Returns false for lines that are not JSON objects; those take the
+  // regular parseOutput path.
+  function mergeStreamLine(line) {{
+    var raw = String(line || "").trim();
+    if (!raw) return false;
+    var parsed;
+    try {{
+      parsed = JSON.parse(raw);
+    }} catch (e) {{
+      return false;
+    }}
+    if (!parsed || typeof parsed !== "object" || Array.isArray(parsed)) return false;
+    if (!parsed["$patch"]) {{
+      streamState = parsed;
+      formatDirty = true;
+      tooltipDirty = true;
+      return true;
+    }}
+    for (var key in parsed) {{
+      if (key === "$patch") continue;
+      if (parsed[key] === null) delete streamState[key];
+      else streamState[key] = parsed[key];
+      if (key === "tooltip") tooltipDirty = true;
+      else formatDirty = true;
+    }}
+    return true;
+  }}
+
+  function renderStreamState() {{
+    if (formatDirty) {{
+      var icon = pickIcon(streamState);
+      displayText = applyFormat(formatString, streamState, icon);
+      displayIcon = icon;
+    }}
+    if (tooltipDirty) displayTooltip = clipTooltip(streamState.tooltip || "");
+    formatDirty = false;
+    tooltipDirty = false;
+    refreshed();
+  }}
+
+//@endif
+  // Size of a string once encoded as UTF-8 (surrogate pairs are 4 bytes).
+  function utf8Length(text) {{
+    var bytes = text.length;
+    for (var i = 0; i < text.length; i++) {{
+      var c = text.charCodeAt(i);
+      if (c >= 0x80) bytes += (c < 0x800 || (c >= 0xd800 && c <= 0xdfff)) ? 1 : 2;
+    }}
+    return bytes;
+  }}
+
+  // Longest prefix of text that fits in limit UTF-8 bytes, never splitting
+  // a surrogate pair.
+  function clipUtf8(text, limit) {{
+    var bytes = 0;
+    for (var i = 0; i < text.length; i++) {{
+      var c = text.charCodeAt(i);
+      var size = c < 0x80 ? 1 : c < 0x800 ? 2 : (c >= 0xd800 && c <= 0xdbff) ? 4 : 3;
+      if (bytes + size > limit) return text.slice(0, i);
+      bytes += size;
+      if (size === 4) i += 1;
+    }}
+    return text;
+  }}
+
+  // Appends text to buffer, keeping at most limit UTF-8 bytes; returns true
+  // when this append cut it.
+  function appendCapped(buffer, text, limit) {{
+    buffer.text += text;
+    buffer.bytes += utf8Length(text);
+    if (limit <= 0 || buffer.bytes <= limit) return false;
+    buffer.text = clipUtf8(buffer.text, limit);
+    buffer.bytes = utf8Length(buffer.text);
+    buffer.clipped = true;
+    return true;
+  }}
+
+  // Appends a chunk to buffer.text and returns the lines it completes. An
+  // unfinished line grows to at most limit bytes; the rest of it is
+  // dropped until the next newline.
+  function splitLines(buffer, data, limit) {{
+    var parts = data.split("\\n");
+    var lines = [];
+    for (var i = 0; i < parts.length; i++) {{
+      if (!buffer.clipped && appendCapped(buffer, parts[i], limit) && buffer === stdoutBuffer) {{
+        noteTruncatedOutput();
+      }}
+      if (i < parts.length - 1) lines.push(takeBuffer(buffer));
+    }}
+    return lines;
+  }}
+
+  function collectOutput(data) {{
+    if (stdoutBuffer.clipped) return;
+    if (appendCapped(stdoutBuffer, data, maxOutputBytes)) noteTruncatedOutput();
+  }}
+
+  function takeBuffer(buffer) {{
+    var text = buffer.text;
+    buffer.text = "";
+    buffer.bytes = 0;
+    buffer.clipped = false;
+    return text;
+  }}
+
+  // Hands over what the command left in the buffers when it exits.
+  function flushOutput() {{
+    var err = takeBuffer(stderrBuffer);
+    if (err) logStderr(err);
+    var out = takeBuffer(stdoutBuffer);
+//@if stream
+    if (isStreaming) {{
+      if (out) acceptLine(out);
+      return;
+    }}
+//@endif
+//@if poll
+    parseOutput(out);
+//@endif
+  }}
+
+  function noteTruncatedOutput() {{
+    truncatedOutputs += 1;
+    if (truncatedOutputs === 1 || truncatedOutputs % 100 === 0) {{
+      Logger.w(root.logTag, `output over ${{maxOutputBytes}} bytes dropped (${{truncatedOutputs}}x so far)`);
+    }}
+  }}
+
+  function clipTooltip(tooltip) {{
+    var text = String(tooltip);
+    if (maxTooltipChars <= 0 || text.length <= maxTooltipChars) return text;
+    truncatedTooltips += 1;
+    return text.slice(0, maxTooltipChars) + "\u2026";
+  }}
+
+  function logStderr(line) {{
+    var text = String(line).trim();
+    if (!text) return;
+    var now = Date.now();
+    if (now - stderrWindow.start >= {STDERR_LOG_WINDOW_MS}) {{
+      if (stderrWindow.suppressed > 0) {{
+        Logger.w(root.logTag, `${{stderrWindow.suppressed}} stderr line(s) not logged (${{suppressedStderr}} in total)`);
+      }}
+      stderrWindow = {{ start: now, bytes: 0, lines: 0, suppressed: 0 }};
+    }}
+    var bytes = utf8Length(text);
+    if (maxStderrBytes > 0 && bytes > maxStderrBytes) {{
+      text = clipUtf8(text, maxStderrBytes) + "\u2026";
+      bytes = maxStderrBytes;
+    }}
+    if (stderrWindow.lines >= {STDERR_LOG_LINES} || (maxStderrBytes > 0 && stderrWindow.lines > 0 && stderrWindow.bytes + bytes > maxStderrBytes)) {{
+      stderrWindow.suppressed += 1;
+      suppressedStderr += 1;
+      return;
+    }}
+    stderrWindow.lines += 1;
+    stderrWindow.bytes += bytes;
+    Logger.w(root.logTag, text);
+  }}
+
   function buildCommand() {{
     if (!execIf) return textCommand;
     return `if ${{execIf}}; then ${{textCommand}}; fi`;
   }}
 
-  function runCommand() {{
-    if (!textCommand || textProc.running) return;
+  function buildArgv() {{
+    var argv = directArgv.length > 0 ? directArgv : ["sh", loginShell ? "-lc" : "-c", buildCommand()];
+//@if nice
+    if (niceCommand) return {qml_literal(NICE_PREFIX)}.concat(argv);
+//@endif
+    return argv;
+  }}
+
+//@if coprocess
+  function shellQuote(value) {{
+    return "'" + String(value).split("'").join("'\\\\''") + "'";
+  }}
+
+  // The command runs in a subshell via eval so cd/export/variables cannot
+  // leak between runs and a syntax error cannot kill the coprocess. stdin is
+  // detached so the child never consumes the framing channel.
+  function sendToCoprocess() {{
+    coprocSeq += 1;
+    coprocToken = `__waybar_${{coprocNonce}}_${{coprocSeq}}__`;
+    coprocLines = [];
+    coprocBytes = 0;
+    shellProc.write(`( eval ${{shellQuote(buildCommand())}} ) </dev/null; printf '\\\\n%s %d\\\\n' '${{coprocToken}}' "$?"\\n`);
+    if (timeoutMs > 0) timeoutTimer.restart();
+  }}
+
+  function handleCoprocLine(line) {{
+    if (!coprocBusy) return;
+    if (line.indexOf(coprocToken) === 0) {{
+      coprocBusy = false;
+      timeoutTimer.stop();
+      parseOutput(coprocLines.join("\\n"));
+      coprocLines = [];
+      coprocBytes = 0;
+      return;
+    }}
+    if (maxOutputBytes > 0 && coprocBytes >= maxOutputBytes) return;
+    var room = maxOutputBytes - coprocBytes;
+    coprocBytes += utf8Length(line) + 1;
+    if (maxOutputBytes > 0 && coprocBytes > maxOutputBytes) {{
+      line = clipUtf8(line, room);
+      noteTruncatedOutput();
+    }}
+    coprocLines.push(line);
+  }}
+
+//@endif
+//@if fileRead
+  function extractFileRead(content) {{
+    var lines = String(content || "").split("\\n");
+    if (lines.length > 0 && lines[lines.length - 1] === "") lines.pop();
+    if (fileRead.op === "head") {{
+      lines = lines.slice(0, fileRead.lines);
+    }} else if (fileRead.op === "awk") {{
+      var sep = fileRead.separator || "";
+      lines = lines.map(line => {{
+        var parts = sep ? line.split(sep) : line.trim().split(/\\s+/);
+        return fileRead.fields.map(idx => idx === 0 ? line : (parts[idx - 1] || "")).join(" ");
+      }});
+    }}
+    return lines.join("\\n");
+  }}
+
+  function readPseudoFile() {{
+    fileReader.reload();
+    parseOutput(extractFileRead(fileReader.text()));
+  }}
+
+//@endif
+//@if hyprland
+  function subscribeHyprland() {{
+    var cached = HyprlandProvider.subscribe(hyprland.query, hyprland.events);
+    if (cached !== undefined && hyprland.direct) parseOutput(cached);
+  }}
+
+//@endif
+  function runCommand(urgent) {{
+//@if shared
+    if (!textCommand || useSharedSource) return;
+//@endif
+//@if !shared
+    if (!textCommand) return;
+//@endif
+//@if fileRead
+    if (useFileRead) {{
+      readPseudoFile();
+      return;
+    }}
+//@endif
+//@if hyprland
+    if (useHyprland && hyprland.direct) {{
+      HyprlandProvider.refresh(hyprland.query);
+      return;
+    }}
+//@endif
+//@if coprocess
+    if (useCoprocess) {{
+      if (coprocBusy) {{
+        missedTicks += 1;
+        Logger.d(root.logTag, `previous run still active, skipped tick (${{missedTicks}} missed)`);
+        return;
+      }}
+      runTimedOut = false;
+      coprocBusy = true;
+      if (shellProc.running) {{
+        sendToCoprocess();
+      }} else {{
+        coprocPending = true;
+        shellProc.running = true;
+      }}
+      return;
+    }}
+//@endif
+//@if budget
+    if (spawnQueued) {{
+      if (urgent) SpawnBudget.request(root, 0, () => root.startBudgeted());
+      return;
+    }}
+//@endif
+    if (textProc.running) {{
+//@if poll
+      missedTicks += 1;
+      Logger.d(root.logTag, `previous run still active, skipped tick (${{missedTicks}} missed)`);
+//@endif
+      return;
+    }}
+//@if budget
+    if (spawnBudget > 0 && !isStreaming) {{
+      SpawnBudget.limit = spawnBudget;
+      spawnQueued = true;
+      SpawnBudget.request(root, urgent ? 0 : spawnPriority, () => root.startBudgeted());
+      return;
+    }}
+//@endif
+//@if poll
+    runTimedOut = false;
+//@endif
+    textProc.running = true;
+  }}
+
+//@if budget
+  function startBudgeted() {{
+    spawnQueued = false;
+    holdsSpawnSlot = true;
+    runTimedOut = false;
     textProc.running = true;
+    if (!textProc.running) releaseSpawnSlot();
+  }}
+
+  function releaseSpawnSlot() {{
+    if (!holdsSpawnSlot) return;
+    holdsSpawnSlot = false;
+    SpawnBudget.release();
+  }}
+
+  Component.onDestruction: {{
+    SpawnBudget.cancel(root);
+    releaseSpawnSlot();
+  }}
+
+//@endif
+
+//@if poll&visibility
+  function setWidgetVisible(key, shown) {{
+    var next = Object.assign({{}}, visibleWidgets);
+    if (shown) {{
+      next[key] = true;
+    }} else {{
+      delete next[key];
+    }}
+    visibleWidgets = next;
+    visibleWidgetCount = Object.keys(next).length;
+    visibilityKnown = true;
+  }}
+
+//@endif
+//@if poll&power
+  // PowerState only reads sysfs while some plugin's poll timer runs.
+  function trackPowerState(on) {{
+    if (on === holdsPowerState) return;
+    holdsPowerState = on;
+    if (on) PowerState.acquire();
+    else PowerState.release();
+  }}
+
+  // Back on AC: run now instead of waiting out the stretched interval.
+  onOnBatteryChanged: {{
+    if (!onBattery && pollTimer.running) runCommand();
+  }}
+
+//@endif
+//@if poll
+  onPollActiveChanged: {{
+    Logger.d(root.logTag, pollActive ? "widget visible, polling resumed" : "no visible widget or user idle, polling paused");
+//@if shared
+    reportSharedActive();
+//@endif
+  }}
+
+//@if shared
+  function reportSharedActive() {{
+    if (useSharedSource && !isStreaming && sharedName) sharedActive.setText(pollActive ? "1" : "0");
+  }}
+
+  function setConsumerActive(name, active) {{
+    if (!!activeConsumers[name] === active) return;
+    var next = Object.assign({{}}, activeConsumers);
+    if (active) {{
+      next[name] = true;
+    }} else {{
+      delete next[name];
+    }}
+    activeConsumers = next;
+  }}
+
+//@endif
+
+  function killOverrun() {{
+//@if coprocess
+    if (useCoprocess) {{
+      if (!coprocBusy) return;
+      timeoutCount += 1;
+      coprocBusy = false;
+      Logger.w(root.logTag, `command exceeded ${{timeoutMs}}ms, restarting shell coprocess`);
+      if (shellProc.processId) {{
+        Quickshell.execDetached(["kill", "-KILL", "--", `-${{shellProc.processId}}`]);
+      }}
+      shellProc.running = false;
+      return;
+    }}
+//@endif
+    if (!textProc.running) return;
+    runTimedOut = true;
+    timeoutCount += 1;
+    Logger.w(root.logTag, `command exceeded ${{timeoutMs}}ms, killing process group`);
+    if (textProc.processId) {{
+      Quickshell.execDetached(["kill", "-KILL", "--", `-${{textProc.processId}}`]);
+    }}
+    textProc.running = false;
   }}
 
+//@endif
   function refresh() {{
-    if (intervalMode === "poll") {{
+//@if shared
+    if (useSharedSource) {{
+      sharedRequest.setText(String(Date.now()));
+      return;
+    }}
+//@endif
+//@if poll
+    if (!isStreaming) {{
+      runCommand(true);
+    }}
+//@endif
+//@if stream
+    if (isStreaming && circuitOpen) {{
+      circuitOpen = false;
+      restartFailures = 0;
       runCommand();
     }}
+//@endif
   }}
 
+//@if json
   function pickIcon(data) {{
     var icon = data.icon || "";
     if (!formatIcons || formatIcons.length === 0) return icon;
@@ -652,6 +3029,7 @@ Item {{
     return icon;
   }}
 
+//@endif
   function applyFormat(fmt, data, icon) {{
     if (!fmt || fmt === "{{}}" || fmt === "{{text}}") return data.text || "";
     var out = fmt.replace("{{}}", data.text || "");
@@ -669,9 +3047,16 @@ Item {{
   }}
 
   function parseOutput(content) {{
+//@if poll
+    if (runTimedOut) return;
+//@endif
     var raw = String(content || "").trim();
     if (!raw) return;
+//@if shared
+    if (publishesShared) sharedOutput.setText(raw);
+//@endif
 
+//@if dynamic
     if (parseJson) {{
       try {{
         var parsed = JSON.parse(raw);
@@ -679,120 +3064,89 @@ Item {{
         var display = applyFormat(formatString, parsed || {{}}, icon);
         displayText = display;
         displayIcon = icon;
-        displayTooltip = parsed.tooltip || "";
+        displayTooltip = clipTooltip(parsed.tooltip || "");
       }} catch (e) {{
         displayText = raw;
         displayIcon = "";
-        displayTooltip = raw;
+        displayTooltip = clipTooltip(raw);
       }}
     }} else {{
       var formatted = applyFormat(formatString, {{ text: raw }}, "");
       displayText = formatted;
       displayIcon = "";
-      displayTooltip = raw;
+      displayTooltip = clipTooltip(raw);
     }}
+//@endif
+//@if json&!dynamic
+    try {{
+      var parsed = JSON.parse(raw);
+      var icon = pickIcon(parsed || {{}});
+      displayText = applyFormat(formatString, parsed || {{}}, icon);
+      displayIcon = icon;
+      displayTooltip = clipTooltip(parsed.tooltip || "");
+    }} catch (e) {{
+      displayText = raw;
+      displayIcon = "";
+      displayTooltip = clipTooltip(raw);
+    }}
+//@endif
+//@if plain&!dynamic
+    displayText = applyFormat(formatString, {{ text: raw }}, "");
+    displayIcon = "";
+    displayTooltip = clipTooltip(raw);
+//@endif
 
     refreshed();
   }}
 
+//@if coprocess
+  onUseCoprocessChanged: {{
+    if (!useCoprocess && shellProc.running) shellProc.running = false;
+  }}
+
+//@endif
+//@if hyprland
+  onUseHyprlandChanged: {{
+    if (useHyprland) subscribeHyprland();
+    else HyprlandProvider.unsubscribe(hyprland.query);
+  }}
+
+//@endif
   Component.onCompleted: {{
+//@if shared
+    if (publishesShared) sharedRequest.setText("");
+//@endif
+//@if shared&poll
+    reportSharedActive();
+//@endif
+//@if hyprland
+    if (useHyprland) subscribeHyprland();
+//@endif
+//@if poll
+    // A running poll timer makes the first run itself (triggeredOnStart).
+    if (textCommand.length > 0 && !pollTimer.running) {{
+//@endif
+//@if !poll
     if (textCommand.length > 0) {{
+//@endif
       runCommand();
     }}
   }}
 }}
-'''
+''', RUNTIME_FEATURES if features is None else features)
+
 
-    with open(plugin_dir / "Main.qml", "w", encoding="utf-8") as f:
-        f.write(main_qml)
+def render_settings_qml(defaults: dict, features: Optional[set[str]] = None) -> str:
+    """Render the settings form (plugin Settings.qml) for a custom module.
 
-    escaped_left = escape_qml_string(module.on_click)
-    escaped_right = escape_qml_string(module.on_click_right)
-    escaped_middle = escape_qml_string(module.on_click_middle)
-    escaped_scroll_up = escape_qml_string(module.on_scroll_up)
-    escaped_scroll_down = escape_qml_string(module.on_scroll_down)
+    Only settings the specialized runner reads are offered; ``None`` keeps
+    every row.
+    """
 
-    bar_widget_qml = f'''import QtQuick
-import QtQuick.Controls
-import QtQuick.Layouts
-import Quickshell
-import qs.Commons
-import qs.Modules.Bar.Extras
-import qs.Modules.Panels.Settings
-import qs.Services.UI
-import qs.Widgets
-
-Item {{
-  id: root
-
-  property var pluginApi: null
-  property ShellScreen screen
-
-  property string widgetId: ""
-  property string section: ""
-  property int sectionWidgetIndex: -1
-  property int sectionWidgetsCount: 0
-  property real scaling: 1.0
-
-  readonly property var pluginMain: pluginApi?.mainInstance
-
-  readonly property string barPosition: Settings.data.bar.position
-  readonly property bool isBarVertical: barPosition === "left" || barPosition === "right"
-
-  readonly property string pillText: isBarVertical ? "" : (pluginMain?.displayText || "")
-  readonly property string iconName: pluginMain?.displayIcon || ""
-
-  implicitWidth: pill.width
-  implicitHeight: pill.height
-
-  BarPill {{
-    id: pill
-
-    screen: root.screen
-    density: Settings.data.bar.density
-    oppositeDirection: BarService.getPillDirection(root)
-    icon: iconName
-    text: pillText
-    tooltipText: pluginMain?.displayTooltip || pluginMain?.displayText || ""
-    forceOpen: !isBarVertical && (pluginMain?.displayText || "") !== ""
-    onClicked: runDetached("{escaped_left}", {str(module.exec_on_event).lower()})
-    onRightClicked: runDetached("{escaped_right}", {str(module.exec_on_event).lower()})
-    onMiddleClicked: runDetached("{escaped_middle}", {str(module.exec_on_event).lower()})
-  }}
-
-  function runDetached(cmd, shouldRefresh) {{
-    if (!cmd) return;
-    Quickshell.execDetached(["sh", "-c", cmd]);
-    if (shouldRefresh) {{
-      pluginMain?.refresh();
-    }}
-  }}
-
-  function runScroll(cmd, shouldRefresh) {{
-    if (!cmd) return;
-    Quickshell.execDetached(["sh", "-c", cmd]);
-    if (shouldRefresh) {{
-      pluginMain?.refresh();
-    }}
-  }}
-
-  WheelHandler {{
-    enabled: true
-    onWheel: (event) => {{
-      if (event.angleDelta.y > 0) {{
-        runScroll("{escaped_scroll_up}", {str(module.exec_on_event).lower()});
-      }} else if (event.angleDelta.y < 0) {{
-        runScroll("{escaped_scroll_down}", {str(module.exec_on_event).lower()});
-      }}
-    }}
-  }}
-}}
-'''
-
-    with open(plugin_dir / "BarWidget.qml", "w", encoding="utf-8") as f:
-        f.write(bar_widget_qml)
-
-    settings_qml = f'''import QtQuick
+    def lit(key: str) -> str:
+        return qml_literal(defaults[key])
+
+    return select_sections(f'''import QtQuick
 import QtQuick.Controls
 import QtQuick.Layouts
 import qs.Commons
@@ -809,11 +3163,41 @@ Item {{
     return (value !== undefined && value !== null) ? value : fallback;
   }}
 
-  property string valueTextCommand: settingOr(pluginApi?.pluginSettings?.textCommand, settingOr(defaultSettings.textCommand, "{escape_qml_string(module.exec_cmd)}"))
-  property int valueInterval: settingOr(pluginApi?.pluginSettings?.interval, settingOr(defaultSettings.interval, {interval_setting}))
-  property string valueIntervalMode: settingOr(pluginApi?.pluginSettings?.intervalMode, settingOr(defaultSettings.intervalMode, "{module.interval_mode}"))
-  property int valueRestartMs: settingOr(pluginApi?.pluginSettings?.restartIntervalMs, settingOr(defaultSettings.restartIntervalMs, 0))
-  property bool valueParseJson: settingOr(pluginApi?.pluginSettings?.parseJson, settingOr(defaultSettings.parseJson, {str(module.return_type == "json").lower()}))
+  property string valueTextCommand: settingOr(pluginApi?.pluginSettings?.textCommand, settingOr(defaultSettings.textCommand, {lit("textCommand")}))
+//@if poll
+  property int valueInterval: settingOr(pluginApi?.pluginSettings?.interval, settingOr(defaultSettings.interval, {lit("interval")}))
+//@endif
+//@if dynamic
+  property string valueIntervalMode: settingOr(pluginApi?.pluginSettings?.intervalMode, settingOr(defaultSettings.intervalMode, {lit("intervalMode")}))
+//@endif
+//@if stream
+  property int valueRestartMs: settingOr(pluginApi?.pluginSettings?.restartIntervalMs, settingOr(defaultSettings.restartIntervalMs, {lit("restartIntervalMs")}))
+  property int valueMaxUpdateRate: settingOr(pluginApi?.pluginSettings?.maxUpdateRate, settingOr(defaultSettings.maxUpdateRate, {lit("maxUpdateRate")}))
+//@endif
+//@if patch
+  property bool valuePatchProtocol: settingOr(pluginApi?.pluginSettings?.patchProtocol, settingOr(defaultSettings.patchProtocol, {lit("patchProtocol")}))
+//@endif
+//@if dynamic
+  property bool valueParseJson: settingOr(pluginApi?.pluginSettings?.parseJson, settingOr(defaultSettings.parseJson, {lit("parseJson")}))
+//@endif
+//@if poll
+  property int valueTimeoutMs: settingOr(pluginApi?.pluginSettings?.timeoutMs, settingOr(defaultSettings.timeoutMs, {lit("timeoutMs")}))
+//@endif
+//@if visibility
+  property bool valueAlwaysPoll: settingOr(pluginApi?.pluginSettings?.alwaysPoll, settingOr(defaultSettings.alwaysPoll, {lit("alwaysPoll")}))
+//@endif
+//@if idle
+  property int valueIdlePause: settingOr(pluginApi?.pluginSettings?.idlePauseSeconds, settingOr(defaultSettings.idlePauseSeconds, {lit("idlePauseSeconds")}))
+//@endif
+//@if power
+  property real valueBatteryScale: settingOr(pluginApi?.pluginSettings?.batteryIntervalScale, settingOr(defaultSettings.batteryIntervalScale, {lit("batteryIntervalScale")}))
+  property real valueLowBatteryScale: settingOr(pluginApi?.pluginSettings?.lowBatteryIntervalScale, settingOr(defaultSettings.lowBatteryIntervalScale, {lit("lowBatteryIntervalScale")}))
+  property int valueLowBatteryPercent: settingOr(pluginApi?.pluginSettings?.lowBatteryPercent, settingOr(defaultSettings.lowBatteryPercent, {lit("lowBatteryPercent")}))
+//@endif
+  property bool valueLoginShell: settingOr(pluginApi?.pluginSettings?.loginShell, settingOr(defaultSettings.loginShell, {lit("loginShell")}))
+//@if dynamic
+  property string valueShellMode: settingOr(pluginApi?.pluginSettings?.shellMode, settingOr(defaultSettings.shellMode, {lit("shellMode")}))
+//@endif
 
   ColumnLayout {{
     anchors.fill: parent
@@ -830,6 +3214,7 @@ Item {{
       onTextChanged: valueTextCommand = text
     }}
 
+//@if dynamic
     SettingsRow {{
       label: pluginApi?.tr("settings.interval-mode") || "Interval mode"
       ComboBox {{
@@ -839,46 +3224,1475 @@ Item {{
       }}
     }}
 
+//@endif
+//@if poll
     SettingsRow {{
       label: pluginApi?.tr("settings.interval") || "Poll interval (seconds)"
       SpinBox {{
         from: 1
         to: 86400
         value: valueInterval
+//@if dynamic
         enabled: valueIntervalMode === "poll"
+//@endif
         onValueChanged: valueInterval = value
       }}
     }}
 
+//@endif
+//@if stream
     SettingsRow {{
       label: pluginApi?.tr("settings.restart") || "Restart interval (ms)"
       SpinBox {{
         from: 0
         to: 600000
         value: valueRestartMs
+//@if dynamic
         enabled: valueIntervalMode === "once"
+//@endif
         onValueChanged: valueRestartMs = value
       }}
     }}
 
-    SettingsRow {{
-      label: pluginApi?.tr("settings.parse-json") || "Parse JSON"
-      Switch {{
-        checked: valueParseJson
-        onToggled: valueParseJson = checked
-      }}
+    SettingsRow {{
+      label: pluginApi?.tr("settings.max-update-rate") || "Max updates per second (0 = unlimited)"
+      SpinBox {{
+        from: 0
+        to: 240
+        value: valueMaxUpdateRate
+//@if dynamic
+        enabled: valueIntervalMode === "once"
+//@endif
+        onValueChanged: valueMaxUpdateRate = value
+      }}
+    }}
+
+//@endif
+//@if patch
+    SettingsRow {{
+      label: pluginApi?.tr("settings.patch-protocol") || "Accept partial-update lines"
+      Switch {{
+        checked: valuePatchProtocol
+//@if dynamic
+        enabled: valueIntervalMode === "once" && valueParseJson
+//@endif
+        onToggled: valuePatchProtocol = checked
+      }}
+    }}
+
+//@endif
+//@if poll
+    SettingsRow {{
+      label: pluginApi?.tr("settings.timeout") || "Command timeout (ms, 0 = none)"
+      SpinBox {{
+        from: 0
+        to: {MAX_COMMAND_TIMEOUT_MS}
+        stepSize: 500
+        value: valueTimeoutMs
+//@if dynamic
+        enabled: valueIntervalMode === "poll"
+//@endif
+        onValueChanged: valueTimeoutMs = value
+      }}
+    }}
+
+//@if visibility
+    SettingsRow {{
+      label: pluginApi?.tr("settings.always-poll") || "Keep polling when hidden"
+      Switch {{
+        checked: valueAlwaysPoll
+        onToggled: valueAlwaysPoll = checked
+      }}
+    }}
+
+//@endif
+//@if idle
+    SettingsRow {{
+      label: pluginApi?.tr("settings.idle-pause") || "Pause after idle (s, 0 = never)"
+      SpinBox {{
+        from: 0
+        to: 86400
+        stepSize: 60
+        value: valueIdlePause
+        enabled: !valueAlwaysPoll
+        onValueChanged: valueIdlePause = value
+      }}
+    }}
+
+//@endif
+//@if power
+    // Multipliers are edited in tenths (20 = 2.0x).
+    SettingsRow {{
+      label: pluginApi?.tr("settings.battery-scale") || "Interval multiplier on battery"
+      SpinBox {{
+        from: 10
+        to: 1000
+        stepSize: 5
+        value: Math.round(valueBatteryScale * 10)
+        textFromValue: (value, locale) => (value / 10).toFixed(1) + "x"
+        valueFromText: (text, locale) => Math.round(parseFloat(text) * 10)
+        onValueChanged: valueBatteryScale = value / 10
+      }}
+    }}
+
+    SettingsRow {{
+      label: pluginApi?.tr("settings.low-battery-scale") || "Interval multiplier on low battery"
+      SpinBox {{
+        from: 10
+        to: 1000
+        stepSize: 5
+        value: Math.round(valueLowBatteryScale * 10)
+        textFromValue: (value, locale) => (value / 10).toFixed(1) + "x"
+        valueFromText: (text, locale) => Math.round(parseFloat(text) * 10)
+        onValueChanged: valueLowBatteryScale = value / 10
+      }}
+    }}
+
+    SettingsRow {{
+      label: pluginApi?.tr("settings.low-battery-percent") || "Low battery below (%)"
+      SpinBox {{
+        from: 0
+        to: 100
+        value: valueLowBatteryPercent
+        onValueChanged: valueLowBatteryPercent = value
+      }}
+    }}
+
+//@endif
+//@endif
+//@if dynamic
+    SettingsRow {{
+      label: pluginApi?.tr("settings.parse-json") || "Parse JSON"
+      Switch {{
+        checked: valueParseJson
+        onToggled: valueParseJson = checked
+      }}
+    }}
+
+//@endif
+    SettingsRow {{
+      label: pluginApi?.tr("settings.login-shell") || "Run shell commands as login shell"
+      Switch {{
+        checked: valueLoginShell
+        onToggled: valueLoginShell = checked
+      }}
+    }}
+
+//@if dynamic
+    SettingsRow {{
+      label: pluginApi?.tr("settings.shell-mode") || "Shell mode"
+      ComboBox {{
+        model: ["spawn", "coprocess"]
+        currentIndex: model.indexOf(valueShellMode)
+        enabled: valueIntervalMode === "poll"
+        onCurrentTextChanged: valueShellMode = currentText
+      }}
+    }}
+
+//@endif
+    SettingsButton {{
+      text: pluginApi?.tr("settings.save") || "Save"
+      onClicked: {{
+        if (!pluginApi) return;
+        pluginApi.pluginSettings.textCommand = valueTextCommand;
+//@if poll
+        pluginApi.pluginSettings.interval = valueInterval;
+//@endif
+//@if dynamic
+        pluginApi.pluginSettings.intervalMode = valueIntervalMode;
+//@endif
+//@if stream
+        pluginApi.pluginSettings.restartIntervalMs = valueRestartMs;
+        pluginApi.pluginSettings.maxUpdateRate = valueMaxUpdateRate;
+//@endif
+//@if patch
+        pluginApi.pluginSettings.patchProtocol = valuePatchProtocol;
+//@endif
+//@if dynamic
+        pluginApi.pluginSettings.parseJson = valueParseJson;
+//@endif
+//@if poll
+        pluginApi.pluginSettings.timeoutMs = valueTimeoutMs;
+//@endif
+//@if visibility
+        pluginApi.pluginSettings.alwaysPoll = valueAlwaysPoll;
+//@endif
+//@if idle
+        pluginApi.pluginSettings.idlePauseSeconds = valueIdlePause;
+//@endif
+//@if power
+        pluginApi.pluginSettings.batteryIntervalScale = valueBatteryScale;
+        pluginApi.pluginSettings.lowBatteryIntervalScale = valueLowBatteryScale;
+        pluginApi.pluginSettings.lowBatteryPercent = valueLowBatteryPercent;
+//@endif
+        pluginApi.pluginSettings.loginShell = valueLoginShell;
+//@if dynamic
+        pluginApi.pluginSettings.shellMode = valueShellMode;
+//@endif
+        pluginApi.saveSettings();
+        pluginApi.mainInstance?.refresh();
+      }}
+    }}
+  }}
+}}
+''', RUNTIME_FEATURES if features is None else features)
+
+
+def detect_battery_name() -> str:
+    """First BAT* power supply on this machine, or Waybar's usual BAT0."""
+    matches = sorted(glob.glob("/sys/class/power_supply/BAT*"))
+    return Path(matches[0]).name if matches else "BAT0"
+
+
+def spawn_priority(module: WaybarModule) -> int:
+    """Queue priority under --spawn-budget; lower runs first.
+
+    Fast pollers rank above slow ones and modules whose clicks refresh them
+    move up a tier. Refreshes triggered by a click always run at 0.
+    """
+    interval = module.interval or DEFAULT_WAYBAR_INTERVAL
+    priority = 1 if interval <= 5 else 2 if interval <= 60 else 3
+    if module.exec_on_event and any(getattr(module, attr) for _, _, attr, _ in ACTION_SETTINGS):
+        priority = max(1, priority - 1)
+    return priority
+
+
+def build_plugin_defaults(
+    module: WaybarModule,
+    default_interval: int,
+    login_shell: bool = False,
+    shell_mode: str = "spawn",
+    idle_pause: int = DEFAULT_IDLE_PAUSE_S,
+    power: Optional[PowerPolicy] = None,
+    max_update_rate: int = DEFAULT_MAX_UPDATE_RATE,
+    restart: Optional[RestartPolicy] = None,
+    spawn_budget: int = 0,
+    nice_background: bool = False,
+    limits: Optional[OutputLimits] = None,
+) -> dict:
+    """Everything a plugin needs to run ``module``, as manifest defaultSettings."""
+    interval_setting = module.interval if module.interval is not None else default_interval
+    file_read = transform_command(module).file_read
+    return {
+        "textCommand": module.exec_cmd,
+        "interval": interval_setting,
+        "intervalMode": module.interval_mode,
+        "restartIntervalMs": (module.restart_interval or 0) * 1000,
+        "maxUpdateRate": max_update_rate,
+        **(limits or OutputLimits()).to_settings(),
+        "patchProtocol": module.patch_stream,
+        **(restart or RestartPolicy()).to_settings(),
+        "spawnBudget": spawn_budget,
+        "spawnPriority": spawn_priority(module),
+        "niceCommand": nice_background and module.interval_mode == "poll" and spawn_priority(module) >= 3,
+        "parseJson": module.return_type == "json",
+        "timeoutMs": module.timeout_ms,
+        "textArgv": split_simple_command(module.exec_cmd) or [],
+        "loginShell": login_shell,
+        "shellMode": shell_mode,
+        "sharedSource": safe_file_stem(module.shared_source),
+        "sharedRole": module.shared_role,
+        "sharedName": safe_file_stem(module.name) if module.shared_source else "",
+        "sharedConsumers": [safe_file_stem(name) for name in module.shared_consumers],
+        "fileRead": file_read.to_dict() if file_read else None,
+        "hyprland": module.hyprland.to_dict() if module.hyprland else None,
+        "alwaysPoll": module.always_poll,
+        "idlePauseSeconds": idle_pause,
+        **(power or PowerPolicy()).to_settings(),
+        "execIf": module.exec_if,
+        "format": module.format or "{}",
+        "formatIcons": module.format_icons,
+        "escape": module.escape,
+        **build_action_settings(module),
+    }
+
+
+RUNTIME_PLUGIN_DIR = "waybar-runtime"
+
+SPAWN_BUDGET_QML = """pragma Singleton
+
+import QtQuick
+import Quickshell
+
+// Bar-wide cap on converted-module commands running at once. Requests over
+// the limit wait in one queue ordered by priority (lower first), then age.
+Singleton {
+  id: root
+
+  property int limit: 4
+  property int active: 0
+  property var queue: []
+  property int seq: 0
+
+  function request(owner, priority, start) {
+    var queued = queue.find(entry => entry.owner === owner);
+    if (queued) {
+      queued.priority = Math.min(queued.priority, priority);
+    } else if (active < limit) {
+      active += 1;
+      launch(start);
+      return;
+    } else {
+      seq += 1;
+      queue.push({ owner: owner, priority: priority, seq: seq, start: start });
+    }
+    queue.sort((a, b) => a.priority - b.priority || a.seq - b.seq);
+  }
+
+  function release() {
+    active = Math.max(0, active - 1);
+    while (active < limit && queue.length > 0) {
+      active += 1;
+      launch(queue.shift().start);
+    }
+  }
+
+  function cancel(owner) {
+    queue = queue.filter(entry => entry.owner !== owner);
+  }
+
+  function launch(start) {
+    try {
+      start();
+    } catch (e) {
+      release();
+    }
+  }
+}
+"""
+
+POWER_STATE_QML = """pragma Singleton
+
+import QtQuick
+import Qt.labs.folderlistmodel
+import Quickshell
+import Quickshell.Io
+
+// Battery state for every converted plugin with a power policy. The supply is
+// looked up at runtime, the first BAT* or CMB* entry in /sys/class/power_supply,
+// and its status and capacity are re-read on one timer while any plugin holds
+// a reference. sysfs reads fork nothing; without a battery nothing scales.
+Singleton {
+  id: root
+
+  property int users: 0
+  property string supply: ""
+  property bool onBattery: false
+  property int percent: 100
+
+  function acquire() {
+    users += 1;
+  }
+
+  function release() {
+    users = Math.max(0, users - 1);
+  }
+
+  FolderListModel {
+    id: supplies
+    folder: "file:///sys/class/power_supply"
+    showDotAndDotDot: false
+    onStatusChanged: if (status === FolderListModel.Ready) root.pickSupply()
+  }
+
+  function pickSupply() {
+    for (var i = 0; i < supplies.count; i++) {
+      var name = String(supplies.get(i, "fileName"));
+      if (/^(BAT|CMB)/i.test(name)) {
+        supply = name;
+        return;
+      }
+    }
+    supply = "";
+  }
+
+  FileView {
+    id: statusFile
+    path: root.supply ? `/sys/class/power_supply/${root.supply}/status` : ""
+    preload: false
+    printErrors: false
+    onLoaded: root.onBattery = text().trim() === "Discharging"
+    onLoadFailed: root.onBattery = false
+  }
+
+  FileView {
+    id: capacityFile
+    path: root.supply ? `/sys/class/power_supply/${root.supply}/capacity` : ""
+    preload: false
+    printErrors: false
+    onLoaded: {
+      var capacity = parseInt(text());
+      root.percent = isNaN(capacity) ? 100 : capacity;
+    }
+  }
+
+  // sysfs attributes do not signal changes, so they are re-read on a short
+  // fixed cadence instead.
+  Timer {
+    interval: 5000
+    repeat: true
+    running: root.users > 0 && root.supply !== ""
+    triggeredOnStart: true
+    onTriggered: {
+      statusFile.reload();
+      capacityFile.reload();
+    }
+  }
+}
+"""
+
+HYPRLAND_PROVIDER_QML = """pragma Singleton
+
+import QtQuick
+import Quickshell
+import Quickshell.Io
+import Quickshell.Hyprland
+import qs.Commons
+
+// One hyprctl-equivalent request socket client for every converted module
+// that polled hyprctl. Answers are cached per request and fetched again only
+// after a Hyprland event that can change them; requests run one at a time.
+Singleton {
+  id: root
+
+  readonly property string requestSocket: `${Quickshell.env("XDG_RUNTIME_DIR")}/hypr/${Quickshell.env("HYPRLAND_INSTANCE_SIGNATURE")}/.socket.sock`
+
+  property var cache: ({})
+  property var watchers: ({})
+  property var pending: []
+  property string active: ""
+  property string reply: ""
+
+  signal updated(string query)
+
+  function subscribe(query, events) {
+    var watcher = watchers[query];
+    if (watcher) {
+      watcher.count += 1;
+    } else {
+      watchers[query] = { events: events, count: 1 };
+      enqueue(query);
+    }
+    return cache[query];
+  }
+
+  function unsubscribe(query) {
+    var watcher = watchers[query];
+    if (!watcher) return;
+    watcher.count -= 1;
+    if (watcher.count <= 0) {
+      delete watchers[query];
+      delete cache[query];
+    }
+  }
+
+  function refresh(query) {
+    if (watchers[query]) enqueue(query);
+  }
+
+  function enqueue(query) {
+    if (query === active || pending.indexOf(query) >= 0) return;
+    pending.push(query);
+    if (!active) next();
+  }
+
+  function next() {
+    active = pending.length > 0 ? pending.shift() : "";
+    if (!active) return;
+    reply = "";
+    requestConn.connected = true;
+  }
+
+  Socket {
+    id: requestConn
+    path: root.requestSocket
+    parser: SplitParser {
+      splitMarker: ""
+      onRead: data => root.reply += data
+    }
+    onConnectionStateChanged: {
+      if (connected) {
+        write(root.active);
+        flush();
+        return;
+      }
+      // Hyprland closes the request socket once it has answered.
+      var query = root.active;
+      if (!query) return;
+      if (root.watchers[query]) {
+        root.cache[query] = root.reply.trim();
+        root.updated(query);
+      }
+      root.next();
+    }
+    onError: error => {
+      Logger.w("waybar-runtime", `Hyprland request ${root.active} failed: ${error}`);
+      if (connected) connected = false;
+      else root.next();
+    }
+  }
+
+  Connections {
+    target: Hyprland
+    function onRawEvent(event) {
+      for (var query in root.watchers) {
+        if (root.watchers[query].events.indexOf(event.name) >= 0) root.enqueue(query);
+      }
+    }
+  }
+}
+"""
+
+# Fallbacks baked into the shared runtime; every real value comes from the
+# referencing plugin's manifest.
+RUNTIME_DEFAULTS = build_plugin_defaults(
+    WaybarModule(name="runtime", source="", exec_cmd="", interval=None), DEFAULT_WAYBAR_INTERVAL
+)
+
+
+def write_output(path: Path, text: str, stats: Optional[PhaseStats] = None) -> None:
+    """Write a generated file, counting it into ``stats`` when profiling."""
+    path.write_text(text, encoding="utf-8")
+    if stats is not None:
+        stats.files_written += 1
+        stats.bytes_written += len(text.encode("utf-8"))
+
+
+def generate_shared_runtime(output_dir: Path, stats: Optional[PhaseStats] = None) -> None:
+    """Write the runner, pill and settings form shared by all plugins.
+
+    Plugins generated with ``shared_runtime=True`` reference these components
+    instead of carrying their own copies, so Noctalia compiles each QML type
+    once no matter how many modules were converted. The SpawnBudget,
+    PowerState and HyprlandProvider singletons live here too.
+    """
+    runtime_dir = output_dir / "plugins" / RUNTIME_PLUGIN_DIR
+    runtime_dir.mkdir(parents=True, exist_ok=True)
+
+    files = {
+        "WaybarRunner.qml": render_main_qml(
+            RUNTIME_DEFAULTS, 'pluginApi?.manifest?.id || "waybar-runtime"'
+        ),
+        "WaybarPill.qml": render_bar_widget_qml(None),
+        "WaybarSettingsForm.qml": render_settings_qml(RUNTIME_DEFAULTS),
+        "SpawnBudget.qml": SPAWN_BUDGET_QML,
+        "PowerState.qml": POWER_STATE_QML,
+        "HyprlandProvider.qml": HYPRLAND_PROVIDER_QML,
+        "qmldir": "WaybarRunner 1.0 WaybarRunner.qml\n"
+        "WaybarPill 1.0 WaybarPill.qml\n"
+        "WaybarSettingsForm 1.0 WaybarSettingsForm.qml\n"
+        "singleton SpawnBudget 1.0 SpawnBudget.qml\n"
+        "singleton PowerState 1.0 PowerState.qml\n"
+        "singleton HyprlandProvider 1.0 HyprlandProvider.qml\n",
+        "README.md": """# Waybar Runtime
+
+Shared components for plugins converted with `--shared-runtime`. This folder
+is not a plugin itself: copy it next to the `waybar-*` plugin folders in
+`~/.config/noctalia/plugins/`. Each plugin's manifest `defaultSettings` carries
+its command, format and click actions.
+
+`SpawnBudget` is a singleton shared by every plugin that imports this folder;
+with `--spawn-budget` it caps how many poll commands run at once.
+`PowerState` reads the battery state once for every plugin converted with
+`--battery-scale` or `--low-battery-scale`.
+`HyprlandProvider` answers the `hyprctl` reads of modules converted with
+`--hyprland-provider` over one socket, refreshing them on Hyprland events.
+""",
+    }
+    for filename, content in files.items():
+        write_output(runtime_dir / filename, content, stats)
+
+    print(f"  Created shared runtime: {runtime_dir}")
+
+
+def generate_plugin_scaffold(
+    module: WaybarModule,
+    output_dir: Path,
+    default_interval: int,
+    login_shell: bool = False,
+    shell_mode: str = "spawn",
+    shared_runtime: bool = False,
+    idle_pause: int = DEFAULT_IDLE_PAUSE_S,
+    power: Optional[PowerPolicy] = None,
+    max_update_rate: int = DEFAULT_MAX_UPDATE_RATE,
+    restart: Optional[RestartPolicy] = None,
+    spawn_budget: int = 0,
+    nice_background: bool = False,
+    limits: Optional[OutputLimits] = None,
+    stats: Optional[PhaseStats] = None,
+) -> None:
+    """Generate a full Noctalia plugin scaffold for a Waybar module.
+
+    With ``shared_runtime`` the QML entry points only instantiate the
+    components written by :func:`generate_shared_runtime`. A ``spawn_budget``
+    or a module routed to the Hyprland provider also needs that package, for
+    its singletons.
+    """
+
+    plugin_id = f"waybar-{module.name}"
+    plugin_dir = output_dir / "plugins" / plugin_id
+    plugin_dir.mkdir(parents=True, exist_ok=True)
+
+    defaults = build_plugin_defaults(
+        module,
+        default_interval,
+        login_shell,
+        shell_mode,
+        idle_pause=idle_pause,
+        power=power,
+        max_update_rate=max_update_rate,
+        restart=restart,
+        spawn_budget=spawn_budget,
+        nice_background=nice_background,
+        limits=limits,
+    )
+
+    manifest = {
+        "id": plugin_id,
+        "name": f"Waybar {module.name.replace('-', ' ').title()}",
+        "version": "1.0.0",
+        "author": "waybar-converter",
+        "description": f"Converted from Waybar custom/{module.name} module",
+        "entryPoints": {
+            "main": "Main.qml",
+            "barWidget": "BarWidget.qml",
+            "settings": "Settings.qml",
+        },
+        "metadata": {"defaultSettings": defaults},
+    }
+    if module.probe:
+        manifest["metadata"]["probe"] = module.probe.to_dict()
+
+    write_output(plugin_dir / "manifest.json", json.dumps(manifest, indent=2), stats)
+
+    if shared_runtime:
+        runtime_import = f'import QtQuick\nimport "../{RUNTIME_PLUGIN_DIR}"\n\n'
+        main_qml = runtime_import + "WaybarRunner {}\n"
+        bar_widget_qml = runtime_import + "WaybarPill {}\n"
+        settings_qml = runtime_import + "WaybarSettingsForm {}\n"
+    else:
+        features = plugin_features(defaults)
+        main_qml = render_main_qml(defaults, qml_literal(plugin_id), features)
+        bar_widget_qml = render_bar_widget_qml(module)
+        settings_qml = render_settings_qml(defaults, features)
+
+    write_output(plugin_dir / "Main.qml", main_qml, stats)
+
+    write_output(plugin_dir / "BarWidget.qml", bar_widget_qml, stats)
+
+    write_output(plugin_dir / "Settings.qml", settings_qml, stats)
+
+    i18n_dir = plugin_dir / "i18n"
+    i18n_dir.mkdir(exist_ok=True)
+
+    i18n_en = {
+        "title": f"Waybar {module.name.replace('-', ' ').title()}",
+        "description": f"Converted from Waybar custom/{module.name}",
+        "settings": {
+            "title": "Waybar Module",
+            "description": "Configure the command and update cadence for this converted module.",
+            "command": "Text command",
+            "interval-mode": "Interval mode",
+            "interval": "Poll interval (seconds)",
+            "restart": "Restart interval (ms)",
+            "max-update-rate": "Max updates per second (0 = unlimited)",
+            "patch-protocol": "Accept partial-update lines",
+            "timeout": "Command timeout (ms, 0 = none)",
+            "always-poll": "Keep polling when hidden",
+            "idle-pause": "Pause after idle (s, 0 = never)",
+            "battery-scale": "Interval multiplier on battery",
+            "low-battery-scale": "Interval multiplier on low battery",
+            "low-battery-percent": "Low battery below (%)",
+            "parse-json": "Parse JSON",
+            "login-shell": "Run shell commands as login shell",
+            "shell-mode": "Shell mode",
+            "save": "Save",
+        },
+    }
+
+    write_output(i18n_dir / "en.json", json.dumps(i18n_en, indent=2), stats)
+
+    readme = f"""# {manifest['name']}
+
+Converted from Waybar `custom/{module.name}`.
+
+## Usage
+
+1. Update settings in Noctalia if the command path or interval needs tuning.
+2. Add the bar widget through Noctalia settings.
+
+## Notes
+
+- Interval mode `poll` uses a timer, `once` assumes a long-running or signal-driven command.
+- Restart interval is only used for `once` mode.
+- Simple commands run directly as argv; commands that need shell features use a
+  non-login `sh -c` unless `loginShell` is enabled.
+- Shell mode `coprocess` keeps one `sh` alive and sends poll commands over
+  stdin (each in its own subshell); it is restarted if it crashes or a run
+  times out.
+- `cat`/`head`/`awk` reads of a single `/sys` or `/proc` file are compiled into
+  an in-process file read (`fileRead` setting) instead of spawning processes.
+- Modules that run the same command share one runner: the leader publishes raw
+  output under `$XDG_RUNTIME_DIR`, consumers only watch that file.
+- Poll commands are killed (whole process group) after `timeoutMs`; overruns and
+  skipped ticks are shown in the tooltip.
+"""
+
+    write_output(plugin_dir / "README.md", readme, stats)
+
+    print(f"  Created plugin scaffold: {plugin_dir}")
+
+
+# Shared display logic for built-in module plugins: Waybar states, format
+# variants, format-icons and fmt-style `{key:spec}` placeholders.
+BUILTIN_FORMAT_JS = r'''
+  function currentState(value) {
+    var names = Object.keys(states || {});
+    names.sort((a, b) => lowerIsWorse ? states[a] - states[b] : states[b] - states[a]);
+    for (var i = 0; i < names.length; i++) {
+      var threshold = states[names[i]];
+      if (lowerIsWorse ? value <= threshold : value >= threshold) return names[i];
+    }
+    return "";
+  }
+
+  function variantKeys(state) {
+    var keys = [];
+    if (variant && state) keys.push(variant + "-" + state);
+    if (variant) keys.push(variant);
+    if (state) keys.push(state);
+    return keys;
+  }
+
+  function selectFormat(table, base, state) {
+    var keys = variantKeys(state);
+    for (var i = 0; i < keys.length; i++) {
+      if (table && table[keys[i]] !== undefined) return table[keys[i]];
+    }
+    return base;
+  }
+
+  function pickIcon(value, state) {
+    var icons = formatIcons;
+    if (icons && !Array.isArray(icons) && typeof icons === "object") {
+      var keys = variantKeys(state).concat(["default"]);
+      var found = null;
+      for (var i = 0; i < keys.length && found === null; i++) {
+        if (icons[keys[i]] !== undefined) found = icons[keys[i]];
+      }
+      icons = found;
+    }
+    if (typeof icons === "string") return icons;
+    if (!icons || icons.length === 0) return "";
+    if (isNaN(value)) return icons[0];
+    var idx = Math.floor(value * icons.length / 100);
+    return icons[Math.max(0, Math.min(icons.length - 1, idx))];
+  }
+
+  function formatValue(value, spec) {
+    if (value === undefined || value === null) return "";
+    var m = /^([<>^]?)(\d*)(?:\.(\d+))?f?$/.exec(spec || "") || ["", "", "", undefined];
+    var text;
+    if (typeof value === "number") {
+      if (m[3] !== undefined) text = value.toFixed(parseInt(m[3]));
+      else text = Number.isInteger(value) ? String(value) : String(Math.round(value * 10) / 10);
+    } else {
+      text = String(value);
+    }
+    var width = m[2] ? parseInt(m[2]) : 0;
+    if (text.length >= width) return text;
+    var pad = width - text.length;
+    var align = m[1] || (typeof value === "number" ? ">" : "<");
+    if (align === ">") return " ".repeat(pad) + text;
+    if (align === "^") return " ".repeat(Math.floor(pad / 2)) + text + " ".repeat(Math.ceil(pad / 2));
+    return text + " ".repeat(pad);
+  }
+
+  function applyFormat(fmt, vals) {
+    return String(fmt || "").replace(/\{(\w*)(?::([^{}]*))?\}/g, (match, key, spec) => {
+      return (key in vals) ? formatValue(vals[key], spec) : match;
+    });
+  }
+
+  function updateDisplay(stateValue, iconValue) {
+    var state = isNaN(stateValue) ? "" : currentState(stateValue);
+    var fmt = (altActive && formatAlt) ? formatAlt : selectFormat(formats, formatString, state);
+    var vals = Object.assign({}, values, { icon: pickIcon(iconValue, state) });
+    var text = applyFormat(fmt, vals);
+    if (maxLength > 0 && text.length > maxLength) text = text.slice(0, maxLength - 1) + "…";
+    displayText = text;
+    displayState = state;
+    var tip = selectFormat(tooltipFormats, tooltipFormat, state);
+    displayTooltip = showTooltip ? (tip ? applyFormat(tip, vals) : text) : "";
+    refreshed();
+  }
+
+  function toggleAltFormat() {
+    if (!formatAlt) return;
+    altActive = !altActive;
+    sample();
+  }
+
+  function refresh() {
+    sample();
+  }
+
+  function readFile(view) {
+    view.reload();
+    return String(view.text() || "").trim();
+  }
+'''
+
+BUILTIN_POLL_TIMER_QML = r'''
+  Timer {
+    id: sampleTimer
+    interval: Math.max(250, intervalSeconds * 1000)
+    repeat: true
+    running: true
+    triggeredOnStart: true
+    onTriggered: root.sample()
+  }
+'''
+
+# Samplers compute `values` from procfs/sysfs (or Pipewire) in-process and
+# call updateDisplay(stateValue, iconValue). None of them spawns a process.
+BUILTIN_SAMPLERS = {
+    "cpu": BUILTIN_POLL_TIMER_QML + r'''
+  property var lastCpu: null
+
+  FileView { id: statFile; path: "/proc/stat"; blockLoading: true; preload: false; printErrors: false }
+  FileView { id: loadFile; path: "/proc/loadavg"; blockLoading: true; preload: false; printErrors: false }
+  FileView { id: cpuinfoFile; path: root.needsFrequency ? "/proc/cpuinfo" : ""; blockLoading: true; preload: false; printErrors: false }
+
+  function sample() {
+    var fields = readFile(statFile).split("\n")[0].trim().split(/\s+/).slice(1, 9).map(Number);
+    var idle = fields[3] + (fields[4] || 0);
+    var total = fields.reduce((a, b) => a + b, 0);
+    var prev = lastCpu || { idle: 0, total: 0 };
+    var usage = total > prev.total ? Math.round(100 * (1 - (idle - prev.idle) / (total - prev.total))) : 0;
+    lastCpu = { idle: idle, total: total };
+
+    var vals = { usage: usage, load: parseFloat(readFile(loadFile).split(" ")[0]) || 0 };
+    if (needsFrequency) {
+      var mhz = readFile(cpuinfoFile).split("\n").filter(l => l.indexOf("cpu MHz") === 0).map(l => parseFloat(l.split(":")[1]));
+      if (mhz.length > 0) {
+        vals.avg_frequency = mhz.reduce((a, b) => a + b, 0) / mhz.length / 1000;
+        vals.max_frequency = Math.max.apply(null, mhz) / 1000;
+        vals.min_frequency = Math.min.apply(null, mhz) / 1000;
+      }
+    }
+    values = vals;
+    updateDisplay(usage, usage);
+  }
+''',
+    "memory": BUILTIN_POLL_TIMER_QML + r'''
+  FileView { id: meminfoFile; path: "/proc/meminfo"; blockLoading: true; preload: false; printErrors: false }
+
+  function sample() {
+    var info = {};
+    readFile(meminfoFile).split("\n").forEach(line => {
+      var m = /^(\w+):\s+(\d+)/.exec(line);
+      if (m) info[m[1]] = parseInt(m[2]);
+    });
+    var gib = kib => kib / 1048576;
+    var total = info.MemTotal || 0;
+    var avail = info.MemAvailable !== undefined ? info.MemAvailable : (info.MemFree || 0);
+    var swapTotal = info.SwapTotal || 0;
+    var swapFree = info.SwapFree || 0;
+    var pct = total > 0 ? Math.round((total - avail) * 100 / total) : 0;
+    values = {
+      percentage: pct,
+      total: gib(total),
+      used: gib(total - avail),
+      avail: gib(avail),
+      swapPercentage: swapTotal > 0 ? Math.round((swapTotal - swapFree) * 100 / swapTotal) : 0,
+      swapTotal: gib(swapTotal),
+      swapUsed: gib(swapTotal - swapFree),
+      swapAvail: gib(swapFree)
+    };
+    updateDisplay(pct, pct);
+  }
+''',
+    "battery": BUILTIN_POLL_TIMER_QML + r'''
+  readonly property string batteryPath: `/sys/class/power_supply/${batteryName}`
+
+  FileView { id: capacityFile; path: root.batteryPath + "/capacity"; blockLoading: true; preload: false; printErrors: false }
+  FileView { id: statusFile; path: root.batteryPath + "/status"; blockLoading: true; preload: false; printErrors: false }
+  FileView { id: energyNowFile; path: root.batteryPath + "/energy_now"; blockLoading: true; preload: false; printErrors: false }
+  FileView { id: energyFullFile; path: root.batteryPath + "/energy_full"; blockLoading: true; preload: false; printErrors: false }
+  FileView { id: powerNowFile; path: root.batteryPath + "/power_now"; blockLoading: true; preload: false; printErrors: false }
+
+  function sample() {
+    var capacity = parseInt(readFile(capacityFile));
+    if (isNaN(capacity)) capacity = 0;
+    var status = readFile(statusFile).toLowerCase();
+    if (status === "not charging" || status === "unknown" || status === "") status = "plugged";
+    variant = status;
+
+    var energyNow = parseInt(readFile(energyNowFile)) || 0;
+    var energyFull = parseInt(readFile(energyFullFile)) || 0;
+    var powerNow = parseInt(readFile(powerNowFile)) || 0;
+    var hours = 0;
+    if (powerNow > 0) {
+      hours = status === "charging" ? (energyFull - energyNow) / powerNow : energyNow / powerNow;
+    }
+    var h = Math.floor(hours);
+    var m = Math.round((hours - h) * 60);
+    var time = hours > 0 ? formatTime.replace("{H}", h).replace("{M}", m).replace("{m}", String(m).padStart(2, "0")) : "";
+
+    values = { capacity: capacity, power: powerNow / 1000000, time: time };
+    updateDisplay(capacity, capacity);
+  }
+''',
+    "clock": r'''
+  // Ticks are aligned to the interval boundary so minute clocks flip on time.
+  Timer {
+    id: sampleTimer
+    repeat: false
+    onTriggered: {
+      root.sample();
+      root.schedule();
+    }
+  }
+
+  function schedule() {
+    var period = Math.max(1000, intervalSeconds * 1000);
+    sampleTimer.interval = period - (Date.now() % period) + 5;
+    sampleTimer.restart();
+  }
+
+  function sample() {
+    var now = new Date();
+    var vals = {};
+    for (var key in clockFormats) vals[key] = Qt.formatDateTime(now, clockFormats[key]);
+    values = vals;
+    updateDisplay(NaN, NaN);
+  }
+
+  Component.onCompleted: {
+    sample();
+    schedule();
+  }
+''',
+    "network": BUILTIN_POLL_TIMER_QML + r'''
+  property string ifname: ""
+  property var lastNet: null
+
+  FileView { id: routeFile; path: "/proc/net/route"; blockLoading: true; preload: false; printErrors: false }
+  FileView { id: devFile; path: "/proc/net/dev"; blockLoading: true; preload: false; printErrors: false }
+  FileView { id: wirelessFile; path: "/proc/net/wireless"; blockLoading: true; preload: false; printErrors: false }
+  FileView { id: operFile; path: root.ifname ? `/sys/class/net/${root.ifname}/operstate` : ""; blockLoading: true; preload: false; printErrors: false }
+
+  function matchesInterface(name) {
+    var pattern = "^" + interfacePattern.replace(/[.+^${}()|\\]/g, "\\$&").replace(/\*/g, ".*").replace(/\?/g, ".") + "$";
+    return new RegExp(pattern).test(name);
+  }
+
+  function humanRate(value, unit) {
+    var prefixes = ["", "k", "M", "G", "T"];
+    var idx = 0;
+    while (value >= 1000 && idx < prefixes.length - 1) {
+      value /= 1000;
+      idx += 1;
+    }
+    return value.toFixed(idx === 0 ? 0 : 1) + prefixes[idx] + unit;
+  }
+
+  function sample() {
+    var devices = {};
+    readFile(devFile).split("\n").slice(2).forEach(line => {
+      var parts = line.split(":");
+      if (parts.length < 2) return;
+      var nums = parts[1].trim().split(/\s+/).map(Number);
+      devices[parts[0].trim()] = { rx: nums[0], tx: nums[8] };
+    });
+
+    var name = "";
+    if (interfacePattern) {
+      name = Object.keys(devices).find(dev => matchesInterface(dev)) || "";
+    } else {
+      readFile(routeFile).split("\n").slice(1).forEach(line => {
+        var cols = line.trim().split(/\s+/);
+        if (!name && cols[1] === "00000000") name = cols[0];
+      });
+    }
+    ifname = name;
+
+    var oper = name ? readFile(operFile) : "";
+    var signal = NaN;
+    var signalDbm = NaN;
+    readFile(wirelessFile).split("\n").slice(2).forEach(line => {
+      var cols = line.trim().split(/\s+/);
+      if (cols[0] === name + ":") {
+        signal = Math.min(100, Math.round(parseFloat(cols[2]) * 100 / 70));
+        signalDbm = parseFloat(cols[3]);
+      }
+    });
+
+    if (!name || oper === "down" || oper === "dormant") {
+      variant = "disconnected";
+    } else {
+      variant = isNaN(signal) ? "ethernet" : "wifi";
+    }
+
+    var now = Date.now();
+    var dev = devices[name] || { rx: 0, tx: 0 };
+    var down = 0;
+    var up = 0;
+    if (lastNet && lastNet.name === name && now > lastNet.time) {
+      var secs = (now - lastNet.time) / 1000;
+      down = Math.max(0, (dev.rx - lastNet.rx) / secs);
+      up = Math.max(0, (dev.tx - lastNet.tx) / secs);
+    }
+    lastNet = { name: name, rx: dev.rx, tx: dev.tx, time: now };
+
+    values = {
+      ifname: name,
+      essid: "",
+      ipaddr: "",
+      signalStrength: isNaN(signal) ? "" : signal,
+      signaldBm: isNaN(signalDbm) ? "" : signalDbm,
+      bandwidthDownBytes: humanRate(down, "B/s"),
+      bandwidthUpBytes: humanRate(up, "B/s"),
+      bandwidthTotalBytes: humanRate(down + up, "B/s"),
+      bandwidthDownBits: humanRate(down * 8, "b/s"),
+      bandwidthUpBits: humanRate(up * 8, "b/s"),
+      bandwidthTotalBits: humanRate((down + up) * 8, "b/s")
+    };
+    updateDisplay(signal, signal);
+  }
+''',
+    "pulseaudio": r'''
+  // Event-driven through Pipewire bindings: no timer and no pactl/pamixer.
+  readonly property var sink: Pipewire.defaultAudioSink
+  readonly property real sinkVolume: sink?.audio?.volume ?? 0
+  readonly property bool sinkMuted: sink?.audio?.muted ?? false
+
+  PwObjectTracker {
+    objects: root.sink ? [root.sink] : []
+  }
+
+  onSinkChanged: sample()
+  onSinkVolumeChanged: sample()
+  onSinkMutedChanged: sample()
+
+  function sample() {
+    var volume = Math.round(sinkVolume * 100);
+    var bluetooth = String(sink?.name || "").indexOf("bluez") >= 0;
+    variant = bluetooth ? (sinkMuted ? "bluetooth-muted" : "bluetooth") : (sinkMuted ? "muted" : "");
+    values = { volume: volume, desc: sink?.description || sink?.nickname || "", format_source: "" };
+    updateDisplay(volume, volume);
+  }
+
+  function adjustVolume(deltaPercent) {
+    if (!sink?.audio) return;
+    var next = Math.max(0, Math.min(maxVolume, Math.round(sinkVolume * 100) + deltaPercent));
+    sink.audio.volume = next / 100;
+  }
+
+  Component.onCompleted: sample()
+''',
+}
+
+
+def parse_builtin_module(key: str, kind: str, source: str, value: dict) -> BuiltinModule:
+    module = BuiltinModule(name=key.replace("#", "-"), kind=kind, source=source)
+
+    if kind != "pulseaudio":
+        _, interval, _ = normalize_interval(
+            value.get("interval"), BUILTIN_DEFAULT_INTERVALS.get(kind, DEFAULT_WAYBAR_INTERVAL)
+        )
+        module.interval = interval or BUILTIN_DEFAULT_INTERVALS.get(kind, DEFAULT_WAYBAR_INTERVAL)
+
+    module.format = value.get("format", BUILTIN_DEFAULT_FORMATS[kind])
+    module.format_alt = value.get("format-alt", "")
+    module.format_icons = value.get("format-icons", [])
+    states = value.get("states", {})
+    if not isinstance(states, dict):
+        print(f"Warning: {key}: \"states\" must be an object of thresholds; ignored", file=sys.stderr)
+        states = {}
+    module.states = {k: v for k, v in states.items() if isinstance(v, (int, float))}
+    module.tooltip = value.get("tooltip", True)
+    module.tooltip_format = value.get("tooltip-format", "")
+    module.max_length = value.get("max-length")
+    module.on_click = value.get("on-click", "")
+    module.on_click_middle = value.get("on-click-middle", "")
+    module.on_click_right = value.get("on-click-right", "")
+    module.on_scroll_up = value.get("on-scroll-up", "")
+    module.on_scroll_down = value.get("on-scroll-down", "")
+    module.exec_on_event = value.get("exec-on-event", True)
+
+    for option, option_value in value.items():
+        if not isinstance(option_value, str):
+            continue
+        if option.startswith("format-") and option not in ("format-icons", "format-alt", "format-time"):
+            module.formats[option[len("format-"):]] = option_value
+        elif option.startswith("tooltip-format-"):
+            module.tooltip_formats[option[len("tooltip-format-"):]] = option_value
+
+    for option in ("bat", "adapter", "interface", "scroll-step", "max-volume", "format-time", "timezone"):
+        if option in value:
+            module.options[option] = value[option]
+
+    return module
+
+
+def extract_builtin_modules(config: object) -> list[BuiltinModule]:
+    """Extract Waybar built-in modules that have a native, fork-free conversion.
+
+    Built-ins are enabled by listing them in modules-left/center/right; their
+    config block is optional. `battery#bat2` style instances keep their suffix.
+    """
+    modules: list[BuiltinModule] = []
+
+    for source, section in iter_config_dicts(config):
+        keys: list[str] = []
+        for position in ("modules-left", "modules-center", "modules-right"):
+            for key in section.get(position, []) or []:
+                if isinstance(key, str) and key not in keys:
+                    keys.append(key)
+        for key, value in section.items():
+            if isinstance(value, dict) and key not in keys:
+                keys.append(key)
+
+        for key in keys:
+            kind = key.split("#", 1)[0]
+            if kind not in BUILTIN_MODULE_KINDS:
+                continue
+            value = section.get(key)
+            modules.append(
+                parse_builtin_module(key, kind, source, value if isinstance(value, dict) else {})
+            )
+
+    return dedupe_modules(modules)
+
+
+def strftime_to_qt(pattern: str) -> tuple[str, list[str]]:
+    """Translate a strftime pattern (Waybar clock) to a Qt date/time format."""
+    unpadded = {"H": "H", "M": "m", "S": "s", "d": "d", "m": "M", "I": "h"}
+    parts: list[str] = []
+    literal: list[str] = []
+    unsupported: list[str] = []
+
+    def flush() -> None:
+        if literal:
+            parts.append("'" + "".join(literal).replace("'", "''") + "'")
+            literal.clear()
+
+    if pattern.startswith("L"):
+        pattern = pattern[1:]
+
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char != "%" or i + 1 >= len(pattern):
+            literal.append(char)
+            i += 1
+            continue
+        code = pattern[i + 1]
+        i += 2
+        if code == "%":
+            literal.append("%")
+            continue
+        qt_code = None
+        if code == "-" and i < len(pattern):
+            qt_code = unpadded.get(pattern[i])
+            code = "-" + pattern[i]
+            i += 1
+        else:
+            qt_code = STRFTIME_TO_QT.get(code)
+        if qt_code:
+            flush()
+            parts.append(qt_code)
+        else:
+            unsupported.append(f"%{code}")
+
+    flush()
+    return "".join(parts), unsupported
+
+
+CLOCK_PLACEHOLDER_RE = re.compile(r"\{(:[^{}]*)?\}")
+
+
+def convert_clock_formats(module: BuiltinModule) -> tuple[dict, list[str]]:
+    """Rewrite `{:strftime}` placeholders to `{clockN}` keys with Qt formats."""
+    qt_formats: dict[str, str] = {}
+    warnings: list[str] = []
+
+    def rewrite(fmt: str) -> str:
+        def replace(match: re.Match) -> str:
+            spec = match.group(1)
+            qt_format, unsupported = strftime_to_qt(spec[1:] if spec else "%H:%M")
+            for code in unsupported:
+                warnings.append(f"clock: {code} has no Qt equivalent and was dropped.")
+            for key, existing in qt_formats.items():
+                if existing == qt_format:
+                    return "{" + key + "}"
+            key = f"clock{len(qt_formats)}"
+            qt_formats[key] = qt_format
+            return "{" + key + "}"
+
+        if "{calendar}" in fmt:
+            warnings.append("clock: {calendar} is not supported and was removed.")
+            fmt = fmt.replace("{calendar}", "")
+        return CLOCK_PLACEHOLDER_RE.sub(replace, fmt)
+
+    module.format = rewrite(module.format)
+    module.format_alt = rewrite(module.format_alt)
+    module.tooltip_format = rewrite(module.tooltip_format)
+    module.formats = {k: rewrite(v) for k, v in module.formats.items()}
+    module.tooltip_formats = {k: rewrite(v) for k, v in module.tooltip_formats.items()}
+
+    if any("s" in qt_format.replace("'", "") for qt_format in qt_formats.values()):
+        module.interval = 1
+    return qt_formats, dedupe_strings(warnings)
+
+
+def dedupe_strings(values: list[str]) -> list[str]:
+    return list(dict.fromkeys(values))
+
+
+def convert_builtin_to_widget(module: BuiltinModule) -> tuple[dict, list[str]]:
+    """Map a Waybar built-in module to the matching native Noctalia widget."""
+    widget = dict(BUILTIN_NATIVE_WIDGETS[module.kind])
+    warnings = [
+        f"{module.kind} converted to native {widget['type']} widget; Waybar format, "
+        "states and tooltip options are not carried over (use --mode plugins to keep them)."
+    ]
+
+    if module.kind == "clock":
+        match = CLOCK_PLACEHOLDER_RE.search(module.format)
+        spec = match.group(1) if match else None
+        qt_format, unsupported = strftime_to_qt(spec[1:] if spec else "%H:%M")
+        widget["formatHorizontal"] = qt_format
+        for code in unsupported:
+            warnings.append(f"clock: {code} has no Qt equivalent and was dropped.")
+    elif module.kind == "battery" and "warning" in module.states:
+        widget["warningThreshold"] = module.states["warning"]
+
+    for action in ("on_click", "on_click_right", "on_click_middle", "on_scroll_up", "on_scroll_down"):
+        if getattr(module, action):
+            warnings.append(f"{action.replace('_', '-')} is not mapped for native widgets.")
+
+    return widget, warnings
+
+
+def build_builtin_settings(module: BuiltinModule) -> tuple[dict, list[str]]:
+    """Manifest defaultSettings for a built-in module plugin."""
+    module = replace(module)
+    warnings: list[str] = []
+    settings: dict[str, object] = {
+        "kind": module.kind,
+        "interval": module.interval,
+    }
+
+    if module.kind == "clock":
+        clock_formats, warnings = convert_clock_formats(module)
+        settings["interval"] = module.interval
+        settings["clockFormats"] = clock_formats
+    elif module.kind == "battery":
+        settings["battery"] = module.options.get("bat") or detect_battery_name()
+        settings["formatTime"] = module.options.get("format-time", "{H} h {M} min")
+    elif module.kind == "network":
+        settings["interface"] = module.options.get("interface", "")
+        if any("{essid}" in f or "{ipaddr}" in f for f in all_builtin_formats(module)):
+            warnings.append("network: {essid} and {ipaddr} need netlink/nl80211 and render empty.")
+    elif module.kind == "pulseaudio":
+        settings["scrollStep"] = module.options.get("scroll-step", 1)
+        settings["maxVolume"] = module.options.get("max-volume", 100)
+    elif module.kind == "cpu":
+        settings["needsFrequency"] = any("frequency" in f for f in all_builtin_formats(module))
+
+    settings.update({
+        "format": module.format,
+        "formatAlt": module.format_alt,
+        "formats": module.formats,
+        "formatIcons": module.format_icons,
+        "states": module.states,
+        "tooltip": module.tooltip,
+        "tooltipFormat": module.tooltip_format,
+        "tooltipFormats": module.tooltip_formats,
+        "maxLength": module.max_length or 0,
+    })
+    return settings, warnings
+
+
+def all_builtin_formats(module: BuiltinModule) -> list[str]:
+    return [
+        module.format, module.format_alt, module.tooltip_format,
+        *module.formats.values(), *module.tooltip_formats.values(),
+    ]
+
+
+def render_builtin_main_qml(module: BuiltinModule, settings: dict) -> str:
+    """Render Main.qml for a built-in module: in-process sampling, no processes."""
+
+    def literal(key: str) -> str:
+        return json.dumps(settings.get(key), ensure_ascii=True)
+
+    extra_imports = "import Quickshell.Services.Pipewire\n" if module.kind == "pulseaudio" else ""
+    kind_properties = {
+        "cpu": f"  readonly property bool needsFrequency: settingOr(defaultSettings.needsFrequency, {literal('needsFrequency')})\n",
+        "battery": (
+            f"  readonly property string batteryName: settingOr(pluginApi?.pluginSettings?.battery, settingOr(defaultSettings.battery, {literal('battery')}))\n"
+            f"  readonly property string formatTime: settingOr(defaultSettings.formatTime, {literal('formatTime')})\n"
+        ),
+        "clock": f"  readonly property var clockFormats: settingOr(defaultSettings.clockFormats, {literal('clockFormats')})\n",
+        "network": f"  readonly property string interfacePattern: settingOr(pluginApi?.pluginSettings?.interface, settingOr(defaultSettings.interface, {literal('interface')}))\n",
+        "pulseaudio": (
+            f"  readonly property int scrollStep: settingOr(defaultSettings.scrollStep, {literal('scrollStep')})\n"
+            f"  readonly property int maxVolume: settingOr(defaultSettings.maxVolume, {literal('maxVolume')})\n"
+        ),
+    }.get(module.kind, "")
+
+    return f'''import QtQuick
+import Quickshell
+import Quickshell.Io
+{extra_imports}import qs.Commons
+
+Item {{
+  id: root
+
+  property var pluginApi: null
+
+  readonly property var defaultSettings: pluginApi?.manifest?.metadata?.defaultSettings || ({{}})
+
+  function settingOr(value, fallback) {{
+    return (value !== undefined && value !== null) ? value : fallback;
+  }}
+
+  readonly property int intervalSeconds: settingOr(pluginApi?.pluginSettings?.interval, settingOr(defaultSettings.interval, {literal('interval')}))
+  readonly property string formatString: settingOr(pluginApi?.pluginSettings?.format, settingOr(defaultSettings.format, {literal('format')}))
+  readonly property string formatAlt: settingOr(pluginApi?.pluginSettings?.formatAlt, settingOr(defaultSettings.formatAlt, {literal('formatAlt')}))
+  readonly property var formats: settingOr(defaultSettings.formats, {literal('formats')})
+  readonly property var formatIcons: settingOr(defaultSettings.formatIcons, {literal('formatIcons')})
+  readonly property var states: settingOr(defaultSettings.states, {literal('states')})
+  readonly property bool showTooltip: settingOr(defaultSettings.tooltip, {literal('tooltip')})
+  readonly property string tooltipFormat: settingOr(defaultSettings.tooltipFormat, {literal('tooltipFormat')})
+  readonly property var tooltipFormats: settingOr(defaultSettings.tooltipFormats, {literal('tooltipFormats')})
+  readonly property int maxLength: settingOr(defaultSettings.maxLength, {literal('maxLength')})
+{kind_properties}
+  // Battery states trigger below their threshold, every other module above it.
+  readonly property bool lowerIsWorse: {str(module.kind == "battery").lower()}
+
+  property bool altActive: false
+  property var values: ({{}})
+  property string variant: ""
+
+  property string displayText: ""
+  property string displayIcon: ""
+  property string displayTooltip: ""
+  property string displayState: ""
+
+  signal refreshed()
+{BUILTIN_SAMPLERS[module.kind]}{BUILTIN_FORMAT_JS}}}
+'''
+
+
+def generate_builtin_plugin(
+    module: BuiltinModule, output_dir: Path, stats: Optional[PhaseStats] = None
+) -> list[str]:
+    """Generate a plugin that renders a Waybar built-in module without subprocesses."""
+
+    plugin_id = f"waybar-{module.name}"
+    plugin_dir = output_dir / "plugins" / plugin_id
+    plugin_dir.mkdir(parents=True, exist_ok=True)
+
+    settings, warnings = build_builtin_settings(module)
+    title = f"Waybar {module.name.replace('-', ' ').title()}"
+
+    manifest = {
+        "id": plugin_id,
+        "name": title,
+        "version": "1.0.0",
+        "author": "waybar-converter",
+        "description": f"Converted from Waybar {module.kind} module",
+        "entryPoints": {
+            "main": "Main.qml",
+            "barWidget": "BarWidget.qml",
+            "settings": "Settings.qml",
+        },
+        "metadata": {"defaultSettings": settings},
+    }
+
+    write_output(plugin_dir / "manifest.json", json.dumps(manifest, indent=2), stats)
+
+    write_output(plugin_dir / "Main.qml", render_builtin_main_qml(module, settings), stats)
+
+    fallbacks: dict[str, str] = {}
+    if module.format_alt:
+        fallbacks["left"] = "pluginMain?.toggleAltFormat()"
+    if module.kind == "pulseaudio":
+        fallbacks["scrollUp"] = "pluginMain?.adjustVolume(pluginMain.scrollStep * steps)"
+        fallbacks["scrollDown"] = "pluginMain?.adjustVolume(-pluginMain.scrollStep * steps)"
+
+    write_output(plugin_dir / "BarWidget.qml", render_bar_widget_qml(module, fallbacks), stats)
+
+    interval_row = ""
+    interval_save = ""
+    if module.kind != "pulseaudio":
+        interval_row = '''
+    SettingsRow {
+      label: pluginApi?.tr("settings.interval") || "Update interval (seconds)"
+      SpinBox {
+        from: 1
+        to: 86400
+        value: valueInterval
+        onValueChanged: valueInterval = value
+      }
+    }
+'''
+        interval_save = "        pluginApi.pluginSettings.interval = valueInterval;\n"
+
+    settings_qml = f'''import QtQuick
+import QtQuick.Controls
+import QtQuick.Layouts
+import qs.Commons
+import qs.Modules.Panels.Settings
+
+Item {{
+  id: root
+
+  property var pluginApi: null
+
+  readonly property var defaultSettings: pluginApi?.manifest?.metadata?.defaultSettings || ({{}})
+
+  function settingOr(value, fallback) {{
+    return (value !== undefined && value !== null) ? value : fallback;
+  }}
+
+  property int valueInterval: settingOr(pluginApi?.pluginSettings?.interval, settingOr(defaultSettings.interval, {settings["interval"]}))
+  property string valueFormat: settingOr(pluginApi?.pluginSettings?.format, settingOr(defaultSettings.format, "{escape_qml_string(settings["format"])}"))
+  property string valueFormatAlt: settingOr(pluginApi?.pluginSettings?.formatAlt, settingOr(defaultSettings.formatAlt, "{escape_qml_string(settings["formatAlt"])}"))
+
+  ColumnLayout {{
+    anchors.fill: parent
+    spacing: 12
+
+    SettingsSection {{
+      title: pluginApi?.tr("settings.title") || "Waybar Module"
+      description: pluginApi?.tr("settings.description") || "Values are read in-process; no commands are run."
+    }}
+
+    SettingsTextField {{
+      label: pluginApi?.tr("settings.format") || "Format"
+      text: valueFormat
+      onTextChanged: valueFormat = text
     }}
 
+    SettingsTextField {{
+      label: pluginApi?.tr("settings.format-alt") || "Alternate format (left click)"
+      text: valueFormatAlt
+      onTextChanged: valueFormatAlt = text
+    }}
+{interval_row}
     SettingsButton {{
       text: pluginApi?.tr("settings.save") || "Save"
       onClicked: {{
         if (!pluginApi) return;
-        pluginApi.pluginSettings.textCommand = valueTextCommand;
-        pluginApi.pluginSettings.interval = valueInterval;
-        pluginApi.pluginSettings.intervalMode = valueIntervalMode;
-        pluginApi.pluginSettings.restartIntervalMs = valueRestartMs;
-        pluginApi.pluginSettings.parseJson = valueParseJson;
-        pluginApi.saveSettings();
+        pluginApi.pluginSettings.format = valueFormat;
+        pluginApi.pluginSettings.formatAlt = valueFormatAlt;
+{interval_save}        pluginApi.saveSettings();
         pluginApi.mainInstance?.refresh();
       }}
     }}
@@ -886,65 +4700,181 @@ Item {{
 }}
 '''
 
-    with open(plugin_dir / "Settings.qml", "w", encoding="utf-8") as f:
-        f.write(settings_qml)
+    write_output(plugin_dir / "Settings.qml", settings_qml, stats)
 
     i18n_dir = plugin_dir / "i18n"
     i18n_dir.mkdir(exist_ok=True)
 
     i18n_en = {
-        "title": f"Waybar {module.name.replace('-', ' ').title()}",
-        "description": f"Converted from Waybar custom/{module.name}",
+        "title": title,
+        "description": f"Converted from Waybar {module.kind}",
         "settings": {
             "title": "Waybar Module",
-            "description": "Configure the command and update cadence for this converted module.",
-            "command": "Text command",
-            "interval-mode": "Interval mode",
-            "interval": "Poll interval (seconds)",
-            "restart": "Restart interval (ms)",
-            "parse-json": "Parse JSON",
+            "description": "Values are read in-process; no commands are run.",
+            "format": "Format",
+            "format-alt": "Alternate format (left click)",
+            "interval": "Update interval (seconds)",
             "save": "Save",
         },
     }
 
-    with open(i18n_dir / "en.json", "w", encoding="utf-8") as f:
-        json.dump(i18n_en, f, indent=2)
-
-    readme = f"""# {manifest['name']}
+    write_output(i18n_dir / "en.json", json.dumps(i18n_en, indent=2), stats)
 
-Converted from Waybar `custom/{module.name}`.
+    source_note = {
+        "cpu": "`/proc/stat` deltas and `/proc/loadavg`",
+        "memory": "`/proc/meminfo`",
+        "battery": "`/sys/class/power_supply`",
+        "clock": "the local clock, formatted with Qt",
+        "network": "`/proc/net/*` and `/sys/class/net`",
+        "pulseaudio": "Pipewire bindings (event-driven)",
+    }[module.kind]
 
-## Usage
+    readme = f"""# {title}
 
-1. Update settings in Noctalia if the command path or interval needs tuning.
-2. Add the bar widget through Noctalia settings.
+Converted from the Waybar `{module.kind}` built-in module.
 
 ## Notes
 
-- Interval mode `poll` uses a timer, `once` assumes a long-running or signal-driven command.
-- Restart interval is only used for `once` mode.
+- Values come from {source_note}; no processes are spawned per update.
+- Waybar `format`, `format-<state>`, `format-icons`, `states` and `format-alt` are applied in `Main.qml`.
 """
 
-    with open(plugin_dir / "README.md", "w", encoding="utf-8") as f:
-        f.write(readme)
+    write_output(plugin_dir / "README.md", readme, stats)
 
     print(f"  Created plugin scaffold: {plugin_dir}")
+    return warnings
+
+
+def json_separators(indent: Optional[int]) -> tuple[str, str]:
+    return (",", ": ") if indent is not None else (",", ":")
+
+
+class JsonStreamWriter:
+    """Write a JSON array or object to a file one entry at a time.
+
+    ``head``/``tail`` wrap the container (for a container nested at
+    ``depth``). With ``indent=2`` the result is byte-identical to
+    ``json.dump(..., indent=2)`` of the whole document; ``indent=None`` is
+    compact. Unless ``always`` is set, the file is only created once the
+    first entry arrives. Bytes and the finished file are counted into
+    ``stats`` when given.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        indent: Optional[int] = 2,
+        mapping: bool = False,
+        head: str = "",
+        tail: str = "",
+        depth: int = 0,
+        always: bool = False,
+        stats: Optional[PhaseStats] = None,
+    ) -> None:
+        self.path = path
+        self.indent = indent
+        self.mapping = mapping
+        self.head = head
+        self.tail = tail
+        self.depth = depth
+        self.always = always
+        self.stats = stats
+        self.count = 0
+        self._file = None
+
+    def _write(self, text: str) -> None:
+        self._file.write(text)
+        if self.stats is not None:
+            self.stats.bytes_written += len(text.encode("utf-8"))
+
+    def _newline(self, depth: int) -> str:
+        return "" if self.indent is None else "\n" + " " * (self.indent * depth)
+
+    def _open(self) -> None:
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._write(self.head + ("{" if self.mapping else "["))
+
+    def add(self, value: object, key: Optional[str] = None) -> None:
+        if self._file is None:
+            self._open()
+        else:
+            self._write(",")
+        self._write(self._newline(self.depth + 1))
+        if self.mapping:
+            self._write(json.dumps(key) + json_separators(self.indent)[1])
+        text = json.dumps(value, indent=self.indent, separators=json_separators(self.indent))
+        if self.indent is not None:
+            text = text.replace("\n", self._newline(self.depth + 1))
+        self._write(text)
+        self.count += 1
+
+    def close(self) -> bool:
+        """Finish the document; returns whether a file was written."""
+        if self._file is None:
+            if not self.always:
+                return False
+            self._open()
+        elif self.count:
+            self._write(self._newline(self.depth))
+        self._write(("}" if self.mapping else "]") + self.tail)
+        self._file.close()
+        self._file = None
+        if self.stats is not None:
+            self.stats.files_written += 1
+        return True
+
+    def __enter__(self) -> "JsonStreamWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._file is not None:
+            self.close()
+
+
+def iter_widget_entries(
+    modules: Iterable[WaybarModule],
+    default_interval: int,
+    builtins: Optional[Iterable[BuiltinModule]] = None,
+    power: Optional[PowerPolicy] = None,
+    restart: Optional[RestartPolicy] = None,
+    limits: Optional[OutputLimits] = None,
+) -> Iterable[tuple[str, dict, list[str], dict]]:
+    """Convert modules lazily into (name, widget, warnings, hints) entries."""
+    for module in modules:
+        widget, warnings = convert_module_to_widget(module, default_interval, restart, limits)
+        yield module.name, widget.to_dict(), warnings, build_widget_hints(module, power)
+    for builtin in builtins or []:
+        widget_dict, warnings = convert_builtin_to_widget(builtin)
+        yield builtin.name, widget_dict, warnings, {}
+
+
+WIDGETS_PLACEHOLDER = "\0widgets\0"
 
 
 def generate_widget_configs(
-    modules: list[WaybarModule], output_dir: Path, default_interval: int
+    modules: Iterable[WaybarModule],
+    output_dir: Path,
+    default_interval: int,
+    builtins: Optional[Iterable[BuiltinModule]] = None,
+    compact: bool = False,
+    power: Optional[PowerPolicy] = None,
+    restart: Optional[RestartPolicy] = None,
+    limits: Optional[OutputLimits] = None,
+    stats: Optional[PhaseStats] = None,
 ) -> None:
-    """Generate CustomButton widget configurations."""
+    """Generate CustomButton (and native built-in) widget configurations.
 
-    output_dir.mkdir(parents=True, exist_ok=True)
+    Modules are converted and written one at a time, so memory stays flat no
+    matter how many modules are passed in (``modules`` may be a generator).
+    ``compact`` drops indentation from every generated JSON file. Writes are
+    counted into ``stats`` when given.
+    """
 
-    widgets = []
-    warnings_by_module: dict[str, list[str]] = {}
-    for module in modules:
-        widget, warnings = convert_module_to_widget(module, default_interval)
-        widgets.append(widget.to_dict())
-        if warnings:
-            warnings_by_module[module.name] = warnings
+    output_dir.mkdir(parents=True, exist_ok=True)
+    widgets_dir = output_dir / "widgets"
+    widgets_dir.mkdir(exist_ok=True)
+    indent = None if compact else 2
+    separators = json_separators(indent)
 
     config = {
         "_comment": "Add these widgets to your Noctalia bar configuration",
@@ -952,32 +4882,44 @@ def generate_widget_configs(
             "Copy the widgets array entries to your settings.json",
             "Add them to bar.widgets.left, bar.widgets.center, or bar.widgets.right",
         ],
-        "widgets": widgets,
+        "widgets": WIDGETS_PLACEHOLDER,
     }
+    head, tail = json.dumps(config, indent=indent, separators=separators).split(
+        json.dumps(WIDGETS_PLACEHOLDER)
+    )
 
     config_path = output_dir / "custom_widgets.json"
-    with open(config_path, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2)
-
-    print(f"  Generated widget configs: {config_path}")
-
-    widgets_dir = output_dir / "widgets"
-    widgets_dir.mkdir(exist_ok=True)
-
-    for module, widget in zip(modules, widgets):
-        widget_path = widgets_dir / f"{module.name}.json"
-        with open(widget_path, "w", encoding="utf-8") as f:
-            json.dump(widget, f, indent=2)
-        print(f"  Generated: {widget_path}")
-
-    if warnings_by_module:
-        warnings_path = output_dir / "widget_warnings.json"
-        with open(warnings_path, "w", encoding="utf-8") as f:
-            json.dump(warnings_by_module, f, indent=2)
-        print(f"  Generated warnings: {warnings_path}")
-
-
-def print_conversion_report(modules: list[WaybarModule], default_interval: int) -> None:
+    warnings_path = output_dir / "widget_warnings.json"
+    hints_path = output_dir / "widget_hints.json"
+
+    with JsonStreamWriter(config_path, indent, head=head, tail=tail, depth=1, always=True, stats=stats) as widgets, \
+            JsonStreamWriter(warnings_path, indent, mapping=True, stats=stats) as warnings_out, \
+            JsonStreamWriter(hints_path, indent, mapping=True, stats=stats) as hints_out:
+        for name, widget, warnings, hints in iter_widget_entries(
+            modules, default_interval, builtins, power, restart, limits
+        ):
+            widgets.add(widget)
+            widget_path = widgets_dir / f"{name}.json"
+            write_output(widget_path, json.dumps(widget, indent=indent, separators=separators), stats)
+            print(f"  Generated: {widget_path}")
+            if warnings:
+                warnings_out.add(warnings, key=name)
+            if hints:
+                hints_out.add(hints, key=name)
+
+        widgets.close()
+        print(f"  Generated widget configs: {config_path} ({widgets.count} widget(s))")
+        if warnings_out.close():
+            print(f"  Generated warnings: {warnings_path}")
+        if hints_out.close():
+            print(f"  Generated runtime hints: {hints_path}")
+
+
+def print_conversion_report(
+    modules: list[WaybarModule],
+    default_interval: int,
+    builtins: Optional[list[BuiltinModule]] = None,
+) -> None:
     """Print a report of what was converted and any warnings."""
 
     print("\n" + "=" * 60)
@@ -997,7 +4939,9 @@ def print_conversion_report(modules: list[WaybarModule], default_interval: int)
         elif module.interval_defaulted:
             warnings.append(f"  - interval: defaulted to {default_interval}s (Waybar default)")
 
-        if module.interval_mode == "once":
+        if module.event_rule:
+            warnings.append(f"  - interval: {module.interval}s poll replaced by events (rule {module.event_rule})")
+        elif module.interval_mode == "once":
             warnings.append("  - interval: once (treated as streaming in Noctalia)")
 
         if module.format != "{}" and module.format != "{text}":
@@ -1015,6 +4959,14 @@ def print_conversion_report(modules: list[WaybarModule], default_interval: int)
         if module.restart_interval:
             warnings.append(f"  - restart-interval: {module.restart_interval} (plugins only)")
 
+        if module.shared_role == "consumer":
+            warnings.append(f"  - exec: shares the runner of custom/{module.shared_source}")
+
+        if module.probe:
+            warnings.extend(f"  - probe: {note}" for note in module.probe.notes)
+
+        file_read = transform_command(module).file_read
+
         if warnings:
             print("  Warnings:")
             for w in warnings:
@@ -1025,10 +4977,44 @@ def print_conversion_report(modules: list[WaybarModule], default_interval: int)
         print("  Converted:")
         if module.exec_cmd:
             print(f"    exec: {module.exec_cmd[:50]}{'...' if len(module.exec_cmd) > 50 else ''}")
+            if file_read:
+                runner = f"in-process file read of {file_read.path} (plugins)"
+            elif split_simple_command(module.exec_cmd) and not module.exec_if:
+                runner = "argv"
+            else:
+                runner = "shell"
+            print(f"    runs via: {runner}")
+            if module.shared_consumers:
+                print(f"    shared with: {', '.join(module.shared_consumers)}")
         if module.interval_mode == "poll":
             print(f"    interval: {module.interval}s -> {module.interval * 1000}ms")
+            if module.timeout_ms:
+                print(f"    timeout: {module.timeout_ms}ms")
+        elif module.event_rule:
+            polled = module.polled_exec
+            print(f"    mode: event-driven re-read of {polled[:40]}{'...' if len(polled) > 40 else ''}")
+            print(f"    forks avoided: ~{forks_avoided_per_hour(module)}/hour, plus one re-read per event")
+            if module.event_requires:
+                print(
+                    f"    needs: {', '.join(module.event_requires)} at runtime, "
+                    f"else polls every {module.interval}s"
+                )
         else:
             print("    mode: streaming/once")
+        if module.probe and module.probe.skipped:
+            print(f"    probe: skipped ({module.probe.skipped})")
+        elif module.probe:
+            probe = module.probe
+            print(
+                f"    probe: {probe.runs} run(s), wall {statistics.median(probe.wall_ms):.0f}ms "
+                f"(max {max(probe.wall_ms):.0f}ms), cpu {statistics.median(probe.cpu_ms):.0f}ms, "
+                f"{probe.output_bytes}B output, {probe.distinct_outputs} distinct"
+            )
+            if probe.recommended_interval is not None:
+                print(
+                    f"    recommended: interval {probe.recommended_interval}s, "
+                    f"timeout {probe.recommended_timeout_ms}ms"
+                )
         if module.on_click:
             print("    on-click -> leftClickExec")
         if module.on_click_right:
@@ -1036,6 +5022,27 @@ def print_conversion_report(modules: list[WaybarModule], default_interval: int)
         if module.on_scroll_up or module.on_scroll_down:
             print("    scroll handlers -> wheelUpExec/wheelDownExec")
 
+    rewritten = [module for module in modules if module.event_rule]
+    if rewritten:
+        print(
+            f"\nEvent rewrites: {len(rewritten)} module(s), "
+            f"~{sum(forks_avoided_per_hour(m) for m in rewritten)} poll runs/hour eliminated"
+        )
+
+    for builtin in builtins or []:
+        print(f"\n[{builtin.kind}] {builtin.name} ({builtin.source})")
+        _, warnings = build_builtin_settings(builtin)
+        if warnings:
+            print("  Warnings:")
+            for w in warnings:
+                print(f"  - {w}")
+        print("  Converted:")
+        print(f"    widgets: native {BUILTIN_NATIVE_WIDGETS[builtin.kind]['type']} widget")
+        cadence = "event-driven" if builtin.kind == "pulseaudio" else f"every {builtin.interval}s"
+        print(f"    plugins: in-process sampling ({cadence}, 0 processes per update)")
+        if builtin.states:
+            print(f"    states: {', '.join(f'{k}={v}' for k, v in builtin.states.items())}")
+
 
 def find_waybar_config() -> Optional[Path]:
     """Find the default Waybar config file."""
@@ -1052,7 +5059,88 @@ def find_waybar_config() -> Optional[Path]:
     return None
 
 
-def main() -> None:
+@dataclass
+class PhaseStats:
+    """Cost of one conversion phase, accumulated over every entry into it."""
+    name: str
+    wall_ms: float = 0.0
+    cpu_ms: float = 0.0
+    peak_kib: float = 0.0
+    files_written: int = 0
+    bytes_written: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "wallMs": round(self.wall_ms, 3),
+            "cpuMs": round(self.cpu_ms, 3),
+            "peakKiB": round(self.peak_kib, 1),
+            "filesWritten": self.files_written,
+            "bytesWritten": self.bytes_written,
+        }
+
+
+class ConversionProfiler:
+    """Per-phase wall/CPU time, peak traced memory and file writes for --profile.
+
+    Each phase yields its :class:`PhaseStats`, which the generators pass to
+    :func:`write_output` and :class:`JsonStreamWriter` to count what they
+    write. With ``stats_path`` the whole run is also recorded by cProfile and
+    dumped there.
+    """
+
+    def __init__(self, stats_path: Optional[str] = None) -> None:
+        self.phases: dict[str, PhaseStats] = {}
+        self.stats_path = stats_path
+        self.profile = cProfile.Profile() if stats_path else None
+        self.started = 0.0
+        self.total_wall_ms = 0.0
+
+    def start(self) -> None:
+        tracemalloc.start()
+        self.started = time.perf_counter()
+        if self.profile:
+            self.profile.enable()
+
+    def stop(self) -> None:
+        if self.profile:
+            self.profile.disable()
+            self.profile.dump_stats(self.stats_path)
+        self.total_wall_ms = (time.perf_counter() - self.started) * 1000
+        tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name: str):
+        stats = self.phases.setdefault(name, PhaseStats(name))
+        if hasattr(tracemalloc, "reset_peak"):  # Python 3.9+; peaks are cumulative before
+            tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stats
+        finally:
+            stats.wall_ms += (time.perf_counter() - wall) * 1000
+            stats.cpu_ms += (time.process_time() - cpu) * 1000
+            stats.peak_kib = max(stats.peak_kib, (tracemalloc.get_traced_memory()[1] - base) / 1024)
+
+    def to_dict(self) -> dict:
+        return {
+            "totalWallMs": round(self.total_wall_ms, 3),
+            "phases": [stats.to_dict() for stats in self.phases.values()],
+        }
+
+    def summary(self) -> str:
+        lines = [f"{'phase':<10} {'wall ms':>9} {'cpu ms':>9} {'peak KiB':>9} {'files':>6} {'bytes':>9}"]
+        for stats in self.phases.values():
+            lines.append(
+                f"{stats.name:<10} {stats.wall_ms:>9.2f} {stats.cpu_ms:>9.2f} {stats.peak_kib:>9.1f} "
+                f"{stats.files_written:>6} {stats.bytes_written:>9}"
+            )
+        lines.append(f"{'total':<10} {self.total_wall_ms:>9.2f}  (timings include tracemalloc overhead)")
+        return "\n".join(lines)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Convert Waybar custom modules to Noctalia configurations",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -1107,6 +5195,409 @@ Examples:
         help="Polling interval (seconds) to use when a module has signal but no interval (default: 2)",
     )
 
+    parser.add_argument(
+        "--command-timeout",
+        type=float,
+        default=None,
+        help="Kill poll commands after this many seconds (default: one interval, 0 disables)",
+    )
+
+    parser.add_argument(
+        "--probe",
+        action="store_true",
+        help="EXECUTES every poll command in the config (and its exec-if) a few times to "
+        "measure its cost and recommend intervals/timeouts; only use it on configs you trust. "
+        "Runs are sandboxed (see --probe-sandbox). Results go to the report, manifests and widget hints",
+    )
+
+    parser.add_argument(
+        "--probe-apply",
+        action="store_true",
+        help="Like --probe, but also raise intervals and set timeouts to the recommendations",
+    )
+
+    parser.add_argument(
+        "--probe-runs",
+        type=int,
+        default=PROBE_RUNS,
+        help=f"Runs per command when probing (default: {PROBE_RUNS})",
+    )
+
+    parser.add_argument(
+        "--probe-timeout",
+        type=float,
+        default=PROBE_TIMEOUT_S,
+        help=f"Kill a probe run after this many seconds (default: {PROBE_TIMEOUT_S:g})",
+    )
+
+    parser.add_argument(
+        "--probe-sandbox",
+        choices=PROBE_SANDBOXES,
+        default="auto",
+        help="Isolation for probe runs: bwrap (read-only filesystem, no network), env (cleared "
+        "environment, empty read-only HOME; network and files stay reachable) or none. "
+        "auto uses bwrap when installed, else env (default: auto)",
+    )
+
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write widget JSON files without indentation",
+    )
+
+    parser.add_argument(
+        "--skip-builtins",
+        action="store_true",
+        help="Only convert custom/* modules, not cpu/memory/battery/clock/network/pulseaudio",
+    )
+
+    parser.add_argument(
+        "--shell-mode",
+        choices=["spawn", "coprocess"],
+        default="spawn",
+        help="Plugin runtime for commands that need a shell: fork sh per run, "
+        "or reuse one long-lived sh coprocess (default: spawn)",
+    )
+
+    parser.add_argument(
+        "--shared-runtime",
+        action="store_true",
+        help="Emit one shared runner/pill/settings component package that every "
+        "generated plugin references instead of a full QML copy per module",
+    )
+
+    parser.add_argument(
+        "--login-shell",
+        action="store_true",
+        help="Run plugin commands that need a shell as a login shell (sh -lc)",
+    )
+
+    parser.add_argument(
+        "--idle-pause",
+        type=int,
+        default=DEFAULT_IDLE_PAUSE_S,
+        metavar="SECONDS",
+        help="Plugins pause polling after this much user inactivity, as well as "
+        f"whenever no bar widget is visible; 0 disables the idle check (default: {DEFAULT_IDLE_PAUSE_S})",
+    )
+
+    parser.add_argument(
+        "--hyprland-provider",
+        action="store_true",
+        help="Serve polled hyprctl reads (activewindow, workspaces, submap, ...) from one shared "
+        "Hyprland connection refreshed on events, instead of per-module polling (plugins mode)",
+    )
+
+    parser.add_argument(
+        "--patch-stream",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help='Let this streaming JSON module send {"$patch": true, ...} lines with only the changed '
+        "fields; may be repeated",
+    )
+
+    parser.add_argument(
+        "--alert-module",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="Keep polling this custom module even while hidden or idle "
+        "(e.g. a low-battery notifier); may be repeated",
+    )
+
+    parser.add_argument(
+        "--spawn-budget",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Let at most N plugin poll commands run at once bar-wide; the rest queue "
+        "by priority (fast and clickable modules first). Needs the waybar-runtime "
+        "folder next to the plugins (default: 0, unlimited)",
+    )
+
+    parser.add_argument(
+        "--nice-background",
+        action="store_true",
+        help="Run slow background poll commands (interval over 60s, no click refresh) "
+        "under nice -n 10 and ionice -c 3",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print per-phase wall/CPU time, peak memory and file writes of the conversion",
+    )
+
+    parser.add_argument(
+        "--profile-json",
+        metavar="FILE",
+        help="Write the --profile measurements as JSON (implies --profile)",
+    )
+
+    parser.add_argument(
+        "--profile-stats",
+        metavar="FILE",
+        help="Also dump cProfile stats for the whole run, for pstats/snakeviz (implies --profile)",
+    )
+
+    parser.add_argument(
+        "--poll-to-event",
+        action="store_true",
+        help="Rewrite polled commands that have a native event stream (playerctl, "
+        "pactl/pamixer/wpctl, nmcli, hyprctl) to re-run only when an event arrives",
+    )
+
+    parser.add_argument(
+        "--event-rules",
+        metavar="FILE",
+        help="JSON list of extra rewrite rules ({name, match, events, filter, requires}), "
+        "tried before the built-in ones; implies --poll-to-event",
+    )
+
+    parser.add_argument(
+        "--max-update-rate",
+        type=int,
+        default=DEFAULT_MAX_UPDATE_RATE,
+        metavar="HZ",
+        help="Apply at most this many streamed lines per second, keeping the newest "
+        f"line of each window; 0 applies every line (default: {DEFAULT_MAX_UPDATE_RATE})",
+    )
+
+    parser.add_argument(
+        "--max-output-bytes",
+        type=int,
+        default=OutputLimits.stdout_bytes,
+        metavar="BYTES",
+        help="Keep at most this much of a command's output per run (per line when streaming); "
+        f"the rest is read and dropped. 0 disables the cap (default: {OutputLimits.stdout_bytes})",
+    )
+
+    parser.add_argument(
+        "--max-stderr-bytes",
+        type=int,
+        default=OutputLimits.stderr_bytes,
+        metavar="BYTES",
+        help=f"Plugins log at most this much stderr per {STDERR_LOG_WINDOW_MS // 1000}s window and count "
+        f"the rest; 0 disables the byte cap (default: {OutputLimits.stderr_bytes})",
+    )
+
+    parser.add_argument(
+        "--max-tooltip-chars",
+        type=int,
+        default=OutputLimits.tooltip_chars,
+        metavar="CHARS",
+        help=f"Cut longer tooltips; 0 disables the cap (default: {OutputLimits.tooltip_chars})",
+    )
+
+    parser.add_argument(
+        "--restart-backoff-max",
+        type=float,
+        default=RestartPolicy.max_delay_ms / 1000,
+        metavar="SECONDS",
+        help="Cap for the doubling restart delay of streaming modules with restart-interval "
+        f"(default: {RestartPolicy.max_delay_ms // 1000})",
+    )
+
+    parser.add_argument(
+        "--restart-healthy",
+        type=float,
+        default=RestartPolicy.healthy_ms / 1000,
+        metavar="SECONDS",
+        help="A stream running this long counts as healthy and resets the backoff "
+        f"(default: {RestartPolicy.healthy_ms // 1000})",
+    )
+
+    parser.add_argument(
+        "--restart-max-failures",
+        type=int,
+        default=RestartPolicy.max_failures,
+        metavar="N",
+        help="Stop restarting after N quick exits in a row until clicked or saved; "
+        f"0 retries forever (default: {RestartPolicy.max_failures})",
+    )
+
+    parser.add_argument(
+        "--battery-scale",
+        type=float,
+        default=PowerPolicy.battery_scale,
+        metavar="FACTOR",
+        help="Multiply plugin poll intervals by this while on battery; 1 disables "
+        f"(default: {PowerPolicy.battery_scale:g})",
+    )
+
+    parser.add_argument(
+        "--low-battery-scale",
+        type=float,
+        default=PowerPolicy.low_battery_scale,
+        metavar="FACTOR",
+        help="Interval multiplier at or below --low-battery-percent "
+        f"(default: {PowerPolicy.low_battery_scale:g})",
+    )
+
+    parser.add_argument(
+        "--low-battery-percent",
+        type=int,
+        default=PowerPolicy.low_battery_percent,
+        metavar="PERCENT",
+        help=f"Charge level that counts as low battery (default: {PowerPolicy.low_battery_percent})",
+    )
+
+    return parser
+
+
+def convert_config(
+    config: object,
+    output_dir: Path,
+    args: argparse.Namespace,
+    profiler: Optional[ConversionProfiler] = None,
+) -> tuple[list[WaybarModule], list[BuiltinModule]]:
+    """Extract modules from a parsed config and generate the requested output.
+
+    Each command is transformed once, in the ``transform`` phase; the
+    generators reuse those results through :func:`transform_cache`.
+    """
+    with transform_cache():
+        return _convert_config(config, output_dir, args, profiler)
+
+
+def _convert_config(
+    config: object,
+    output_dir: Path,
+    args: argparse.Namespace,
+    profiler: Optional[ConversionProfiler],
+) -> tuple[list[WaybarModule], list[BuiltinModule]]:
+    def phase(name: str):
+        return profiler.phase(name) if profiler else nullcontext()
+
+    with phase("extract"):
+        modules = extract_custom_modules(
+            config, args.default_interval, args.signal_poll_interval, args.command_timeout
+        )
+
+        builtins = [] if args.skip_builtins else extract_builtin_modules(config)
+        if builtins:
+            dedupe_modules([*modules, *builtins])
+
+        if not modules and not builtins:
+            return modules, builtins
+
+        alert_names = set(args.alert_module)
+        for module in modules:
+            if module.name in alert_names:
+                module.always_poll = True
+                alert_names.discard(module.name)
+        for name in sorted(alert_names):
+            print(f"Warning: --alert-module {name} does not match any custom module", file=sys.stderr)
+
+        patch_names = set(args.patch_stream)
+        for module in modules:
+            if module.name not in patch_names:
+                continue
+            patch_names.discard(module.name)
+            if module.interval_mode != "once" or module.return_type != "json":
+                print(
+                    f"Warning: --patch-stream {module.name} needs a streaming (interval \"once\") "
+                    "module with return-type json; ignored",
+                    file=sys.stderr,
+                )
+                continue
+            module.patch_stream = True
+        for name in sorted(patch_names):
+            print(f"Warning: --patch-stream {name} does not match any custom module", file=sys.stderr)
+
+        if args.hyprland_provider and args.mode in ["plugins", "both"]:
+            routed = [m for m in route_hyprctl_modules(modules) if m.hyprland]
+            if routed:
+                print(
+                    f"Routed {len(routed)} hyprctl module(s) to the shared Hyprland provider: "
+                    f"{', '.join(m.name for m in routed)}"
+                )
+
+        if args.poll_to_event or args.event_rules:
+            rules = [*load_event_rules(Path(args.event_rules)), *DEFAULT_EVENT_RULES] if args.event_rules else DEFAULT_EVENT_RULES
+            rewritten = [m for m in rewrite_polls_to_events(modules, rules) if m.event_rule]
+            if rewritten:
+                avoided = sum(forks_avoided_per_hour(m) for m in rewritten)
+                print(
+                    f"Rewrote {len(rewritten)} polled module(s) to event streams "
+                    f"(~{avoided} fewer command runs per hour): {', '.join(m.name for m in rewritten)}"
+                )
+
+    if args.probe or args.probe_apply:
+        print(f"Probing {len(modules)} command(s) ({args.probe_runs} run(s) each)...")
+        with phase("probe"):
+            probe_modules(
+                modules,
+                args.probe_runs,
+                args.probe_timeout,
+                apply=args.probe_apply,
+                keep_timeouts=args.command_timeout is not None,
+                sandbox=args.probe_sandbox,
+            )
+
+    power = PowerPolicy(args.battery_scale, args.low_battery_scale, args.low_battery_percent)
+    restart = RestartPolicy(
+        round(args.restart_backoff_max * 1000), round(args.restart_healthy * 1000), args.restart_max_failures
+    )
+    limits = OutputLimits(args.max_output_bytes, args.max_stderr_bytes, args.max_tooltip_chars)
+
+    with phase("transform"):
+        # Widgets wrap commands with the output limits; plugins and the
+        # report only look for file reads.
+        for module in modules:
+            if args.mode in ["widgets", "both"]:
+                transform_command(module, limits)
+            if args.mode in ["plugins", "both"] or args.verbose:
+                transform_command(module)
+
+    if modules:
+        print(f"Found {len(modules)} custom module(s): {', '.join(m.name for m in modules)}")
+    if builtins:
+        print(f"Found {len(builtins)} built-in module(s): {', '.join(m.name for m in builtins)}")
+
+    if args.mode in ["widgets", "both"]:
+        print("\nGenerating CustomButton widget configurations...")
+        with phase("widgets") as stats:
+            generate_widget_configs(
+                modules, output_dir, args.default_interval, builtins,
+                compact=args.compact, power=power, restart=restart, limits=limits, stats=stats,
+            )
+
+    if args.mode in ["plugins", "both"]:
+        print("\nGenerating plugin scaffolds...")
+        with phase("plugins") as stats:
+            if (args.shared_runtime or args.spawn_budget > 0 or power.active or any(m.hyprland for m in modules)) and modules:
+                generate_shared_runtime(output_dir, stats)
+            for module in modules:
+                generate_plugin_scaffold(
+                    module,
+                    output_dir,
+                    args.default_interval,
+                    login_shell=args.login_shell,
+                    shell_mode=args.shell_mode,
+                    shared_runtime=args.shared_runtime,
+                    idle_pause=args.idle_pause,
+                    power=power,
+                    max_update_rate=args.max_update_rate,
+                    restart=restart,
+                    spawn_budget=args.spawn_budget,
+                    nice_background=args.nice_background,
+                    limits=limits,
+                    stats=stats,
+                )
+            for builtin in builtins:
+                generate_builtin_plugin(builtin, output_dir, stats)
+
+    if args.verbose:
+        print_conversion_report(modules, args.default_interval, builtins)
+
+    return modules, builtins
+
+
+def main() -> None:
+
+    parser = build_arg_parser()
     args = parser.parse_args()
 
     if args.config_path:
@@ -1124,30 +5615,34 @@ Examples:
 
     print(f"Reading Waybar config: {config_path}")
 
-    config = parse_waybar_config(config_path)
-    modules = extract_custom_modules(
-        config, args.default_interval, args.signal_poll_interval
-    )
-
-    if not modules:
-        print("No custom modules found in Waybar config.")
-        sys.exit(0)
-
-    print(f"Found {len(modules)} custom module(s): {', '.join(m.name for m in modules)}")
+    profiler = None
+    if args.profile or args.profile_json or args.profile_stats:
+        profiler = ConversionProfiler(args.profile_stats)
+        profiler.start()
 
+    with profiler.phase("parse") if profiler else nullcontext():
+        config = parse_waybar_config(config_path)
     output_dir = Path(args.output_dir)
+    try:
+        modules, builtins = convert_config(config, output_dir, args, profiler)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
-    if args.mode in ["widgets", "both"]:
-        print("\nGenerating CustomButton widget configurations...")
-        generate_widget_configs(modules, output_dir, args.default_interval)
-
-    if args.mode in ["plugins", "both"]:
-        print("\nGenerating plugin scaffolds...")
-        for module in modules:
-            generate_plugin_scaffold(module, output_dir, args.default_interval)
-
-    if args.verbose:
-        print_conversion_report(modules, args.default_interval)
+    if profiler:
+        profiler.stop()
+        print("\nProfile:")
+        print(profiler.summary())
+        if args.profile_stats:
+            print(f"cProfile stats: {args.profile_stats}")
+        if args.profile_json:
+            with open(args.profile_json, "w", encoding="utf-8") as f:
+                json.dump(profiler.to_dict(), f, indent=2)
+            print(f"Profile JSON: {args.profile_json}")
+
+    if not modules and not builtins:
+        print("No custom modules found in Waybar config.")
+        sys.exit(0)
 
     print("\n" + "=" * 60)
     print("CONVERSION COMPLETE")
@@ -1162,6 +5657,9 @@ Examples:
     if args.mode in ["plugins", "both"]:
         print("\nTo use generated plugins:")
         print("  1. Copy plugin folders to ~/.config/noctalia/plugins/")
+        power = PowerPolicy(args.battery_scale, args.low_battery_scale)
+        if args.shared_runtime or args.spawn_budget > 0 or power.active or any(m.hyprland for m in modules):
+            print(f"     (including {RUNTIME_PLUGIN_DIR}/, which the plugins import)")
         print("  2. Enable them in Noctalia settings")
         print("  3. Add the bar widget to your bar configuration")
 